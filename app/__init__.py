@@ -13,5 +13,10 @@ scheduler = init_scheduler(app)
 
 from app import routes, models
 
+from .schema import upgrade_schema
+
 with app.app_context():
-    db.create_all()
\ No newline at end of file
+    # create_all() only creates missing tables, columns added to existing
+    # tables are added by upgrade_schema()
+    db.create_all()
+    upgrade_schema(db.engine)
\ No newline at end of file
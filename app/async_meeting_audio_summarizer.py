@@ -0,0 +1,386 @@
+import asyncio
+from functools import partial
+import logging
+from pathlib import Path
+from typing import Union
+
+import anthropic
+import assemblyai as aai
+
+from .models import Meetings
+from config import Config
+from .meeting_audio_summarizer import (
+    DEBUG_RUN,
+    PIPELINE_STAGES,
+    MeetingAudioSummarizer,
+    ParticipantInfo,
+    TranscriptionPending,
+)
+from .tools.audio import file_sha256
+from .tools.google_drive import export_to_google_drive
+from .tools.stage_graph import Stage, StageGraph
+from .tools.transcript import Transcript
+from .tools.workspace import scratch_workspace
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class AsyncMeetingAudioSummarizer(MeetingAudioSummarizer):
+    """
+    Runs the same pipeline as MeetingAudioSummarizer on an event loop, so
+    that one loop can drive many meetings at the same time. LLM calls use
+    AsyncAnthropic, transcription is submitted and then polled, and the
+    remaining blocking calls (audio preparation, uploads, Google Drive, the
+    database and the voice embeddings) run in the loop's executor.
+
+    Stages without an async implementation (_astage_<name>) fall back to the
+    synchronous _stage_<name> in the executor.
+    """
+
+    def __init__(
+        self,
+        db,
+        anthropic_api_key: str = Config.ANTHROPIC_API_KEY,
+        debug_run: bool = DEBUG_RUN,
+        model_routing: str = Config.MODEL_ROUTING,
+    ):
+        super().__init__(db, anthropic_api_key, debug_run, model_routing)
+
+        self._async_anthropic_client = anthropic.AsyncAnthropic(
+            api_key=anthropic_api_key
+        )
+
+    async def asummarize_meeting(
+        self,
+        meeting: type[Meetings],
+        from_stage: str = None,
+        lease=None
+    ) -> str:
+        self._lease = lease
+        records = {"meeting": meeting}
+        graph = self._async_stage_graph()
+
+        # The database work and the voice embeddings run in threads, so the
+        # loop keeps driving the other meetings. asyncio.to_thread, unlike
+        # run_in_executor, carries the app context and with it the session
+        # of this task over; the task waits, so the session is never used
+        # by two threads at once.
+        context = await asyncio.to_thread(self._initial_context, meeting)
+        context.update(await asyncio.to_thread(
+            self._resume_context,
+            graph,
+            meeting,
+            records,
+            from_stage
+        ))
+        self._refresh_stages = self._stages_to_refresh(graph, from_stage)
+        await asyncio.to_thread(
+            self._check_pending_transcription,
+            meeting,
+            context
+        )
+
+        with scratch_workspace(f"meeting_{meeting.meeting_id}_") as workspace:
+            context["workspace"] = workspace
+            try:
+                context = await graph.run_async(
+                    context,
+                    max_concurrency=Config.PIPELINE_MAX_WORKERS,
+                    on_stage_done=lambda name, outputs: asyncio.to_thread(
+                        self._complete_stage, name, outputs, records
+                    ),
+                    targets=("doc_url",)
+                )
+            except TranscriptionPending as pending:
+                await asyncio.to_thread(
+                    self._record_transcription_request,
+                    meeting,
+                    pending
+                )
+                raise
+
+        return context["doc_url"]
+
+    def _async_stage_graph(self) -> StageGraph:
+        return StageGraph([
+            Stage(
+                name,
+                getattr(self, f"_astage_{name}", None)
+                or getattr(self, f"_stage_{name}"),
+                inputs=inputs,
+                outputs=outputs
+            )
+            for name, inputs, outputs in PIPELINE_STAGES
+        ])
+
+    async def _astage_transcribe(
+        self,
+        audio_file_path,
+        audio_sha256,
+        participants,
+        workspace
+    ):
+        logger.info("Transcribing audio")
+        transcript = Transcript.from_utterances(await self._atranscribe_audio(
+            audio_file_path,
+            participants,
+            workspace,
+            audio_sha256
+        ))
+        return transcript.render(), transcript, self._uses_preamble()
+
+    async def _astage_infer_language(self, transcript):
+        language = self._detect_language(transcript)
+        if language is not None:
+            return language
+        return self._normalized_language(await self._acall_claude_agent(
+            **self._infer_language_request(transcript)
+        ))
+
+    async def _astage_infer_agenda(self, transcript, topic):
+        logger.info("Inferring agenda")
+        return await self._acall_claude_agent(
+            **self._infer_agenda_request(transcript, topic)
+        )
+
+    async def _astage_create_meeting_protocol(
+        self,
+        transcript,
+        utterances,
+        speaker_mapping,
+        agenda,
+        date,
+        unknown_speakers
+    ):
+        logger.info("Creating meeting protocol")
+        request = self._create_meeting_protocol_request(
+            transcript,
+            agenda,
+            date,
+            unknown_speakers
+        )
+        segments = self._protocol_segments(
+            transcript,
+            utterances.relabel(speaker_mapping),
+            request
+        )
+        if segments is None:
+            return await self._acall_claude_agent(**request)
+
+        semaphore = asyncio.Semaphore(Config.SUMMARY_MAX_PARALLEL_SEGMENTS)
+
+        async def summarize(index, segment):
+            async with semaphore:
+                return await self._acall_claude_agent(
+                    **self._summarize_segment_request(
+                        segment,
+                        index,
+                        len(segments),
+                        agenda
+                    )
+                )
+
+        notes = await asyncio.gather(
+            *(summarize(i, segment) for i, segment in enumerate(segments))
+        )
+        return await self._acall_claude_agent(
+            **self._reduce_segment_notes_request(
+                notes,
+                agenda,
+                date,
+                unknown_speakers
+            )
+        )
+
+    async def _astage_create_filename(self, protocol, date):
+        return await self._acall_claude_agent(
+            **self._create_filename_request(protocol, date)
+        )
+
+    async def _astage_ensure_language(self, protocol, language):
+        return await self._acall_claude_agent(
+            **self._ensure_language_request(protocol, language)
+        )
+
+    async def _astage_ensure_markdown(self, translated_protocol):
+        return await self._acall_claude_agent(
+            **self._ensure_markdown_request(translated_protocol)
+        )
+
+    async def _astage_export(
+        self,
+        filename,
+        markdown_protocol,
+        participants,
+        workspace
+    ):
+        self._check_lease()
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(
+                export_to_google_drive,
+                filename,
+                markdown_protocol,
+                participants,
+                workspace=workspace
+            )
+        )
+
+    async def _atranscribe_audio(
+        self,
+        input_file_path: Union[str, Path],
+        participants: list[ParticipantInfo],
+        workspace: Path,
+        audio_sha256: str = None
+    ) -> list[dict]:
+        loop = asyncio.get_running_loop()
+
+        if audio_sha256 is None:
+            audio_sha256 = await loop.run_in_executor(
+                None,
+                file_sha256,
+                input_file_path
+            )
+        cache_key = await loop.run_in_executor(
+            None,
+            self._transcript_cache_key,
+            audio_sha256,
+            participants
+        )
+        # A transcription rerun on request replaces the cached transcript
+        if cache_key and "transcribe" not in self._refresh_stages:
+            utterances = await loop.run_in_executor(
+                None,
+                self._transcript_cache.get,
+                cache_key
+            )
+            if utterances is not None:
+                logger.info("Using cached transcript of the same recording")
+                return utterances
+
+        upload_file_path, time_map = await loop.run_in_executor(
+            None,
+            self._prepare_audio,
+            input_file_path,
+            participants,
+            workspace
+        )
+
+        # Only upload and queue the transcript
+        transcript = await loop.run_in_executor(
+            None,
+            partial(
+                self._transcriber.submit,
+                data=upload_file_path,
+                config=self._transcription_config(participants)
+            )
+        )
+        if Config.TRANSCRIPTION_COMPLETION != "inline":
+            raise TranscriptionPending(
+                transcript.id,
+                self._submission(cache_key, audio_sha256, time_map)
+            )
+
+        # Poll without blocking the event loop
+        while transcript.status not in (
+            aai.TranscriptStatus.completed,
+            aai.TranscriptStatus.error
+        ):
+            await asyncio.sleep(Config.ASSEMBLYAI_POLL_SECONDS)
+            transcript = await loop.run_in_executor(
+                None,
+                aai.Transcript.get_by_id,
+                transcript.id
+            )
+
+        if transcript.status == aai.TranscriptStatus.error:
+            raise RuntimeError(f"Transcription failed: {transcript.error}")
+
+        utterances = self._utterances(transcript, time_map)
+        if cache_key:
+            await loop.run_in_executor(
+                None,
+                self._transcript_cache.put,
+                cache_key,
+                audio_sha256,
+                utterances
+            )
+
+        return utterances
+
+    async def _acall_claude_agent(
+        self,
+        message_prompt: str,
+        system_prompt: str,
+        stage: str = None
+    ) -> str:
+        self._check_lease()
+        loop = asyncio.get_running_loop()
+        request = self._message_request(message_prompt, system_prompt, stage)
+
+        # Cache, rate limiter and usage records are in the database
+        cache_key = self._cache_key(request)
+        cached_result = await loop.run_in_executor(
+            None,
+            self._cached_response,
+            cache_key,
+            stage
+        )
+        if cached_result is not None:
+            return cached_result
+
+        plan = self._token_planner.plan(
+            stage,
+            await self._acount_input_tokens(request),
+            self._model_route(stage).get("max_output_tokens")
+        )
+        while True:
+            request["max_tokens"] = plan.max_tokens
+            for attempt in range(Config.ANTHROPIC_MAX_RATE_LIMIT_RETRIES + 1):
+                await self._rate_limiter.acquire_async(
+                    plan.input_tokens, plan.max_tokens
+                )
+                try:
+                    response = await self._async_anthropic_client.messages.with_raw_response.create(
+                        **request
+                    )
+                except anthropic.RateLimitError as e:
+                    await loop.run_in_executor(
+                        None,
+                        self._handle_rate_limit_error,
+                        e, plan.input_tokens, plan.max_tokens, attempt
+                    )
+                    continue
+                break
+
+            result, plan = await loop.run_in_executor(
+                None,
+                self._settle_response,
+                response, plan, request["model"]
+            )
+            if result is not None:
+                break
+
+        if cache_key:
+            await loop.run_in_executor(
+                None,
+                self._response_cache.put,
+                cache_key, result, request["model"]
+            )
+
+        return result
+
+    async def _acount_input_tokens(
+        self,
+        request: dict
+    ) -> int:
+        if Config.TOKEN_COUNTING == "api":
+            counted = await self._async_anthropic_client.messages.count_tokens(
+                model=request["model"],
+                system=request["system"],
+                messages=request["messages"]
+            )
+            return counted.input_tokens
+        return self._estimate_input_tokens(request)
@@ -0,0 +1,343 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import logging
+import threading
+import time
+
+from sqlalchemy import and_, func, or_, select, update
+
+from app import app, db
+from .models import MeetingJobs, Meetings
+from config import Config
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class LeaseLost(Exception):
+    """Another worker took the job over, its results must not be kept."""
+
+    def __init__(self, job_id: int, worker_id: str):
+        super().__init__(
+            f"Worker {worker_id} lost the lease of job {job_id}"
+        )
+        self.job_id = job_id
+        self.worker_id = worker_id
+
+
+class JobLease:
+    """
+    A worker's lease on a claimed job, handed to the pipeline. The worker's
+    heartbeat calls lose() when another worker has taken the job over, and
+    the pipeline stops at its next LLM call or stage instead of competing
+    with the new owner.
+
+    Args:
+        job_id (int): The job
+        worker_id (str): The worker that claimed it
+    """
+
+    def __init__(self, job_id: int, worker_id: str):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._lost = threading.Event()
+
+    def lose(self) -> None:
+        self._lost.set()
+
+    def check(self, verify: bool = False) -> None:
+        """
+        Raises LeaseLost if the lease was lost. With verify, the database is
+        asked as well, e.g. before results are written.
+        """
+        if (
+            verify
+            and not self._lost.is_set()
+            and not owns_job(self.job_id, self.worker_id)
+        ):
+            self._lost.set()
+        if self._lost.is_set():
+            raise LeaseLost(self.job_id, self.worker_id)
+
+
+def estimate_cost_seconds(meeting: Meetings) -> float:
+    """Estimated processing time of a meeting, 0 if its duration is unknown."""
+    return (meeting.audio_duration_seconds or 0) * Config.JOB_COST_PER_AUDIO_SECOND
+
+
+def enqueue_meeting(
+    meeting_id: int,
+    from_stage: str = None,
+    estimated_cost_seconds: float = 0
+) -> MeetingJobs:
+    """Adds a meeting to the job queue. The caller commits the session."""
+    job = MeetingJobs(
+        meeting_id=meeting_id,
+        status="queued",
+        from_stage=from_stage,
+        priority=time.time() + estimated_cost_seconds
+    )
+    db.session.add(job)
+    return job
+
+
+def _claimable(now: datetime):
+    # Queued jobs and running jobs whose worker stopped sending heartbeats,
+    # e.g. because it was killed or its container restarted
+    return or_(
+        MeetingJobs.status == "queued",
+        and_(
+            MeetingJobs.status == "running",
+            MeetingJobs.lease_expires_at < now,
+            MeetingJobs.attempts < Config.JOB_MAX_ATTEMPTS
+        )
+    )
+
+
+def claim_jobs(
+    worker_id: str,
+    limit: int
+) -> list[MeetingJobs]:
+    """
+    Claims up to limit jobs for the given worker and gives it a lease on
+    them.
+
+    On PostgreSQL the candidates are selected with FOR UPDATE SKIP LOCKED, so
+    concurrent workers never wait for each other and never claim the same
+    job. SQLite has no row locks, there the conditional UPDATE below (which
+    SQLite serializes) decides which worker gets a job.
+    """
+    if limit <= 0:
+        return []
+
+    now = datetime.now()
+    query = MeetingJobs.query.filter(
+        _claimable(now)
+    ).order_by(
+        func.coalesce(MeetingJobs.priority, 0),
+        MeetingJobs.job_id
+    ).limit(limit)
+    if db.engine.dialect.name != "sqlite":
+        query = query.with_for_update(skip_locked=True)
+
+    claimed_ids = []
+    for job in query.all():
+        if job.status == "running":
+            logger.warning(
+                f"Reclaiming job {job.job_id} of meeting {job.meeting_id}, "
+                f"lease of worker {job.worker_id} expired"
+            )
+        result = db.session.execute(
+            update(MeetingJobs)
+            .where(MeetingJobs.job_id == job.job_id, _claimable(now))
+            .values(
+                status="running",
+                worker_id=worker_id,
+                attempts=MeetingJobs.attempts + 1,
+                started_at=now,
+                heartbeat_at=now,
+                lease_expires_at=now + timedelta(
+                    seconds=Config.JOB_LEASE_SECONDS
+                )
+            )
+        )
+        if result.rowcount == 1:
+            claimed_ids.append(job.job_id)
+    db.session.commit()
+
+    if claimed_ids:
+        logger.info(f"Worker {worker_id} claimed jobs {claimed_ids}")
+    return MeetingJobs.query.filter(
+        MeetingJobs.job_id.in_(claimed_ids)
+    ).all() if claimed_ids else []
+
+
+def renew_leases(
+    worker_id: str,
+    job_ids: list[int]
+) -> list[int]:
+    """
+    Heartbeat: extends the leases of the given jobs if they still belong to
+    the worker.
+
+    Returns:
+        list[int]: The ids of the jobs the worker has lost to another worker
+    """
+    if not job_ids:
+        return []
+
+    now = datetime.now()
+    db.session.execute(
+        update(MeetingJobs)
+        .where(
+            MeetingJobs.job_id.in_(job_ids),
+            MeetingJobs.worker_id == worker_id,
+            MeetingJobs.status == "running"
+        )
+        .values(
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+        )
+    )
+    db.session.commit()
+
+    owned = {
+        job_id for (job_id,) in db.session.query(MeetingJobs.job_id).filter(
+            MeetingJobs.job_id.in_(job_ids),
+            MeetingJobs.worker_id == worker_id
+        )
+    }
+    return [job_id for job_id in job_ids if job_id not in owned]
+
+
+def owns_job(
+    job_id: int,
+    worker_id: str
+) -> bool:
+    """Whether the job is still running under the worker's lease."""
+    # Own connection, the pipeline's session may have pending changes
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(MeetingJobs.job_id).where(
+                MeetingJobs.job_id == job_id,
+                MeetingJobs.worker_id == worker_id,
+                MeetingJobs.status == "running"
+            )
+        ).first() is not None
+
+
+def fail_exhausted_jobs() -> None:
+    """Gives up on jobs whose lease expired JOB_MAX_ATTEMPTS times."""
+    now = datetime.now()
+    jobs = MeetingJobs.query.filter(
+        MeetingJobs.status == "running",
+        MeetingJobs.lease_expires_at < now,
+        MeetingJobs.attempts >= Config.JOB_MAX_ATTEMPTS
+    ).all()
+    for job in jobs:
+        logger.error(
+            f"Job {job.job_id} of meeting {job.meeting_id} lost its lease "
+            f"{job.attempts} times, giving up"
+        )
+        job.status = "failed"
+        job.error = "lease expired too often"
+        job.finished_at = now
+        meeting = Meetings.query.get(job.meeting_id)
+        if meeting:
+            meeting.status = "failed"
+    if jobs:
+        db.session.commit()
+
+
+def finish_job(
+    job_id: int,
+    worker_id: str,
+    succeeded: bool,
+    error: str = None
+) -> None:
+    # Only the owner of the lease finishes the job
+    result = db.session.execute(
+        update(MeetingJobs)
+        .where(
+            MeetingJobs.job_id == job_id,
+            MeetingJobs.worker_id == worker_id,
+            MeetingJobs.status == "running"
+        )
+        .values(
+            status="done" if succeeded else "failed",
+            error=error,
+            finished_at=datetime.now(),
+            lease_expires_at=None
+        )
+    )
+    db.session.commit()
+    if result.rowcount == 0:
+        logger.warning(
+            f"Job {job_id} is no longer leased to worker {worker_id}, "
+            f"ignoring its result"
+        )
+
+
+# Meetings this process is summarizing or recording live, whose
+# Meetings.heartbeat_at is renewed by _renew_meeting_heartbeats(). With
+# JOB_BACKEND = "scheduler" there are no jobs with leases, the heartbeat is
+# what tells a meeting whose process died from one that is still running.
+_running_meetings = set()
+_running_meetings_lock = threading.Lock()
+_heartbeat_thread = None
+
+# Statuses of meetings a process is working on
+HEARTBEAT_STATUSES = ("processing", "live")
+
+
+def start_meeting_heartbeat(meeting_id: int) -> None:
+    global _heartbeat_thread
+    with _running_meetings_lock:
+        _running_meetings.add(meeting_id)
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(
+                target=_renew_meeting_heartbeats,
+                name="meeting_heartbeat",
+                daemon=True
+            )
+            _heartbeat_thread.start()
+
+
+def stop_meeting_heartbeat(meeting_id: int) -> None:
+    with _running_meetings_lock:
+        _running_meetings.discard(meeting_id)
+
+
+@contextmanager
+def meeting_heartbeat(meeting_id: int):
+    """Keeps the heartbeat of the meeting alive while the block runs."""
+    start_meeting_heartbeat(meeting_id)
+    try:
+        yield
+    finally:
+        stop_meeting_heartbeat(meeting_id)
+
+
+def _renew_meeting_heartbeats() -> None:
+    while True:
+        time.sleep(Config.JOB_HEARTBEAT_SECONDS)
+        with _running_meetings_lock:
+            meeting_ids = list(_running_meetings)
+        if not meeting_ids:
+            continue
+        try:
+            with app.app_context():
+                db.session.execute(
+                    update(Meetings)
+                    .where(
+                        Meetings.meeting_id.in_(meeting_ids),
+                        Meetings.status.in_(HEARTBEAT_STATUSES)
+                    )
+                    .values(
+                        heartbeat_at=datetime.now(),
+                        # A heartbeat is no change of the meeting
+                        changed_at=Meetings.changed_at
+                    )
+                )
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Error renewing meeting heartbeats: {str(e)}")
+
+
+def is_abandoned(meeting: Meetings) -> bool:
+    """
+    Whether the meeting is "processing" or "live" but its process sent no
+    heartbeat for JOB_LEASE_SECONDS, e.g. because it was killed or
+    restarted. "processing" meetings only with JOB_BACKEND = "scheduler":
+    the queue's workers take those over by their job leases.
+    """
+    if meeting.status not in HEARTBEAT_STATUSES or (
+        meeting.status == "processing" and Config.JOB_BACKEND == "queue"
+    ):
+        return False
+    # Meetings started before the heartbeat was stored
+    last_seen = meeting.heartbeat_at or meeting.changed_at
+    return last_seen is None or last_seen < datetime.now() - timedelta(
+        seconds=Config.JOB_LEASE_SECONDS
+    )
@@ -0,0 +1,191 @@
+import asyncio
+from datetime import datetime
+import logging
+from pathlib import Path
+import threading
+from typing import Optional
+
+from sqlalchemy import insert
+
+from app import db
+from .job_queue import start_meeting_heartbeat, stop_meeting_heartbeat
+from .models import LiveUtterances
+from config import Config
+from .tools.async_runner import get_async_runner
+from .tools.live_transcription import make_live_backend
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class LiveSession:
+    """
+    A meeting recorded in the browser. The audio chunks posted by the
+    browser are appended to the recording and forwarded to the real-time
+    transcription backend, which runs on the shared event loop. Every final
+    utterance is stored right away, so the protocol can be created as soon
+    as the meeting ends.
+
+    If the backend fails, the recording continues and the meeting is
+    transcribed from the recording afterwards, like an upload.
+
+    Args:
+        meeting_id (int): The meeting being recorded
+        recording_file_path (Path): Where the raw PCM is appended
+        engine: SQLAlchemy engine of the database
+        table: Table with the columns of LiveUtterances
+    """
+
+    def __init__(
+        self,
+        meeting_id: int,
+        recording_file_path: Path,
+        engine,
+        table
+    ):
+        self.meeting_id = meeting_id
+        self.recording_file_path = recording_file_path
+        self.error = None
+        self._engine = engine
+        self._table = table
+        self._backend = make_live_backend(self._store_utterance)
+        self._runner = get_async_runner()
+        self._next_sequence = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self._runner.call(self._backend.start()).result(
+            timeout=Config.LIVE_FINISH_TIMEOUT_SECONDS
+        )
+
+    def push(
+        self,
+        sequence: int,
+        chunk: bytes
+    ) -> bool:
+        """
+        Records a chunk and forwards it to the backend. The browser sends
+        the chunks one after another and repeats a chunk if its request
+        failed, so chunks are numbered and repeated ones are dropped.
+
+        Returns:
+            bool: False if the chunk was a repetition
+        """
+        with self._lock:
+            if sequence < self._next_sequence:
+                return False
+            if sequence > self._next_sequence:
+                logger.warning(
+                    f"Live meeting {self.meeting_id} lost chunks "
+                    f"{self._next_sequence} to {sequence - 1}"
+                )
+            self._next_sequence = sequence + 1
+
+            with open(self.recording_file_path, "ab") as f:
+                f.write(chunk)
+
+            if self.error is None:
+                try:
+                    self._runner.call(self._backend.send(chunk)).result(
+                        timeout=Config.LIVE_FINISH_TIMEOUT_SECONDS
+                    )
+                except Exception as e:
+                    self._fail(e)
+        return True
+
+    def finish(self) -> None:
+        """Waits for the utterances of the audio sent so far."""
+        with self._lock:
+            if self.error is not None:
+                return
+            try:
+                self._runner.call(self._backend.finish()).result(
+                    timeout=Config.LIVE_FINISH_TIMEOUT_SECONDS + 5
+                )
+            except Exception as e:
+                self._fail(e)
+
+    def _fail(self, error: Exception) -> None:
+        self.error = str(error) or type(error).__name__
+        logger.error(
+            f"Live transcription of meeting {self.meeting_id} failed, "
+            f"continuing with the recording only: {self.error}"
+        )
+
+    async def _store_utterance(self, utterance: dict) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            self._insert_utterance,
+            utterance
+        )
+
+    def _insert_utterance(self, utterance: dict) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(insert(self._table).values(
+                meeting_id=self.meeting_id,
+                speaker=utterance["speaker"],
+                text=utterance["text"],
+                start=utterance["start"],
+                end=utterance["end"],
+                created_at=datetime.now()
+            ))
+
+
+class LiveSessions:
+    """
+    The live sessions of this process. The browser has to reach the process
+    that started its session, so run a single web process (GC_WORKERS=1) or
+    route /live requests of a meeting to the same process.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(
+        self,
+        meeting_id: int,
+        recording_file_path: Path
+    ) -> LiveSession:
+        """Opens the backend session. Must be called within an app context."""
+        session = LiveSession(
+            meeting_id,
+            recording_file_path,
+            db.engine,
+            LiveUtterances.__table__
+        )
+        session.start()
+        with self._lock:
+            self._sessions[meeting_id] = session
+        # Without heartbeats, e.g. after a restart lost the session, the
+        # meeting can be retried from its recording
+        start_meeting_heartbeat(meeting_id)
+        logger.info(f"Started live session of meeting {meeting_id}")
+        return session
+
+    def get(self, meeting_id: int) -> Optional[LiveSession]:
+        with self._lock:
+            return self._sessions.get(meeting_id)
+
+    def stop(self, meeting_id: int) -> Optional[LiveSession]:
+        with self._lock:
+            session = self._sessions.pop(meeting_id, None)
+        stop_meeting_heartbeat(meeting_id)
+        if session is not None:
+            session.finish()
+            logger.info(f"Stopped live session of meeting {meeting_id}")
+        return session
+
+
+_live_sessions: Optional[LiveSessions] = None
+_live_sessions_lock = threading.Lock()
+
+
+def get_live_sessions() -> LiveSessions:
+    """The live sessions of this process."""
+    global _live_sessions
+    with _live_sessions_lock:
+        if _live_sessions is None:
+            _live_sessions = LiveSessions()
+        return _live_sessions
@@ -1,20 +1,66 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
 import json
 import logging
 import os
 from pathlib import Path
-import pickle
 import string
-import time
 from typing import Union
 
 import anthropic
 import assemblyai as aai
-from pydub import AudioSegment
 
-from .models import Meetings, Transcripts, Agendas, MeetingProtocols, Participants
+from .models import (
+    Meetings,
+    Participants,
+    Transcripts,
+    Agendas,
+    MeetingProtocols,
+    TranscriptionRequests,
+)
+from .transcription_requests import pending_request, record_submission
 from config import Config
-from .tools.prompts_etc import PROMPTS, AGENDA_EXAMPLES
+from .tools.prompts_etc import (
+    PROMPTS,
+    AGENDA_EXAMPLES,
+    NOTES_CONTEXT,
+    SEGMENT_CONTEXT,
+    TRANSCRIPT_CONTEXT,
+    TRANSCRIPT_SYSTEM_PROMPT,
+)
+from .tools.audio import (
+    TimeMap,
+    concatenate_audio,
+    duration_ms,
+    encode_recording,
+    encode_segments,
+    file_sha256,
+    get_transcription_profile,
+    speech_segments,
+)
 from .tools.google_drive import export_to_google_drive
+from .tools.language_detection import detect_language, normalize_language
+from .tools.preamble_cache import get_preamble_cache
+from .tools.rate_limiter import (
+    CHARS_PER_TOKEN,
+    estimate_tokens,
+    get_anthropic_rate_limiter,
+)
+from .tools.speaker_embeddings import (
+    embedding_from_bytes,
+    embedding_to_bytes,
+    file_embedding,
+    match_speakers,
+    speaker_segments,
+)
+from .tools.response_cache import ResponseCache, get_response_cache
+from .tools.stage_graph import Stage, StageGraph
+from .tools.token_budget import TokenPlan, get_token_budget_planner
+from .tools.transcript import Transcript
+from .tools.transcript_cache import TranscriptCache, get_transcript_cache
+from .tools.workspace import scratch_workspace
 
 
 logger = logging.getLogger(__name__)
@@ -29,7 +75,129 @@ logger.addHandler(handler)
 DEBUG_RUN = True if os.environ.get("DEBUG_RUN", False) else False
 
 aai.settings.api_key = Config.ASSEMBLYAI_API_KEY
-ANTROPIC_COOL_DOWN_SECONDS = int(Config.ANTROPIC_COOL_DOWN_SECONDS)
+if Config.ASSEMBLYAI_BASE_URL:
+    aai.settings.base_url = Config.ASSEMBLYAI_BASE_URL
+
+# Characters at the end of the transcript the language is detected from
+LANGUAGE_DETECTION_SAMPLE_CHARS = 1000
+
+# Header carrying ASSEMBLYAI_WEBHOOK_SECRET in webhook calls of AssemblyAI
+WEBHOOK_AUTH_HEADER = "X-Webhook-Secret"
+
+# Plain copy of a participant that can safely be handed to stage threads,
+# in contrast to ORM instances which are bound to the job's session.
+ParticipantInfo = namedtuple(
+    "ParticipantInfo",
+    [
+        "participant_id",
+        "name",
+        "email",
+        "audio_sample_file_path",
+        "audio_sample_sha256",
+        "voice_embedding"
+    ]
+)
+
+# (stage name, inputs, outputs) of the summarization pipeline. Each stage is
+# implemented by MeetingAudioSummarizer._stage_<name>. Stages only wait for
+# their inputs, e.g. the language is inferred while agenda and protocol are
+# still being created.
+PIPELINE_STAGES = [
+    (
+        "transcribe",
+        ("audio_file_path", "audio_sha256", "participants", "workspace"),
+        ("raw_transcript", "utterances", "preamble")
+    ),
+    (
+        "speaker_mapping",
+        ("participants", "utterances", "audio_file_path", "preamble"),
+        ("speaker_mapping", "unknown_speakers")
+    ),
+    (
+        "apply_speaker_mapping",
+        ("utterances", "speaker_mapping"),
+        ("transcript",)
+    ),
+    (
+        "infer_language",
+        ("transcript",),
+        ("language",)
+    ),
+    (
+        "infer_agenda",
+        ("transcript", "topic"),
+        ("agenda",)
+    ),
+    (
+        "create_meeting_protocol",
+        (
+            "transcript",
+            "utterances",
+            "speaker_mapping",
+            "agenda",
+            "date",
+            "unknown_speakers"
+        ),
+        ("protocol",)
+    ),
+    (
+        "create_filename",
+        ("protocol", "date"),
+        ("filename",)
+    ),
+    (
+        "ensure_language",
+        ("protocol", "language"),
+        ("translated_protocol",)
+    ),
+    (
+        "ensure_markdown",
+        ("translated_protocol",),
+        ("markdown_protocol",)
+    ),
+    (
+        "export",
+        ("filename", "markdown_protocol", "participants", "workspace"),
+        ("drive_file_id", "doc_url")
+    ),
+]
+
+
+class TranscriptionPending(Exception):
+    """
+    The audio of the meeting was submitted for transcription, but the
+    transcript is not ready yet. The job ends here, the meeting is scheduled
+    again once the transcript is completed.
+
+    Args:
+        transcript_id (str): Id of the transcript at AssemblyAI
+        submission (dict): Set when the audio was just submitted: the
+            arguments of record_submission() except meeting and transcript id
+    """
+
+    def __init__(
+        self,
+        transcript_id: str,
+        submission: dict = None
+    ):
+        super().__init__(f"Waiting for transcript {transcript_id}")
+        self.transcript_id = transcript_id
+        self.submission = submission
+
+
+# LLM requests that are part of another pipeline stage but are budgeted
+# under their own stage name
+REQUEST_STAGES = {
+    "summarize_segment": "create_meeting_protocol",
+}
+
+
+@lru_cache(maxsize=1)
+def _protocol_examples() -> str:
+    protocol_example_1 = open("few_shot_examples/protocol_2.txt", "r").read()
+    protocol_example_2 = open("few_shot_examples/protocol_3.txt", "r").read()
+
+    return f"{protocol_example_1} {protocol_example_2}"
 
 
 class MeetingAudioSummarizer:
@@ -38,248 +206,816 @@ class MeetingAudioSummarizer:
         db,
         anthropic_api_key: str = Config.ANTHROPIC_API_KEY,
         debug_run: bool = DEBUG_RUN,
+        model_routing: str = Config.MODEL_ROUTING,
     ):
         self._db = db
         self._debug_run = debug_run
+        self._model_routes = Config.MODEL_ROUTING_PROFILES[model_routing]
         
         self._anthropic_client = anthropic.Anthropic(
             api_key=anthropic_api_key
         )
+        self._rate_limiter = get_anthropic_rate_limiter()
+        self._token_planner = get_token_budget_planner()
+        self._response_cache = (
+            get_response_cache() if Config.LLM_CACHE_ENABLED else None
+        )
+        # Stages rerun on request, whose cached responses are not reused
+        self._refresh_stages = frozenset()
+        # The worker's lease on the job of the run (app/job_queue.py)
+        self._lease = None
+
+        self._transcript_cache = (
+            get_transcript_cache() if Config.TRANSCRIPT_CACHE_ENABLED else None
+        )
+
+        self._preamble_cache = get_preamble_cache()
 
         self._transcriber = aai.Transcriber()
 
     def summarize_meeting(
         self,
-        meeting: type[Meetings]
+        meeting: type[Meetings],
+        from_stage: str = None,
+        lease=None
     ) -> str:
-        participants = meeting.participants.all()
-        logger.info("Transcribing audio")
-        transcript = self._transcribe_audio(
-            meeting.audio_file_path,
-            participants,
-            meeting.meeting_id
+        """
+        Runs the pipeline for the meeting. Stages whose outputs were already
+        persisted by an earlier run are skipped, unless they are at or after
+        from_stage. Those also bypass the LLM response and transcript
+        caches, otherwise a retry would only repeat the cached results.
+
+        Args:
+            lease (JobLease): The worker's lease on the job, if run by a
+                worker. The run stops with LeaseLost once another worker
+                has taken the job over.
+        """
+        self._lease = lease
+        records = {"meeting": meeting}
+        graph = self._stage_graph()
+
+        context = self._initial_context(meeting)
+        context.update(self._resume_context(graph, meeting, records, from_stage))
+        self._refresh_stages = self._stages_to_refresh(graph, from_stage)
+        self._check_pending_transcription(meeting, context)
+
+        # Temporary files of this run live in their own directory
+        with scratch_workspace(f"meeting_{meeting.meeting_id}_") as workspace:
+            context["workspace"] = workspace
+            try:
+                context = graph.run(
+                    context,
+                    max_workers=Config.PIPELINE_MAX_WORKERS,
+                    on_stage_done=lambda name, outputs: self._complete_stage(
+                        name, outputs, records
+                    ),
+                    targets=("doc_url",)
+                )
+            except TranscriptionPending as pending:
+                self._record_transcription_request(meeting, pending)
+                raise
+
+        return context["doc_url"]
+
+    def _check_pending_transcription(
+        self,
+        meeting: type[Meetings],
+        context: dict
+    ) -> None:
+        # Never submit the audio twice while a transcript is in progress
+        if "raw_transcript" in context or "transcript" in context:
+            return
+        request = pending_request(meeting.meeting_id)
+        if request is not None:
+            raise TranscriptionPending(request.transcript_id)
+
+    def _record_transcription_request(
+        self,
+        meeting: type[Meetings],
+        pending: TranscriptionPending
+    ) -> None:
+        if pending.submission is None or self._debug_run:
+            return
+        record_submission(
+            meeting.meeting_id,
+            pending.transcript_id,
+            **pending.submission
+        )
+        self._db.session.commit()
+        logger.info(
+            f"Submitted audio of meeting {meeting.meeting_id} for "
+            f"transcription, transcript id {pending.transcript_id}"
         )
-        logger.info("Transcribed audio")
-        if not self._debug_run:
-            self._db.session.add(transcript)
-            self._db.session.commit()
-            logger.info("Added transcript to database")
 
-        speaker_mapping, unknown_speakers = self._get_speaker_mapping(
-            participants,
+    def complete_transcription(
+        self,
+        request: TranscriptionRequests,
+        transcript: aai.Transcript
+    ) -> None:
+        """
+        Stores the completed transcript of a submitted request like the
+        transcribe stage does, so that the next run of the meeting resumes
+        after the transcription.
+
+        Args:
+            request (TranscriptionRequests): The submitted request
+            transcript (aai.Transcript): The completed transcript
+        """
+        utterances = self._utterances(
+            transcript,
+            TimeMap.from_json(request.time_map)
+        )
+        if self._transcript_cache is not None and request.cache_key:
+            self._transcript_cache.put(
+                request.cache_key,
+                request.audio_sha256,
+                utterances
+            )
+        self.store_transcript(
+            request.meeting,
+            utterances,
+            preamble=self._uses_preamble()
         )
-        
-        logger.info("Inferred speaker mapping")
-        transcript.speaker_mapping = json.dumps(speaker_mapping)
-        if not self._debug_run:
-            self._db.session.commit()
-            logger.info("Added speaker mapping to database")
 
-        for speaker, participant in speaker_mapping.items():
-            transcript.text = transcript.text.replace(speaker, participant)
-        
-        logger.info("Applied speaker mapping to transcript")
-        if not self._debug_run:
-            self._db.session.commit()
-            logger.info("Updated transcript in database")
+    def store_transcript(
+        self,
+        meeting: type[Meetings],
+        utterances: list[dict],
+        preamble: bool
+    ) -> None:
+        """
+        Persists utterances that were transcribed outside the pipeline as
+        the output of the transcribe stage, so that the next run of the
+        meeting starts after the transcription.
 
-        logger.info("Inferring agenda")
-        agenda = self._infer_agenda(
-            transcript.text,
-            meeting.topic,
-            meeting.meeting_id
+        Args:
+            meeting (Meetings): The meeting
+            utterances (list[dict]): speaker, text, start and end of each
+                utterance, in order
+            preamble (bool): Whether the participant samples were put in
+                front of the transcribed audio, see _get_speaker_mapping()
+        """
+        transcript = Transcript.from_utterances(utterances)
+        self._persist_stage(
+            "transcribe",
+            {
+                "raw_transcript": transcript.render(),
+                "utterances": transcript,
+                "preamble": preamble,
+            },
+            {"meeting": meeting}
         )
-        logger.info("Inferred agenda")
-        
+
+    def _resume_context(
+        self,
+        graph: StageGraph,
+        meeting: type[Meetings],
+        records: dict,
+        from_stage: str = None
+    ) -> dict:
+        checkpoint = self._load_checkpoint(meeting, records)
+        if from_stage is not None:
+            for key in graph.downstream_outputs(from_stage):
+                checkpoint.pop(key, None)
+        if checkpoint:
+            logger.info(
+                f"Resuming meeting {meeting.meeting_id} with persisted "
+                f"{sorted(checkpoint)}"
+            )
+        return checkpoint
+
+    def _stages_to_refresh(
+        self,
+        graph: StageGraph,
+        from_stage: str = None
+    ) -> frozenset[str]:
+        if from_stage is None:
+            return frozenset()
+        return frozenset(graph.downstream_stages(from_stage))
+
+    def _load_checkpoint(
+        self,
+        meeting: type[Meetings],
+        records: dict
+    ) -> dict:
+        """
+        Collects the stage outputs persisted for the meeting by earlier runs.
+        A record only counts if it is not older than the record it was
+        created from, e.g. an agenda from before the latest transcript is
+        stale. The rows are put into records, so that resumed stages update
+        them instead of creating new ones.
+        """
+        if self._debug_run:
+            return {}
+
+        checkpoint = {}
+        meeting_id = meeting.meeting_id
+
+        transcript = Transcripts.query.filter_by(
+            meeting_id=meeting_id
+        ).order_by(Transcripts.transcript_id.desc()).first()
+        if transcript is None or not (transcript.raw_text or transcript.text):
+            return checkpoint
+
+        records["transcript"] = transcript
+        checkpoint["utterances"] = self._stored_utterances(transcript)
+        # Transcripts stored before the flag were all transcribed with
+        # the preamble
+        checkpoint["preamble"] = transcript.preamble is not False
+        if transcript.speaker_mapping is None:
+            checkpoint["raw_transcript"] = transcript.text
+        else:
+            if transcript.raw_text:
+                checkpoint["raw_transcript"] = transcript.raw_text
+            checkpoint["speaker_mapping"] = json.loads(
+                transcript.speaker_mapping
+            )
+            records["speaker_mapping"] = checkpoint["speaker_mapping"]
+            # Transcripts mapped before unknown_speakers was stored get
+            # their speaker mapping once more
+            if transcript.unknown_speakers is not None:
+                checkpoint["unknown_speakers"] = json.loads(
+                    transcript.unknown_speakers
+                )
+            checkpoint["transcript"] = transcript.text
+            if meeting.language:
+                checkpoint["language"] = meeting.language
+
+        agenda = Agendas.query.filter_by(
+            meeting_id=meeting_id
+        ).order_by(Agendas.agenda_id.desc()).first()
+        if (
+            "transcript" not in checkpoint
+            or agenda is None
+            or not agenda.text.strip()
+            or agenda.created_at < transcript.changed_at
+        ):
+            return checkpoint
+        records["agenda"] = agenda
+        checkpoint["agenda"] = agenda.text
+
+        protocol = MeetingProtocols.query.filter_by(
+            meeting_id=meeting_id
+        ).order_by(MeetingProtocols.meeting_protocol_id.desc()).first()
+        if (
+            protocol is None
+            or not (protocol.text or "").strip()
+            or protocol.created_at < agenda.created_at
+        ):
+            return checkpoint
+        records["protocol"] = protocol
+
+        # The protocol text is overwritten by the later stages. The translated
+        # text is a valid input for the filename and language stages, too.
+        checkpoint["protocol"] = protocol.text
+        if protocol.google_drive_filename:
+            checkpoint["filename"] = protocol.google_drive_filename
+        if protocol.status in (
+            "language ensured",
+            "markdown ensured",
+            "exported to Google Drive"
+        ):
+            checkpoint["translated_protocol"] = protocol.text
+        if protocol.status in ("markdown ensured", "exported to Google Drive"):
+            checkpoint["markdown_protocol"] = protocol.text
+        if (
+            protocol.status == "exported to Google Drive"
+            and protocol.google_drive_url
+        ):
+            checkpoint["drive_file_id"] = protocol.google_drive_file_id
+            checkpoint["doc_url"] = protocol.google_drive_url
+
+        return checkpoint
+
+    def _stored_utterances(
+        self,
+        transcript: Transcripts
+    ) -> Transcript:
+        if transcript.utterance_columns is not None:
+            return Transcript.from_columns(
+                transcript.utterance_text,
+                transcript.utterance_columns
+            )
+        # Transcripts stored before the utterances were kept: recover the
+        # speakers and texts, the timestamps are lost
+        return Transcript.parse(transcript.raw_text or transcript.text or "")
+
+    def _initial_context(
+        self,
+        meeting: type[Meetings]
+    ) -> dict:
+        participants = [
+            ParticipantInfo(
+                participant_id=participant.participant_id,
+                name=participant.name,
+                email=participant.email,
+                audio_sample_file_path=participant.audio_sample_file_path,
+                audio_sample_sha256=participant.audio_sample_sha256,
+                voice_embedding=self._voice_embedding(participant)
+            )
+            for participant in meeting.participants.all()
+        ]
+        return {
+            "meeting_id": meeting.meeting_id,
+            "audio_file_path": meeting.audio_file_path,
+            "audio_sha256": meeting.audio_sha256,
+            "topic": meeting.topic,
+            "date": meeting.date,
+            "participants": participants,
+        }
+
+    def _voice_embedding(
+        self,
+        participant: Participants
+    ) -> bytes | None:
+        """
+        The voice embedding of the participant's sample. Embeddings are
+        computed when a sample is uploaded, samples uploaded before that get
+        theirs here, once.
+        """
+        if (
+            Config.SPEAKER_IDENTIFICATION != "embedding"
+            or not self._has_audio_sample(participant)
+        ):
+            return None
+        sample_sha256 = self._sample_sha256(participant)
+        if (
+            participant.voice_embedding is not None
+            and participant.voice_embedding_sha256 == sample_sha256
+        ):
+            return participant.voice_embedding
+
+        logger.info(f"Computing the voice embedding of {participant.name}")
+        embedding = file_embedding(participant.audio_sample_file_path)
+        if embedding is None:
+            logger.warning(
+                f"The audio sample of {participant.name} is too short for a "
+                "voice embedding"
+            )
+            return None
+        participant.voice_embedding = embedding_to_bytes(embedding)
+        participant.voice_embedding_sha256 = sample_sha256
         if not self._debug_run:
-            self._db.session.add(agenda)
             self._db.session.commit()
-            logger.info("Added agenda to database")
+        return participant.voice_embedding
 
-        logger.info(
-            f"Waiting {Config.ANTROPIC_COOL_DOWN_SECONDS} seconds to cool down"
-            " anthropic API"
+    def _stage_graph(self) -> StageGraph:
+        return StageGraph([
+            Stage(
+                name,
+                getattr(self, f"_stage_{name}"),
+                inputs=inputs,
+                outputs=outputs
+            )
+            for name, inputs, outputs in PIPELINE_STAGES
+        ])
+
+    def _stage_transcribe(
+        self,
+        audio_file_path,
+        audio_sha256,
+        participants,
+        workspace
+    ):
+        logger.info("Transcribing audio")
+        transcript = Transcript.from_utterances(self._transcribe_audio(
+            audio_file_path,
+            participants,
+            workspace,
+            audio_sha256
+        ))
+        return transcript.render(), transcript, self._uses_preamble()
+
+    def _stage_speaker_mapping(
+        self,
+        participants,
+        utterances,
+        audio_file_path,
+        preamble
+    ):
+        return self._get_speaker_mapping(
+            participants,
+            utterances,
+            audio_file_path,
+            preamble
         )
-        if not self._debug_run:
-            time.sleep(ANTROPIC_COOL_DOWN_SECONDS)
 
+    def _stage_apply_speaker_mapping(self, utterances, speaker_mapping):
+        return utterances.relabel(speaker_mapping).render()
+
+    def _stage_infer_language(self, transcript):
+        return self._infer_language(transcript)
+
+    def _stage_infer_agenda(self, transcript, topic):
+        logger.info("Inferring agenda")
+        return self._infer_agenda(transcript, topic)
+
+    def _stage_create_meeting_protocol(
+        self,
+        transcript,
+        utterances,
+        speaker_mapping,
+        agenda,
+        date,
+        unknown_speakers
+    ):
         logger.info("Creating meeting protocol")
-        meeting_protocol = self._create_meeting_protocol(
-            transcript.text,
-            agenda.text,
-            meeting.date,
-            meeting.meeting_id,
+        return self._create_meeting_protocol(
+            transcript,
+            utterances.relabel(speaker_mapping),
+            agenda,
+            date,
             unknown_speakers
         )
-        logger.info("Created meeting protocol")
-        meeting_protocol.status = "raw"
-        
-        if not self._debug_run:
-            self._db.session.add(meeting_protocol)
-            self._db.session.commit()
-            logger.info("Added meeting protocol to database")
 
-        logger.info(
-            f"Waiting {Config.ANTROPIC_COOL_DOWN_SECONDS} seconds to cool down"
-            " anthropic API"
-        )
-        if not self._debug_run:
-            time.sleep(ANTROPIC_COOL_DOWN_SECONDS)
+    def _stage_create_filename(self, protocol, date):
+        return self._create_filename(protocol, date)
 
-        filename = self._create_filename(
-            meeting_protocol.text,
-            meeting.date,
-            meeting.meeting_id
-        )
-        logger.info("Created filename")
-        
-        language, translated_protocol = self._ensure_language(
-            transcript.text,
-            meeting_protocol.text,
-            meeting.meeting_id
-        )
+    def _stage_ensure_language(self, protocol, language):
+        return self._ensure_language(protocol, language)
 
-        meeting_protocol.language = language
-        meeting_protocol.text = translated_protocol
-        meeting_protocol.status = "language ensured"
-        logger.info("Ensured language")
-        
-        if not self._debug_run:
-            self._db.session.commit()
-            logger.info("Updated meeting protocol in database")
+    def _stage_ensure_markdown(self, translated_protocol):
+        return self._ensure_markdown(translated_protocol)
 
-        meeting_protocol.text = self._ensure_markdown(
-            meeting_protocol.text,
-            meeting.meeting_id
-        )
-        meeting_protocol.status = "markdown ensured"
-        logger.info("Ensured markdown")
-        
-        if not self._debug_run:
-            self._db.session.commit()
-            logger.info("Updated meeting protocol in database")
-        
-        drive_file_id, doc_url = export_to_google_drive(
+    def _stage_export(
+        self,
+        filename,
+        markdown_protocol,
+        participants,
+        workspace
+    ):
+        self._check_lease()
+        return export_to_google_drive(
             filename,
-            meeting_protocol.text,
-            participants
+            markdown_protocol,
+            participants,
+            workspace=workspace
         )
-        logger.info(f"Meeting protocol exported to Google Drive: {doc_url}")
 
-        meeting_protocol.google_drive_file_id = drive_file_id
-        meeting_protocol.google_drive_filename = filename
-        meeting_protocol.google_drive_url = doc_url
-        meeting_protocol.status = "exported to Google Drive"
-        
+    def _check_lease(
+        self,
+        verify: bool = False
+    ) -> None:
+        if self._lease is not None:
+            self._lease.check(verify)
+
+    def _complete_stage(
+        self,
+        name: str,
+        outputs: dict,
+        records: dict
+    ) -> None:
+        # A worker that lost the job must not write over the results of
+        # the worker that took it over
+        self._check_lease(verify=True)
+        self._persist_stage(name, outputs, records)
+
+    def _persist_stage(
+        self,
+        name: str,
+        outputs: dict,
+        records: dict
+    ) -> None:
+        """
+        Writes the outputs of a finished stage to the database. Called in
+        the thread that runs the stage graph, so the session is never
+        shared between threads.
+        """
+        meeting = records["meeting"]
+
+        if name == "transcribe":
+            logger.info("Transcribed audio")
+            records["transcript"] = Transcripts(
+                meeting_id=meeting.meeting_id,
+                text=outputs["raw_transcript"],
+                raw_text=outputs["raw_transcript"],
+                utterance_text=outputs["utterances"].text,
+                utterance_columns=outputs["utterances"].to_columns(),
+                preamble=outputs["preamble"]
+            )
+            if not self._debug_run:
+                self._db.session.add(records["transcript"])
+        elif name == "speaker_mapping":
+            records["speaker_mapping"] = outputs["speaker_mapping"]
+            # Committed with the next stage, the mapping itself only with
+            # the mapped text (apply_speaker_mapping)
+            records["transcript"].unknown_speakers = json.dumps(
+                outputs["unknown_speakers"]
+            )
+            logger.info("Inferred speaker mapping")
+            return
+        elif name == "apply_speaker_mapping":
+            transcript = records["transcript"]
+            transcript.speaker_mapping = json.dumps(
+                records["speaker_mapping"]
+            )
+            transcript.text = outputs["transcript"]
+            logger.info("Applied speaker mapping to transcript")
+        elif name == "infer_language":
+            meeting.language = outputs["language"]
+            logger.info("Inferred language")
+        elif name == "infer_agenda":
+            logger.info("Inferred agenda")
+            records["agenda"] = Agendas(
+                meeting_id=meeting.meeting_id,
+                text=outputs["agenda"]
+            )
+            if not self._debug_run:
+                self._db.session.add(records["agenda"])
+        elif name == "create_meeting_protocol":
+            logger.info("Created meeting protocol")
+            records["protocol"] = MeetingProtocols(
+                meeting_id=meeting.meeting_id,
+                text=outputs["protocol"],
+                status="raw"
+            )
+            if not self._debug_run:
+                self._db.session.add(records["protocol"])
+        elif name == "create_filename":
+            logger.info("Created filename")
+            records["protocol"].google_drive_filename = outputs["filename"]
+        elif name == "ensure_language":
+            protocol = records["protocol"]
+            protocol.text = outputs["translated_protocol"]
+            protocol.status = "language ensured"
+            logger.info("Ensured language")
+        elif name == "ensure_markdown":
+            protocol = records["protocol"]
+            protocol.text = outputs["markdown_protocol"]
+            protocol.status = "markdown ensured"
+            logger.info("Ensured markdown")
+        elif name == "export":
+            protocol = records["protocol"]
+            protocol.google_drive_file_id = outputs["drive_file_id"]
+            protocol.google_drive_url = outputs["doc_url"]
+            protocol.status = "exported to Google Drive"
+            logger.info(
+                "Meeting protocol exported to Google Drive: "
+                f"{outputs['doc_url']}"
+            )
+
         if not self._debug_run:
             self._db.session.commit()
-            logger.info("Updated meeting protocol in database")
-
-        return doc_url
+            logger.info(f"Persisted stage {name} to database")
 
     def _transcribe_audio(
         self,
         input_file_path: Union[str, Path],
-        participants: list[Participants],
-        meeting_id: int
-    ) -> aai.Transcript:
-        if self._debug_run:
-            cached_transcript = self._load_from_cache_if_exists(
-                f"transcript_{meeting_id}"
+        participants: list[ParticipantInfo],
+        workspace: Path,
+        audio_sha256: str = None
+    ) -> list[dict]:
+        audio_sha256 = audio_sha256 or file_sha256(input_file_path)
+        cache_key = self._transcript_cache_key(audio_sha256, participants)
+        # A transcription rerun on request replaces the cached transcript
+        if cache_key and "transcribe" not in self._refresh_stages:
+            utterances = self._transcript_cache.get(cache_key)
+            if utterances is not None:
+                logger.info("Using cached transcript of the same recording")
+                return utterances
+
+        upload_file_path, time_map = self._prepare_audio(
+            input_file_path,
+            participants,
+            workspace
+        )
+
+        if Config.TRANSCRIPTION_COMPLETION != "inline":
+            transcript = self._transcriber.submit(
+                data=upload_file_path,
+                config=self._transcription_config(participants),
+            )
+            raise TranscriptionPending(
+                transcript.id,
+                self._submission(cache_key, audio_sha256, time_map)
             )
-        
-            if cached_transcript is not None:
-                transcript = Transcripts(
-                    meeting_id=meeting_id,
-                    text=cached_transcript
-                )
-                return transcript
 
-        is_wav = Path(input_file_path).suffix == ".wav"
+        transcript = self._transcriber.transcribe(
+            data=upload_file_path,
+            config=self._transcription_config(participants),
+        )
+        if transcript.status == aai.TranscriptStatus.error:
+            raise RuntimeError(f"Transcription failed: {transcript.error}")
 
-        if is_wav:
-            audio = AudioSegment.from_wav(input_file_path)
-            audio.export("/tmp/output.aac", format="adts")
-            input_file_path = "/tmp/output.aac"
+        utterances = self._utterances(transcript, time_map)
+        if cache_key:
+            self._transcript_cache.put(cache_key, audio_sha256, utterances)
 
-        # Get binary audio data with participant samples prepended
-        input_file_path = self._prepend_speaker_samples(input_file_path, participants)
+        return utterances
 
-        transcript = self._transcriber.transcribe(
-            data=input_file_path,
-            config=aai.TranscriptionConfig(
-                language_code="de",
-                speaker_labels=True,
-                speakers_expected=len(participants),
-                speech_model="best",
-            ),
+    def _submission(
+        self,
+        cache_key: str,
+        audio_sha256: str,
+        time_map: TimeMap
+    ) -> dict:
+        return dict(
+            cache_key=cache_key,
+            audio_sha256=audio_sha256,
+            time_map=time_map.to_json()
         )
 
-        text = self._get_text_with_speaker_labels(transcript)
-        
-        if self._debug_run:
-            self._save_to_cache(f"transcript_{meeting_id}", text)
-        
-        transcript = Transcripts(
-            meeting_id=meeting_id,
-            text=text
+    def _transcript_cache_key(
+        self,
+        audio_sha256: str,
+        participants: list[ParticipantInfo]
+    ) -> str | None:
+        if self._transcript_cache is None:
+            return None
+        # Only prepended samples change the uploaded audio
+        sample_sha256s = [
+            self._sample_sha256(participant)
+            if self._has_audio_sample(participant) else None
+            for participant in participants
+        ] if self._uses_preamble() else []
+        return TranscriptCache.make_key(
+            audio_sha256,
+            sample_sha256s,
+            self._audio_options()
         )
 
-        # if is_wav:
-        #     os.remove("/tmp/output.aac")
+    def _audio_options(self) -> dict:
+        # Settings that change the uploaded audio and thereby the transcript
+        options = {"profile": get_transcription_profile().name}
+        if not self._uses_preamble():
+            options["preamble"] = False
+        if Config.SILENCE_TRIM_ENABLED:
+            options["silence_trim"] = [
+                Config.SILENCE_TRIM_MIN_SECONDS,
+                Config.SILENCE_TRIM_KEEP_SECONDS,
+                Config.SILENCE_TRIM_NOISE_DB,
+            ]
+        return options
 
-        return transcript
-    
-    def _prepend_speaker_samples(
+    def _prepare_audio(
         self,
         input_file_path: Union[str, Path],
-        participants: list[Participants]
-    ) -> bytes:
-        # Convert input file path to Path object for easier handling
-        input_path = Path(input_file_path)
-        input_format = input_path.suffix.replace('.', '')
-        
-        # Create a new combined audio segment starting with the original input
-        combined_audio = AudioSegment.from_file(str(input_path), format=input_format)
-        
-        for participant in participants[::-1]:
-            # Skip if no audio sample
-            if not participant.audio_sample_file_path or not os.path.exists(
-                participant.audio_sample_file_path
-            ):
-                continue
-                
-            sample_path = Path(participant.audio_sample_file_path)
-            sample_format = sample_path.suffix.replace('.', '')
-            
-            # Load sample audio
-            sample_audio = AudioSegment.from_file(str(sample_path), format=sample_format)
-            delay = AudioSegment.silent(duration=1000)
-            
-            # Prepend the sample (which effectively puts it before the current combined audio)
-            combined_audio = sample_audio + delay + combined_audio
-        
-        # Export to bytes IO object
-        
-        combined_audio.export("/tmp/output.aac", format="adts")
-        
-        return "/tmp/output.aac"
-    
-    def _get_text_with_speaker_labels(
+        participants: list[ParticipantInfo],
+        workspace: Path
+    ) -> tuple[str, TimeMap]:
+        """
+        Creates the file uploaded for transcription.
+
+        The recording is encoded once with the transcription profile (or
+        only remuxed if it already is in that format). With
+        SILENCE_TRIM_ENABLED, long silences are compressed while encoding.
+        The participant samples come from a cached preamble in the same
+        format, which is joined to the recording without decoding either.
+
+        Returns:
+            tuple: The path of the upload file and the TimeMap from positions
+                in it to positions in the original recording
+        """
+        profile = get_transcription_profile()
+        recording_file_path = workspace / f"recording.{profile.extension}"
+        if Config.SILENCE_TRIM_ENABLED:
+            segments = speech_segments(
+                input_file_path,
+                min_silence_seconds=Config.SILENCE_TRIM_MIN_SECONDS,
+                keep_silence_seconds=Config.SILENCE_TRIM_KEEP_SECONDS,
+                noise_db=Config.SILENCE_TRIM_NOISE_DB
+            )
+            logger.info(
+                f"Keeping {len(segments)} segments of the recording after "
+                "silence trimming"
+            )
+            encode_segments(
+                input_file_path,
+                recording_file_path,
+                segments,
+                profile
+            )
+        else:
+            segments = None
+            encode_recording(input_file_path, recording_file_path, profile)
+
+        with_samples = [
+            participant for participant in participants
+            if self._has_audio_sample(participant)
+        ] if self._uses_preamble() else []
+        if not with_samples:
+            return str(recording_file_path), TimeMap(segments)
+
+        preamble_file_path = self._preamble_cache.get(
+            [participant.audio_sample_file_path for participant in with_samples],
+            [self._sample_sha256(participant) for participant in with_samples],
+            profile
+        )
+        upload_file_path = concatenate_audio(
+            [preamble_file_path, recording_file_path],
+            workspace / f"upload.{profile.extension}",
+            profile
+        )
+        return upload_file_path, TimeMap(
+            segments,
+            offset_ms=duration_ms(preamble_file_path, profile)
+        )
+
+    def _transcription_config(
         self,
-        transcript: aai.Transcript
-    ) -> str:
-        text_with_speaker_labels = ""
+        participants: list[ParticipantInfo]
+    ) -> aai.TranscriptionConfig:
+        config = aai.TranscriptionConfig(
+            language_code="de",
+            speaker_labels=True,
+            speakers_expected=len(participants),
+            speech_model="best",
+        )
+        if Config.TRANSCRIPTION_COMPLETION == "webhook":
+            config.set_webhook(
+                Config.ASSEMBLYAI_WEBHOOK_URL,
+                auth_header_name=WEBHOOK_AUTH_HEADER,
+                auth_header_value=Config.ASSEMBLYAI_WEBHOOK_SECRET
+            )
+        return config
 
-        for utt in transcript.utterances:
-            text_with_speaker_labels += f"Speaker {utt.speaker}:\n{utt.text}\n"
+    def _uses_preamble(self) -> bool:
+        return Config.SPEAKER_IDENTIFICATION != "embedding"
 
-        return text_with_speaker_labels
+    def _has_audio_sample(
+        self,
+        participant: ParticipantInfo
+    ) -> bool:
+        return bool(
+            participant.audio_sample_file_path
+            and os.path.exists(participant.audio_sample_file_path)
+        )
+
+    def _sample_sha256(
+        self,
+        participant: ParticipantInfo
+    ) -> str:
+        # Samples uploaded before the hash was stored are hashed here
+        return participant.audio_sample_sha256 or file_sha256(
+            participant.audio_sample_file_path
+        )
+
+    def _utterances(
+        self,
+        transcript: aai.Transcript,
+        time_map: TimeMap
+    ) -> list[dict]:
+        # Timestamps refer to the original recording, negative ones to the
+        # participant samples
+        return [
+            {
+                "speaker": utt.speaker,
+                "text": utt.text,
+                "start": time_map.to_original(utt.start),
+                "end": time_map.to_original(utt.end),
+                "confidence": utt.confidence,
+                "words": [
+                    {
+                        "text": word.text,
+                        "start": time_map.to_original(word.start),
+                        "end": time_map.to_original(word.end),
+                        "confidence": word.confidence,
+                    }
+                    for word in utt.words or []
+                ],
+            }
+            for utt in transcript.utterances
+        ]
     
     def _get_speaker_mapping(
         self,
-        participants: list[Participants]
-    ) -> dict:
+        participants: list[ParticipantInfo],
+        utterances: Transcript,
+        audio_file_path: Union[str, Path],
+        preamble: bool = True
+    ) -> tuple[dict, list[str]]:
+        """
+        Maps the diarized speaker labels to participant names, "Unknown N"
+        for speakers that can not be identified.
+
+        Args:
+            preamble (bool): Whether the participant samples were put in
+                front of the transcribed audio, so that Speaker A, B, ... are
+                the participants in order. Live transcripts have no
+                preamble and their labels say nothing about the participants.
+
+        Returns:
+            tuple: The speaker mapping and the names of the participants
+                that were not identified
+        """
+        if not self._uses_preamble():
+            return self._identify_speakers(
+                participants,
+                utterances,
+                audio_file_path
+            )
+        if not preamble:
+            logger.info(
+                "The transcript has no preamble, the speakers stay unknown"
+            )
+            return (
+                {
+                    f"Speaker {speaker}": f"Unknown {i}"
+                    for i, speaker in enumerate(utterances.speaker_labels)
+                },
+                [participant.name for participant in participants]
+            )
+
         speaker_mapping = {}
         unknown_speakers = []
         for i, participant in enumerate(participants):
@@ -297,198 +1033,652 @@ class MeetingAudioSummarizer:
 
         return speaker_mapping, unknown_speakers
 
+    def _identify_speakers(
+        self,
+        participants: list[ParticipantInfo],
+        utterances: Transcript,
+        audio_file_path: Union[str, Path]
+    ) -> tuple[dict, list[str]]:
+        """
+        Matches the diarized speakers to the participants by comparing the
+        voice embedding of each speaker's utterances with the embeddings of
+        the participant samples, independent of the order of the labels.
+        """
+        segments = speaker_segments(
+            utterances.utterances(),
+            Config.SPEAKER_EMBEDDING_MAX_SECONDS
+        )
+        speaker_embeddings = {
+            speaker: file_embedding(audio_file_path, speaker_spans)
+            for speaker, speaker_spans in segments.items()
+        }
+        # Speakers with too little audio stay unknown
+        speaker_embeddings = {
+            speaker: embedding
+            for speaker, embedding in speaker_embeddings.items()
+            if embedding is not None
+        }
+        participant_embeddings = {
+            participant.name: embedding_from_bytes(participant.voice_embedding)
+            for participant in participants
+            if participant.voice_embedding is not None
+        }
+        matches = match_speakers(
+            speaker_embeddings,
+            participant_embeddings,
+            Config.SPEAKER_MATCH_MIN_SIMILARITY
+        )
+
+        speaker_mapping = {}
+        unknown_count = 0
+        for speaker in utterances.speaker_labels:
+            if speaker in matches:
+                speaker_mapping[f"Speaker {speaker}"] = matches[speaker]
+            else:
+                speaker_mapping[f"Speaker {speaker}"] = f"Unknown {unknown_count}"
+                unknown_count += 1
+        unknown_speakers = [
+            participant.name for participant in participants
+            if participant.name not in matches.values()
+        ]
+        logger.info(
+            f"Identified {len(matches)} of {len(speaker_mapping)} speakers "
+            "by voice"
+        )
+        return speaker_mapping, unknown_speakers
+
     def _call_claude_agent(
         self,
-        message_prompt: str,
+        message_prompt: Union[str, list[dict]],
         system_prompt: str,
-        max_tokens: int,
-        cache_key: str = None
+        stage: str = None
     ) -> str:
-        # Try to load from cache if a cache key is provided
-        if cache_key and self._debug_run:
-            cached_result = self._load_from_cache_if_exists(cache_key)
-            if cached_result:
-                return cached_result
-        
-        # Call Claude API
-        message = self._anthropic_client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=max_tokens,
-            temperature=1,
+        self._check_lease()
+        request = self._message_request(message_prompt, system_prompt, stage)
+
+        cache_key = self._cache_key(request)
+        cached_result = self._cached_response(cache_key, stage)
+        if cached_result is not None:
+            return cached_result
+
+        plan = self._token_planner.plan(
+            stage,
+            self._count_input_tokens(request),
+            self._model_route(stage).get("max_output_tokens")
+        )
+        while True:
+            request["max_tokens"] = plan.max_tokens
+            # Call Claude API, waiting only if our rate limit budget is
+            # exhausted
+            for attempt in range(Config.ANTHROPIC_MAX_RATE_LIMIT_RETRIES + 1):
+                self._rate_limiter.acquire(plan.input_tokens, plan.max_tokens)
+                try:
+                    response = self._anthropic_client.messages.with_raw_response.create(
+                        **request
+                    )
+                except anthropic.RateLimitError as e:
+                    self._handle_rate_limit_error(
+                        e, plan.input_tokens, plan.max_tokens, attempt
+                    )
+                    continue
+                break
+
+            result, plan = self._settle_response(response, plan, request["model"])
+            if result is not None:
+                break
+
+        if cache_key:
+            self._response_cache.put(cache_key, result, request["model"])
+
+        return result
+
+    def _count_input_tokens(
+        self,
+        request: dict
+    ) -> int:
+        if Config.TOKEN_COUNTING == "api":
+            return self._anthropic_client.messages.count_tokens(
+                model=request["model"],
+                system=request["system"],
+                messages=request["messages"]
+            ).input_tokens
+        return self._estimate_input_tokens(request)
+
+    def _model_route(
+        self,
+        stage: str = None
+    ) -> dict:
+        """Model and temperature of the stage, see MODEL_ROUTING_PROFILES."""
+        return self._model_routes.get(stage, self._model_routes["default"])
+
+    def _message_request(
+        self,
+        message_prompt: Union[str, list[dict]],
+        system_prompt: str,
+        stage: str = None
+    ) -> dict:
+        """
+        The request without max_tokens, which is chosen by the token budget
+        planner from the size of the request.
+        """
+        # A plain prompt becomes a single text block, a list is passed on
+        # as content blocks (e.g. with a cache_control breakpoint)
+        if isinstance(message_prompt, str):
+            content = [
+                {
+                    "type": "text",
+                    "text": message_prompt
+                }
+            ]
+        else:
+            content = message_prompt
+
+        route = self._model_route(stage)
+        return dict(
+            model=route["model"],
+            temperature=route["temperature"],
             system=system_prompt,
             messages=[
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": message_prompt
-                        }
-                    ]
+                    "content": content
                 }
             ]
         )
-        result = message.content[0].text
-        
-        # Save to cache if a cache key is provided
-        if cache_key and self._debug_run:
-            self._save_to_cache(cache_key, result)
-        
-        return result
 
-    def _load_from_cache_if_exists(
+    def _transcript_request(
         self,
-        key: str
-    ) -> dict | None:
-        if not self._debug_run:
+        transcript: str,
+        instruction: str,
+        stage: str
+    ) -> dict:
+        """
+        Builds a request for a stage working on the full transcript. The
+        system prompt and the context block (examples and transcript) are
+        identical for all of these stages, so the context block carries a
+        cache_control breakpoint and later stages read the prefix from
+        Anthropic's prompt cache instead of processing it again. Only the
+        instruction differs per stage.
+
+        Args:
+            transcript (str): The transcript of the meeting
+            instruction (str): The stage specific instruction
+            stage (str): Name of the pipeline stage
+
+        Returns:
+            dict: Keyword arguments for _call_claude_agent
+        """
+        context = TRANSCRIPT_CONTEXT.format(
+            agenda_examples=AGENDA_EXAMPLES,
+            protocol_examples=_protocol_examples(),
+            transcript=transcript
+        )
+
+        return dict(
+            message_prompt=[
+                {
+                    "type": "text",
+                    "text": context,
+                    "cache_control": {"type": "ephemeral"}
+                },
+                {
+                    "type": "text",
+                    "text": instruction
+                }
+            ],
+            system_prompt=TRANSCRIPT_SYSTEM_PROMPT,
+            stage=stage
+        )
+
+    def _cache_key(
+        self,
+        request: dict
+    ) -> str | None:
+        # Keyed without max_tokens: the planner derives it from the request,
+        # and a response repeated with a larger budget answers the same
+        # request
+        if self._response_cache is None:
+            return None
+        return ResponseCache.make_key(request)
+
+    def _cached_response(
+        self,
+        cache_key: str | None,
+        stage: str = None
+    ) -> str | None:
+        # Stages rerun on request get a fresh response, which then replaces
+        # the cached one
+        if not cache_key or REQUEST_STAGES.get(stage, stage) in (
+            self._refresh_stages
+        ):
             return None
-        if os.path.exists(f"cache/{key}.pkl"):
-            return pickle.load(open(f"cache/{key}.pkl", "rb"))
-        return None
+        cached_result = self._response_cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"Using cached LLM response for stage {stage}")
+        return cached_result
 
-    def _save_to_cache(
+    def _estimate_input_tokens(
         self,
-        key: str,
-        data: dict
+        request: dict
+    ) -> int:
+        return estimate_tokens(json.dumps(
+            [request["system"], request["messages"]],
+            ensure_ascii=False
+        ))
+
+    def _handle_rate_limit_error(
+        self,
+        error: anthropic.RateLimitError,
+        input_tokens: int,
+        max_tokens: int,
+        attempt: int
     ) -> None:
-        if not self._debug_run:
-            return
-        with open(f"cache/{key}.pkl", "wb") as f:
-            pickle.dump(data, f)
+        self._rate_limiter.record(
+            input_tokens,
+            max_tokens,
+            headers=error.response.headers
+        )
+        if attempt == Config.ANTHROPIC_MAX_RATE_LIMIT_RETRIES:
+            raise error
+        logger.warning("Hit the anthropic rate limit, retrying")
+
+    def _settle_response(
+        self,
+        response,
+        plan: TokenPlan,
+        model: str
+    ) -> tuple[str | None, TokenPlan]:
+        """
+        Records the usage of a response. A truncated response is dropped if
+        the output budget can still grow.
+
+        Returns:
+            tuple: The text of the response, None to repeat the request
+                with the returned plan
+        """
+        message = response.parse()
+        cache_read = getattr(message.usage, "cache_read_input_tokens", None)
+        cache_creation = getattr(
+            message.usage, "cache_creation_input_tokens", None
+        )
+        if cache_read or cache_creation:
+            logger.debug(
+                f"Prompt cache: {cache_read or 0} tokens read, "
+                f"{cache_creation or 0} tokens written"
+            )
+        self._rate_limiter.record(
+            plan.input_tokens,
+            plan.max_tokens,
+            usage=message.usage,
+            headers=response.headers
+        )
+        self._token_planner.record(
+            plan,
+            model,
+            message.usage,
+            message.stop_reason
+        )
+
+        if message.stop_reason == "max_tokens":
+            larger = self._token_planner.grow(plan)
+            if larger is not None:
+                logger.warning(
+                    f"Response of stage {plan.stage} was truncated at "
+                    f"{plan.max_tokens} tokens, repeating it with "
+                    f"{larger.max_tokens}"
+                )
+                return None, larger
+            logger.warning(
+                f"Response of stage {plan.stage} was truncated at "
+                f"{plan.max_tokens} tokens"
+            )
+        return message.content[0].text, plan
 
     def _infer_agenda(
         self,
         transcript: str,
-        topic: str,
-        meeting_id: int
+        topic: str
     ) -> str:
-        prompt = PROMPTS["infer_agenda"]["message"].format(
-            transcript=transcript,
-            topic=topic,
-            agenda_examples=AGENDA_EXAMPLES
+        return self._call_claude_agent(
+            **self._infer_agenda_request(transcript, topic)
         )
 
-        text = self._call_claude_agent(
-            prompt,
-            PROMPTS["infer_agenda"]["system"],
-            1000,
-            cache_key=f"agenda_{meeting_id}"
+    def _infer_agenda_request(
+        self,
+        transcript: str,
+        topic: str
+    ) -> dict:
+        instruction = PROMPTS["infer_agenda"]["instruction"].format(
+            topic=topic
         )
-        agenda = Agendas(
-            meeting_id=meeting_id,
-            text=text
+
+        return self._transcript_request(
+            transcript,
+            instruction,
+            stage="infer_agenda"
         )
-        return agenda
 
     def _create_meeting_protocol(
         self,
         transcript: str,
+        utterances: Transcript,
         agenda: str,
         date: str,
-        meeting_id: int,
         unknown_speakers: list[str]
     ) -> str:
-        protocol_example_1 = open("few_shot_examples/protocol_2.txt", "r").read()
-        protocol_example_2 = open("few_shot_examples/protocol_3.txt", "r").read()
+        request = self._create_meeting_protocol_request(
+            transcript,
+            agenda,
+            date,
+            unknown_speakers
+        )
+        segments = self._protocol_segments(transcript, utterances, request)
+        if segments is None:
+            return self._call_claude_agent(**request)
 
-        protocol_examples = f"{protocol_example_1} {protocol_example_2}"
+        # Map: notes of all segments, at most SUMMARY_MAX_PARALLEL_SEGMENTS
+        # at a time. Each call waits for the shared rate limit on its own.
+        with ThreadPoolExecutor(
+            max_workers=Config.SUMMARY_MAX_PARALLEL_SEGMENTS,
+            thread_name_prefix="segment"
+        ) as pool:
+            notes = list(pool.map(
+                lambda indexed: self._call_claude_agent(
+                    **self._summarize_segment_request(
+                        indexed[1],
+                        indexed[0],
+                        len(segments),
+                        agenda
+                    )
+                ),
+                enumerate(segments)
+            ))
 
-        prompt = PROMPTS["create_meeting_protocol"]["message"].format(
-            transcript=transcript,
-            agenda=agenda,
-            date=date,
-            protocol_examples=protocol_examples
+        # Reduce: the protocol from the notes
+        return self._call_claude_agent(
+            **self._reduce_segment_notes_request(
+                notes,
+                agenda,
+                date,
+                unknown_speakers
+            )
+        )
+
+    def _protocol_segments(
+        self,
+        transcript: str,
+        utterances: Transcript,
+        request: dict
+    ) -> list[Transcript] | None:
+        """
+        The segments a long transcript is summarized in, None if it fits
+        into the single request (keyword arguments of _call_claude_agent).
+        A transcript below HIERARCHICAL_SUMMARY_MIN_TOKENS is segmented, too,
+        if the request leaves no room for the protocol.
+        """
+        input_tokens = self._estimate_input_tokens(self._message_request(
+            request["message_prompt"],
+            request["system_prompt"],
+            request["stage"]
+        ))
+        if (
+            estimate_tokens(transcript) <= Config.HIERARCHICAL_SUMMARY_MIN_TOKENS
+            and self._token_planner.fits(
+                request["stage"],
+                input_tokens,
+                self._model_route(request["stage"]).get("max_output_tokens")
+            )
+        ):
+            return None
+        segments = utterances.segments(
+            Config.SUMMARY_SEGMENT_TOKENS * CHARS_PER_TOKEN,
+            int(Config.SUMMARY_SEGMENT_OVERLAP_SECONDS * 1000)
+        )
+        if len(segments) < 2:
+            return None
+        logger.info(
+            f"Summarizing the transcript in {len(segments)} segments"
+        )
+        return segments
+
+    def _summarize_segment_request(
+        self,
+        segment: Transcript,
+        index: int,
+        count: int,
+        agenda: str
+    ) -> dict:
+        span = segment.span()
+        time_range = ""
+        if span is not None:
+            start, end = (
+                str(timedelta(seconds=ms // 1000)) for ms in span
+            )
+            time_range = f", from {start} to {end} of the recording"
+        context = SEGMENT_CONTEXT.format(
+            index=index + 1,
+            count=count,
+            time_range=time_range,
+            transcript=segment.render()
+        )
+        instruction = PROMPTS["summarize_segment"]["instruction"].format(
+            agenda=agenda
         )
 
-        if len(unknown_speakers) > 0:
-            prompt += (
-                "\n\nCAUTION: The following participants could not be "
-                f"identified in the transcript: {unknown_speakers}. "
-                "Their contributions will be marked as 'Unknown' in the "
-                "protocol. "
-                "Please try to infer their names from the transcript."
+        return dict(
+            message_prompt=[
+                {
+                    "type": "text",
+                    "text": context
+                },
+                {
+                    "type": "text",
+                    "text": instruction
+                }
+            ],
+            system_prompt=TRANSCRIPT_SYSTEM_PROMPT,
+            stage="summarize_segment"
+        )
+
+    def _reduce_segment_notes_request(
+        self,
+        notes: list[str],
+        agenda: str,
+        date: str,
+        unknown_speakers: list[str]
+    ) -> dict:
+        context = NOTES_CONTEXT.format(
+            protocol_examples=_protocol_examples(),
+            notes="\n\n".join(
+                f"Part {i + 1}:\n{part_notes}"
+                for i, part_notes in enumerate(notes)
             )
+        )
+        instruction = PROMPTS["reduce_segment_notes"]["instruction"].format(
+            agenda=agenda,
+            date=date
+        ) + self._unknown_speakers_note(unknown_speakers)
 
-        text = self._call_claude_agent(
-            prompt,
-            PROMPTS["create_meeting_protocol"]["system"],
-            5000,
-            cache_key=f"meeting_protocol_{meeting_id}"
+        return dict(
+            message_prompt=[
+                {
+                    "type": "text",
+                    "text": context
+                },
+                {
+                    "type": "text",
+                    "text": instruction
+                }
+            ],
+            system_prompt=TRANSCRIPT_SYSTEM_PROMPT,
+            stage="create_meeting_protocol"
         )
-        meeting_protocol = MeetingProtocols(
-            meeting_id=meeting_id,
-            text=text
+
+    def _unknown_speakers_note(
+        self,
+        unknown_speakers: list[str]
+    ) -> str:
+        if len(unknown_speakers) == 0:
+            return ""
+        return (
+            "\n\nCAUTION: The following participants could not be "
+            f"identified in the transcript: {unknown_speakers}. "
+            "Their contributions will be marked as 'Unknown' in the "
+            "protocol. "
+            "Please try to infer their names from the transcript."
+        )
+
+    def _create_meeting_protocol_request(
+        self,
+        transcript: str,
+        agenda: str,
+        date: str,
+        unknown_speakers: list[str]
+    ) -> dict:
+        instruction = PROMPTS["create_meeting_protocol"]["instruction"].format(
+            agenda=agenda,
+            date=date
+        ) + self._unknown_speakers_note(unknown_speakers)
+
+        return self._transcript_request(
+            transcript,
+            instruction,
+            stage="create_meeting_protocol"
         )
-        return meeting_protocol
 
     def _create_filename(
         self,
         meeting_protocol: str,
-        date: str,
-        meeting_id: int
+        date: str
     ) -> str:
+        return self._call_claude_agent(
+            **self._create_filename_request(meeting_protocol, date)
+        )
+
+    def _create_filename_request(
+        self,
+        meeting_protocol: str,
+        date: str
+    ) -> dict:
         prompt = PROMPTS["create_filename"]["message"].format(
             meeting_protocol=meeting_protocol,
             date=date
         )
 
-        return self._call_claude_agent(
-            prompt,
-            PROMPTS["create_filename"]["system"],
-            100,
-            cache_key=f"filename_{meeting_id}"
+        return dict(
+            message_prompt=prompt,
+            system_prompt=PROMPTS["create_filename"]["system"],
+            stage="create_filename"
         )
 
     def _ensure_language(
         self,
-        transcript: str,
         meeting_protocol: str,
-        meeting_id: int
+        language: str
     ) -> str:
-        language = self._infer_language(transcript, meeting_id)
+        return self._call_claude_agent(
+            **self._ensure_language_request(
+                meeting_protocol,
+                language,
+            )
+        )
 
+    def _ensure_language_request(
+        self,
+        meeting_protocol: str,
+        language: str
+    ) -> dict:
         prompt = PROMPTS["ensure_language"]["message"].format(
             meeting_protocol=meeting_protocol,
             language=language
         )
 
-        translated_protocol = self._call_claude_agent(
-            prompt,
-            PROMPTS["ensure_language"]["system"],
-            5000,
-            cache_key=f"ensure_language_{meeting_id}"
+        return dict(
+            message_prompt=prompt,
+            system_prompt=PROMPTS["ensure_language"]["system"],
+            stage="ensure_language"
         )
-
-        return language, translated_protocol
     
     def _infer_language(
         self,
-        transcript: str,
-        meeting_id: int
+        transcript: str
     ) -> str:
+        language = self._detect_language(transcript)
+        if language is not None:
+            return language
+        return self._normalized_language(self._call_claude_agent(
+            **self._infer_language_request(transcript)
+        ))
+
+    def _normalized_language(
+        self,
+        answer: str
+    ) -> str:
+        """
+        The LLM's answer as the language name detect_language() would give,
+        the plain answer for other languages.
+        """
+        return normalize_language(answer) or answer.strip()
+
+    def _detect_language(
+        self,
+        transcript: str
+    ) -> str | None:
+        """
+        The language of the transcript if it can be identified locally with
+        enough confidence, otherwise None and the LLM has to be asked.
+        """
+        if Config.LANGUAGE_DETECTION != "local":
+            return None
+        language, confidence = detect_language(
+            transcript[-LANGUAGE_DETECTION_SAMPLE_CHARS:]
+        )
+        if language is None:
+            logger.info("Language not identified locally, asking the LLM")
+            return None
+        if confidence < Config.LANGUAGE_DETECTION_MIN_CONFIDENCE:
+            logger.info(
+                f"Language detected as {language} with a confidence of only "
+                f"{confidence:.2f}, asking the LLM"
+            )
+            return None
+        logger.info(
+            f"Detected language {language} (confidence {confidence:.2f})"
+        )
+        return language
+
+    def _infer_language_request(
+        self,
+        transcript: str
+    ) -> dict:
         prompt = PROMPTS["infer_language"]["message"].format(
             transcript=transcript[-500:]
         )
 
-        return self._call_claude_agent(
-            prompt,
-            PROMPTS["infer_language"]["system"],
-            5,
-            cache_key=f"infer_language_{meeting_id}"
+        return dict(
+            message_prompt=prompt,
+            system_prompt=PROMPTS["infer_language"]["system"],
+            stage="infer_language"
         )
 
     def _ensure_markdown(
         self,
-        meeting_protocol: str,
-        meeting_id: int
+        meeting_protocol: str
     ) -> str:
+        return self._call_claude_agent(
+            **self._ensure_markdown_request(meeting_protocol)
+        )
+
+    def _ensure_markdown_request(
+        self,
+        meeting_protocol: str
+    ) -> dict:
         prompt = PROMPTS["ensure_markdown"]["message"].format(
             meeting_protocol=meeting_protocol
         )
 
-        return self._call_claude_agent(
-            prompt,
-            PROMPTS["ensure_markdown"]["system"],
-            5000,
-            cache_key=f"ensure_markdown_{meeting_id}"
+        return dict(
+            message_prompt=prompt,
+            system_prompt=PROMPTS["ensure_markdown"]["system"],
+            stage="ensure_markdown"
         )
@@ -26,6 +26,13 @@ class Participants(db.Model):
     name = db.Column(db.Text, unique=True)
     email = db.Column(db.Text)
     audio_sample_file_path = db.Column(db.Text)
+    # sha256 of the normalized audio sample
+    audio_sample_sha256 = db.Column(db.String(64), nullable=True)
+    # float32 voice embedding of the audio sample, see
+    # app/tools/speaker_embeddings.py, and the sha256 of the sample it was
+    # computed from
+    voice_embedding = db.Column(db.LargeBinary, nullable=True)
+    voice_embedding_sha256 = db.Column(db.String(64), nullable=True)
     tag = db.Column(db.Text)
     changed_at = db.Column(
         db.DateTime,
@@ -53,7 +60,17 @@ class Meetings(db.Model):
     language = db.Column(db.Text)
     status = db.Column(db.String(20), default="pending")
     job_id = db.Column(db.String(50), nullable=True)
+    # Renewed while the meeting is "processing", see
+    # app/job_queue.py:meeting_heartbeat()
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
     doc_url = db.Column(db.String(255), nullable=True)
+    # sha256 of the uploaded recording, computed while saving it
+    audio_sha256 = db.Column(db.String(64), nullable=True, index=True)
+    # Read from the container header at upload time, see probe_audio
+    audio_duration_seconds = db.Column(db.Float, nullable=True)
+    audio_codec = db.Column(db.Text, nullable=True)
+    audio_sample_rate = db.Column(db.Integer, nullable=True)
+    audio_channels = db.Column(db.Integer, nullable=True)
     tag = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
     changed_at = db.Column(
@@ -73,7 +90,21 @@ class Transcripts(db.Model):
         db.ForeignKey("meetings.meeting_id")
     )
     text = db.Column(db.Text)
+    # The transcript as returned by the transcription, before the speaker
+    # mapping was applied to text. Needed to resume from the speaker mapping.
+    raw_text = db.Column(db.Text)
+    # The utterances of raw_text with speakers, timings and word timings, as
+    # stored by app/tools/transcript.py: the texts back to back and the
+    # arrays indexing them
+    utterance_text = db.Column(db.Text)
+    utterance_columns = db.Column(db.LargeBinary)
     speaker_mapping = db.Column(db.Text)
+    # JSON list of the participants the speaker mapping did not identify
+    unknown_speakers = db.Column(db.Text)
+    # Whether the participant samples were put in front of the transcribed
+    # audio (SPEAKER_IDENTIFICATION = "preamble"). False for live
+    # transcripts, NULL for transcripts stored before the flag.
+    preamble = db.Column(db.Boolean)
     tag = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
     changed_at = db.Column(
@@ -136,3 +167,183 @@ class Agendas(db.Model):
 
     def __repr__(self):
         return f"<Agenda {self.meeting_id}>"
+
+
+class RateLimitBuckets(db.Model):
+    """
+    Token bucket state shared by all processes calling the Anthropic API,
+    see app/tools/rate_limiter.py. updated_at is a unix timestamp.
+    """
+    name = db.Column(db.String(50), primary_key=True)
+    level = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f"<RateLimitBucket {self.name}: {self.level}>"
+
+
+class MeetingJobs(db.Model):
+    """
+    Queue of meetings waiting to be summarized by a worker process, see
+    app/job_queue.py and worker.py.
+    """
+    job_id = db.Column(db.Integer, primary_key=True)
+    meeting_id = db.Column(
+        db.Integer,
+        db.ForeignKey("meetings.meeting_id"),
+        nullable=False
+    )
+    status = db.Column(db.String(20), default="queued", index=True)
+    # Jobs are claimed in ascending order of priority: the unix time of
+    # enqueueing plus the estimated processing time. Short meetings overtake
+    # long ones, but every job moves to the front eventually.
+    priority = db.Column(db.Float, nullable=True, index=True)
+    # Pipeline stage to restart from, None resumes after the last persisted
+    # stage
+    from_stage = db.Column(db.String(50), nullable=True)
+    worker_id = db.Column(db.String(255), nullable=True)
+    # A running job belongs to its worker only until the lease expires. The
+    # worker renews it with every heartbeat, expired leases are reclaimed.
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    changed_at = db.Column(
+        db.DateTime,
+        default=datetime.now,
+        onupdate=datetime.now
+    )
+
+    meeting = db.relationship("Meetings", backref="jobs")
+
+    def __repr__(self):
+        return f"<MeetingJob {self.job_id} ({self.meeting_id}, {self.status})>"
+
+
+class LlmResponseCache(db.Model):
+    """
+    Content-addressed cache of LLM responses, see
+    app/tools/response_cache.py. cache_key is the sha256 of the complete
+    request (model, prompts and parameters).
+    """
+    cache_key = db.Column(db.String(64), primary_key=True)
+    model = db.Column(db.Text)
+    response = db.Column(db.Text, nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+    last_accessed_at = db.Column(
+        db.DateTime,
+        default=datetime.now,
+        index=True
+    )
+
+    def __repr__(self):
+        return f"<LlmResponseCache {self.cache_key[:12]}>"
+
+
+class TranscriptionCache(db.Model):
+    """
+    Utterances returned by the transcription, keyed by the content of the
+    recording and of the prepended participant samples, see
+    app/tools/transcript_cache.py. utterances is a JSON list of objects with
+    speaker, text, start and end (in milliseconds), confidence and words
+    (each with text, start, end and confidence), as accepted by
+    Transcript.from_utterances.
+    """
+    cache_key = db.Column(db.String(64), primary_key=True)
+    audio_sha256 = db.Column(db.String(64), nullable=False, index=True)
+    utterances = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<TranscriptionCache {self.cache_key[:12]}>"
+
+
+class TranscriptionRequests(db.Model):
+    """
+    Transcripts submitted to AssemblyAI that are not processed yet, see
+    app/transcription_requests.py. When AssemblyAI reports the transcript
+    as completed (polled or via webhook), the transcript is stored and the
+    meeting is scheduled again.
+    """
+    request_id = db.Column(db.Integer, primary_key=True)
+    meeting_id = db.Column(
+        db.Integer,
+        db.ForeignKey("meetings.meeting_id"),
+        nullable=False
+    )
+    # Id of the transcript at AssemblyAI
+    transcript_id = db.Column(db.String(64), unique=True, nullable=False)
+    # submitted, completing, completed or error
+    status = db.Column(db.String(20), default="submitted", index=True)
+    # Where to cache the result, see TranscriptCache
+    cache_key = db.Column(db.String(64), nullable=True)
+    audio_sha256 = db.Column(db.String(64), nullable=True)
+    # JSON of the TimeMap from the uploaded audio to the recording
+    time_map = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    submitted_at = db.Column(db.DateTime, default=datetime.now)
+    # When the request was set to "completing". Claims older than
+    # TRANSCRIPTION_CLAIM_TIMEOUT_SECONDS are returned to "submitted".
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    changed_at = db.Column(
+        db.DateTime,
+        default=datetime.now,
+        onupdate=datetime.now
+    )
+
+    meeting = db.relationship("Meetings", backref="transcription_requests")
+
+    def __repr__(self):
+        return f"<TranscriptionRequest {self.transcript_id} ({self.status})>"
+
+
+class LiveUtterances(db.Model):
+    """
+    Utterances of a meeting recorded in the browser, stored as the real-time
+    transcription delivers them, see app/live_sessions.py. start and end are
+    milliseconds since the start of the recording.
+    """
+    utterance_id = db.Column(db.Integer, primary_key=True)
+    meeting_id = db.Column(
+        db.Integer,
+        db.ForeignKey("meetings.meeting_id"),
+        nullable=False,
+        index=True
+    )
+    speaker = db.Column(db.String(20), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    start = db.Column(db.Integer, nullable=False)
+    end = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<LiveUtterance {self.meeting_id} {self.start}>"
+
+
+class LlmUsage(db.Model):
+    """
+    Planned and actual token usage of each LLM request, see
+    app/tools/token_budget.py. planned_input_tokens is the pre-flight count,
+    input_tokens includes tokens read from or written to the prompt cache.
+    stop_reason is "max_tokens" for truncated responses.
+    """
+    usage_id = db.Column(db.Integer, primary_key=True)
+    stage = db.Column(db.String(50), nullable=True, index=True)
+    model = db.Column(db.Text)
+    planned_input_tokens = db.Column(db.Integer)
+    input_tokens = db.Column(db.Integer)
+    max_tokens = db.Column(db.Integer)
+    output_tokens = db.Column(db.Integer)
+    stop_reason = db.Column(db.String(20), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<LlmUsage {self.stage} {self.output_tokens}/{self.max_tokens}>"
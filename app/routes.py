@@ -2,15 +2,57 @@ import os
 from datetime import datetime
 import logging
 from pathlib import Path
+import shutil
 import traceback
 
+import assemblyai as aai
 from flask import request, render_template, flash, redirect, url_for, jsonify
 
 from app import app, db
 
-from .models import Meetings, Participants
+from .models import (
+    LiveUtterances,
+    Meetings,
+    Participants,
+    TranscriptionRequests,
+)
 from config import Config
-from .meeting_audio_summarizer import MeetingAudioSummarizer
+from .meeting_audio_summarizer import (
+    MeetingAudioSummarizer,
+    PIPELINE_STAGES,
+    TranscriptionPending,
+    WEBHOOK_AUTH_HEADER,
+)
+from .async_meeting_audio_summarizer import AsyncMeetingAudioSummarizer
+from .job_queue import (
+    LeaseLost,
+    enqueue_meeting,
+    estimate_cost_seconds,
+    is_abandoned,
+    meeting_heartbeat,
+)
+from .live_sessions import get_live_sessions
+from .tools.async_runner import get_async_runner
+from .tools.audio import (
+    SAMPLE_PROFILE,
+    AudioProcessingError,
+    encode_audio,
+    file_sha256,
+    pcm_to_wav,
+    probe_audio,
+    save_and_hash,
+)
+from .tools.rate_limiter import get_anthropic_rate_limiter
+from .tools.response_cache import get_response_cache
+from .tools.speaker_embeddings import embedding_to_bytes, file_embedding
+from .tools.token_budget import get_token_budget_planner
+from .tools.workspace import scratch_workspace
+from .transcription_requests import (
+    claim_completion,
+    finish_request,
+    release_stale_claims,
+    submitted_requests,
+)
 from flask_apscheduler import APScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 
@@ -24,6 +66,26 @@ scheduler = APScheduler()
 
 # This function should be called in your app's __init__.py
 def init_scheduler(app):
+    if Config.TRANSCRIPTION_COMPLETION not in ("inline", "poll", "webhook"):
+        raise ValueError(
+            "Unknown TRANSCRIPTION_COMPLETION "
+            f"'{Config.TRANSCRIPTION_COMPLETION}'"
+        )
+    if (
+        Config.TRANSCRIPTION_COMPLETION == "webhook"
+        and not Config.ASSEMBLYAI_WEBHOOK_URL
+    ):
+        # Transcripts would only be completed by the fallback poller
+        raise ValueError(
+            "TRANSCRIPTION_COMPLETION = \"webhook\" needs "
+            "ASSEMBLYAI_WEBHOOK_URL"
+        )
+
+    if Config.JOB_BACKEND == "queue":
+        # Meetings are processed by worker processes (worker.py), the web
+        # processes only enqueue them
+        return scheduler
+
     # Configure scheduler to use SQLAlchemy for persistent job storage
     app.config['SCHEDULER_JOBSTORES'] = {
         'default': SQLAlchemyJobStore(
@@ -34,23 +96,55 @@ def init_scheduler(app):
     app.config['SCHEDULER_API_ENABLED'] = True
     scheduler.init_app(app)
     scheduler.start()
+
+    if Config.TRANSCRIPTION_COMPLETION != "inline":
+        # Checks submitted transcripts, see poll_transcriptions
+        scheduler.add_job(
+            id="poll_transcriptions",
+            func=poll_transcriptions,
+            trigger="interval",
+            seconds=Config.ASSEMBLYAI_POLL_SECONDS,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
     return scheduler
 
 
 # Background job function
-def process_meeting_summarization(meeting_id):
+def process_meeting_summarization(meeting_id, from_stage=None):
+    if Config.PIPELINE_MODE == "async":
+        # Hand the meeting to the shared event loop and free this thread
+        get_async_runner().submit(
+            aprocess_meeting_summarization(meeting_id, from_stage)
+        )
+        return
+    run_meeting_summarization(meeting_id, from_stage)
+
+
+def run_meeting_summarization(meeting_id, from_stage=None, lease=None) -> bool:
     with app.app_context():
         try:
             meeting = Meetings.query.get(meeting_id)
             if not meeting:
                 logger.error(f"Meeting with ID {meeting_id} not found")
-                return
+                return False
                 
             meeting.status = "processing"
+            meeting.heartbeat_at = datetime.now()
             db.session.commit()
             
             summarizer = MeetingAudioSummarizer(db)
-            doc_url = summarizer.summarize_meeting(meeting)
+            try:
+                with meeting_heartbeat(meeting_id):
+                    doc_url = summarizer.summarize_meeting(
+                        meeting,
+                        from_stage,
+                        lease
+                    )
+            except TranscriptionPending as pending:
+                _mark_meeting_transcribing(meeting, pending)
+                return True
             
             # Update meeting status in database
             meeting.status = "completed"
@@ -58,18 +152,202 @@ def process_meeting_summarization(meeting_id):
             db.session.commit()
             
             logger.info(f"Successfully processed meeting {meeting_id}, doc URL: {doc_url}")
+            return True
+        except LeaseLost as e:
+            _abandon_meeting(meeting_id, e)
+            return False
         except Exception as e:
             logger.error(f"Error in background job: {str(e)}")
             logger.error(traceback.format_exc())
-            
-            # Update meeting status to failed
+            _mark_meeting_failed(meeting_id)
+            return False
+
+
+async def aprocess_meeting_summarization(
+    meeting_id,
+    from_stage=None,
+    lease=None
+):
+    # Every task gets its own app context and therefore its own session
+    with app.app_context():
+        try:
+            meeting = Meetings.query.get(meeting_id)
+            if not meeting:
+                logger.error(f"Meeting with ID {meeting_id} not found")
+                return False
+
+            meeting.status = "processing"
+            meeting.heartbeat_at = datetime.now()
+            db.session.commit()
+
+            summarizer = AsyncMeetingAudioSummarizer(db)
             try:
-                meeting = Meetings.query.get(meeting_id)
-                if meeting:
-                    meeting.status = "failed"
-                    db.session.commit()
-            except Exception as inner_e:
-                logger.error(f"Error updating meeting status: {str(inner_e)}")
+                with meeting_heartbeat(meeting_id):
+                    doc_url = await summarizer.asummarize_meeting(
+                        meeting,
+                        from_stage,
+                        lease
+                    )
+            except TranscriptionPending as pending:
+                _mark_meeting_transcribing(meeting, pending)
+                return True
+
+            meeting.status = "completed"
+            meeting.doc_url = doc_url
+            db.session.commit()
+
+            logger.info(f"Successfully processed meeting {meeting_id}, doc URL: {doc_url}")
+            return True
+        except LeaseLost as e:
+            _abandon_meeting(meeting_id, e)
+            return False
+        except Exception as e:
+            logger.error(f"Error in async background job: {str(e)}")
+            logger.error(traceback.format_exc())
+            _mark_meeting_failed(meeting_id)
+            return False
+
+
+def _mark_meeting_transcribing(meeting, pending):
+    # The job ends while AssemblyAI works on the transcript, the meeting is
+    # scheduled again by complete_transcription
+    meeting.status = "transcribing"
+    db.session.commit()
+    logger.info(
+        f"Meeting {meeting.meeting_id} waits for transcript "
+        f"{pending.transcript_id}"
+    )
+
+
+def poll_transcriptions():
+    """
+    Checks all submitted transcripts at AssemblyAI and completes the ready
+    ones. In webhook mode only transcripts whose webhook call is overdue
+    are checked. Completions abandoned by a dead process are released
+    first.
+    """
+    min_age_seconds = (
+        Config.ASSEMBLYAI_WEBHOOK_FALLBACK_SECONDS
+        if Config.TRANSCRIPTION_COMPLETION == "webhook" else 0
+    )
+    with app.app_context():
+        try:
+            release_stale_claims(Config.TRANSCRIPTION_CLAIM_TIMEOUT_SECONDS)
+            transcript_ids = [
+                request.transcript_id
+                for request in submitted_requests(min_age_seconds)
+            ]
+        except Exception as e:
+            logger.error(f"Error listing submitted transcripts: {str(e)}")
+            return
+        for transcript_id in transcript_ids:
+            complete_transcription(transcript_id)
+
+
+def complete_transcription(transcript_id: str) -> bool:
+    """
+    Stores the transcript of a submitted request if AssemblyAI has finished
+    it and schedules its meeting again. Must be called within an app
+    context.
+
+    Returns:
+        bool: Whether the request was completed (or failed) by this call
+    """
+    transcription_request = TranscriptionRequests.query.filter_by(
+        transcript_id=transcript_id
+    ).first()
+    if transcription_request is None or transcription_request.status != "submitted":
+        return False
+
+    try:
+        transcript = aai.Transcript.get_by_id(transcript_id)
+    except Exception as e:
+        logger.error(f"Error fetching transcript {transcript_id}: {str(e)}")
+        return False
+    if transcript.status not in (
+        aai.TranscriptStatus.completed,
+        aai.TranscriptStatus.error
+    ):
+        return False
+    if not claim_completion(transcription_request.request_id):
+        # Completed by another poller or the webhook
+        return False
+
+    meeting = transcription_request.meeting
+    try:
+        if transcript.status == aai.TranscriptStatus.error:
+            logger.error(
+                f"Transcription of meeting {meeting.meeting_id} failed: "
+                f"{transcript.error}"
+            )
+            finish_request(transcription_request, False, transcript.error)
+            meeting.status = "failed"
+        else:
+            MeetingAudioSummarizer(db).complete_transcription(
+                transcription_request,
+                transcript
+            )
+            finish_request(transcription_request, True)
+            schedule_meeting(meeting)
+            logger.info(
+                f"Transcript of meeting {meeting.meeting_id} completed, "
+                "scheduled the meeting again"
+            )
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error completing transcript {transcript_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        db.session.rollback()
+        finish_request(transcription_request, False, str(e))
+        meeting.status = "failed"
+        db.session.commit()
+    return True
+
+
+def _abandon_meeting(meeting_id, lease_lost):
+    # The worker that took the job over owns the meeting now, its status
+    # is left alone
+    db.session.rollback()
+    logger.warning(
+        f"Stopped processing meeting {meeting_id}: {str(lease_lost)}"
+    )
+
+
+def _mark_meeting_failed(meeting_id):
+    # Update meeting status to failed
+    try:
+        db.session.rollback()
+        meeting = Meetings.query.get(meeting_id)
+        if meeting:
+            meeting.status = "failed"
+            db.session.commit()
+    except Exception as inner_e:
+        logger.error(f"Error updating meeting status: {str(inner_e)}")
+
+
+def schedule_meeting(meeting, from_stage=None):
+    """Schedules the summarization of the meeting. The caller commits."""
+    job_id = f"meeting_{meeting.meeting_id}"
+    if Config.JOB_BACKEND == "queue":
+        # Picked up by a free worker process, shorter meetings first
+        enqueue_meeting(
+            meeting.meeting_id,
+            from_stage,
+            estimate_cost_seconds(meeting)
+        )
+    else:
+        # Schedule the job to run immediately
+        scheduler.add_job(
+            id=job_id,
+            func=process_meeting_summarization,
+            args=[meeting.meeting_id, from_stage],
+            trigger='date',  # Run once immediately
+            run_date=datetime.now(),
+            replace_existing=True
+        )
+
+    meeting.job_id = job_id
+    meeting.status = "scheduled"
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -119,7 +397,7 @@ def meeting_form():
                 Path(Config.UPLOAD_FOLDER) /
                 f"{meeting.meeting_id}.{extension}"
             )
-            audio_file.save(filepath)
+            audio_sha256 = save_and_hash(audio_file.stream, filepath)
         except Exception as e:
             # log error and traceback
             logger.error(f"Error uploading audio file: {str(e)}")
@@ -130,8 +408,30 @@ def meeting_form():
             )
             return redirect(url_for("meeting_form"))
 
+        # Read duration and format from the container header, this also
+        # rejects files that are not audio before any job is started
+        try:
+            audio_info = probe_audio(filepath)
+        except AudioProcessingError as e:
+            logger.error(f"Rejected audio file of meeting {meeting.meeting_id}: {str(e)}")
+            filepath.unlink(missing_ok=True)
+            if debug_meeting_id is None:
+                db.session.delete(meeting)
+                db.session.commit()
+            flash(
+                "The uploaded file could not be read as audio, please "
+                "check the file and upload it again",
+                "error"
+            )
+            return redirect(url_for("meeting_form"))
+
         try:
             meeting.audio_file_path = str(filepath)
+            meeting.audio_sha256 = audio_sha256
+            meeting.audio_duration_seconds = audio_info["duration"]
+            meeting.audio_codec = audio_info["codec"]
+            meeting.audio_sample_rate = audio_info["sample_rate"]
+            meeting.audio_channels = audio_info["channels"]
             if debug_meeting_id is None:
                 db.session.commit()
         except Exception as e:
@@ -164,19 +464,7 @@ def meeting_form():
 
         # Schedule the background job
         try:
-            # Schedule the job to run immediately
-            job_id = f"meeting_{meeting.meeting_id}"
-            scheduler.add_job(
-                id=job_id,
-                func=process_meeting_summarization,
-                args=[meeting.meeting_id],
-                trigger='date',  # Run once immediately
-                run_date=datetime.now(),
-                replace_existing=True
-            )
-            
-            meeting.job_id = job_id
-            meeting.status = "scheduled"
+            schedule_meeting(meeting)
             db.session.commit()
             
             flash(
@@ -228,12 +516,7 @@ def add_participant():
             audio_sample = request.files.get("audio_sample")
             if audio_sample and audio_sample.filename:
                 try:
-                    extension = Path(audio_sample.filename).suffix
-                    filename = f"participant_{new_participant.participant_id}_{new_participant.name.replace(' ', '_')}{extension}"
-                    filepath = Path(Config.AUDIO_SAMPLES_FOLDER) / filename
-                    audio_sample.save(filepath)
-                    
-                    new_participant.audio_sample_file_path = str(filepath)
+                    save_audio_sample(new_participant, audio_sample)
                     db.session.commit()
                 except Exception as audio_e:
                     logger.error(f"Error saving audio sample: {str(audio_e)}")
@@ -283,18 +566,14 @@ def update_participant(participant_id):
         audio_sample = request.files.get("audio_sample")
         if audio_sample and audio_sample.filename:
             try:
-                # Remove old audio sample if it exists
-                if participant.audio_sample_file_path:
-                    old_file = Path(participant.audio_sample_file_path)
+                old_file_path = participant.audio_sample_file_path
+                save_audio_sample(participant, audio_sample)
+
+                # Remove old audio sample if it was stored under another name
+                if old_file_path and old_file_path != participant.audio_sample_file_path:
+                    old_file = Path(old_file_path)
                     if old_file.exists():
                         old_file.unlink()
-                
-                extension = Path(audio_sample.filename).suffix
-                filename = f"participant_{participant_id}_{name.replace(' ', '_')}{extension}"
-                filepath = Path(Config.AUDIO_SAMPLES_FOLDER) / filename
-                audio_sample.save(filepath)
-                
-                participant.audio_sample_file_path = str(filepath)
             except Exception as audio_e:
                 logger.error(f"Error updating audio sample: {str(audio_e)}")
                 flash("Participant updated, but audio sample could not be saved", "warning")
@@ -309,6 +588,41 @@ def update_participant(participant_id):
     return redirect(url_for("participants"))
 
 
+def save_audio_sample(
+    participant: Participants,
+    audio_sample
+) -> None:
+    """
+    Normalizes an uploaded audio sample to the format of the transcription
+    uploads and stores it for the participant, so that it never has to be
+    decoded again when it is prepended to a recording. With
+    SPEAKER_IDENTIFICATION = "embedding", the voice embedding of the sample
+    is computed here once, too.
+
+    Args:
+        participant (Participants): The participant, with its final name
+        audio_sample: The uploaded file (werkzeug FileStorage)
+    """
+    filename = f"participant_{participant.participant_id}_{participant.name.replace(' ', '_')}.{SAMPLE_PROFILE.extension}"
+    filepath = Path(Config.AUDIO_SAMPLES_FOLDER) / filename
+
+    with scratch_workspace("audio_sample_") as workspace:
+        upload_path = workspace / f"upload{Path(audio_sample.filename).suffix}"
+        audio_sample.save(upload_path)
+        encode_audio([upload_path], workspace / filename, SAMPLE_PROFILE)
+        shutil.move(workspace / filename, filepath)
+
+    participant.audio_sample_file_path = str(filepath)
+    participant.audio_sample_sha256 = file_sha256(filepath)
+    if Config.SPEAKER_IDENTIFICATION == "embedding":
+        # None for a sample too short for an embedding
+        embedding = file_embedding(filepath)
+        participant.voice_embedding = (
+            embedding_to_bytes(embedding) if embedding is not None else None
+        )
+        participant.voice_embedding_sha256 = participant.audio_sample_sha256
+
+
 @app.route("/delete_participant/<int:participant_id>")
 def delete_participant(participant_id):
     try:
@@ -357,6 +671,9 @@ def remove_audio_sample(participant_id):
                 logger.error(f"Error removing audio file: {str(file_e)}")
             
             participant.audio_sample_file_path = None
+            participant.audio_sample_sha256 = None
+            participant.voice_embedding = None
+            participant.voice_embedding_sha256 = None
             db.session.commit()
             flash(f"Audio sample removed for {participant.name}", "success")
         else:
@@ -369,6 +686,254 @@ def remove_audio_sample(participant_id):
     return redirect(url_for("participants"))
 
 
+# Retry a meeting, by default from the first stage without persisted output.
+# A "processing" meeting whose process died (see is_abandoned) is taken over.
+@app.route("/retry_meeting/<int:meeting_id>", methods=["POST"])
+def retry_meeting(meeting_id):
+    meeting = Meetings.query.get_or_404(meeting_id)
+
+    from_stage = request.values.get("from_stage") or None
+    stage_names = [name for name, _, _ in PIPELINE_STAGES]
+    if from_stage is not None and from_stage not in stage_names:
+        return jsonify({
+            'error': f"Unknown stage '{from_stage}'",
+            'stages': stage_names
+        }), 400
+    abandoned = is_abandoned(meeting)
+    if (
+        meeting.status in ['scheduled', 'processing', 'transcribing', 'live']
+        and not abandoned
+    ):
+        return jsonify({'error': 'Meeting is already being processed'}), 409
+    if abandoned:
+        logger.warning(
+            f"Taking over meeting {meeting_id}, its process sent no "
+            f"heartbeat since {meeting.heartbeat_at or meeting.changed_at}"
+        )
+
+    try:
+        if meeting.status == "live":
+            # The live transcript may have stopped before the recording,
+            # the recording is transcribed instead
+            if not finish_live_meeting(
+                meeting,
+                _live_recording_file_path(meeting_id),
+                live_transcript=False
+            ):
+                return jsonify({'error': 'Nothing was recorded'}), 400
+        else:
+            schedule_meeting(meeting, from_stage)
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Error scheduling retry: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': 'Could not schedule the retry'}), 500
+
+    if request.form:
+        flash("The meeting is being processed again", "info")
+        return redirect(url_for("meeting_form"))
+    return jsonify({
+        'meeting_id': meeting_id,
+        'job_id': meeting.job_id,
+        'status': meeting.status,
+        'from_stage': from_stage
+    })
+
+
+# Record a meeting in the browser and transcribe it while it runs
+@app.route("/live")
+def live_meeting():
+    participants = Participants.query.order_by(Participants.name).all()
+    return render_template(
+        "live_meeting.html",
+        participants=participants,
+        sample_rate=Config.LIVE_SAMPLE_RATE,
+        now=datetime.now()
+    )
+
+
+@app.route("/live/start", methods=["POST"])
+def start_live_meeting():
+    try:
+        meeting = Meetings(
+            topic=request.form["topic"],
+            date=datetime.strptime(request.form["date"], "%Y-%m-%dT%H:%M"),
+            status="live"
+        )
+        db.session.add(meeting)
+        db.session.commit()
+        for participant_id in request.form.getlist("participants"):
+            meeting.participants.append(Participants.query.get(participant_id))
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error creating live meeting: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': 'Could not create the meeting'}), 500
+
+    recording_file_path = _live_recording_file_path(meeting.meeting_id)
+    try:
+        get_live_sessions().start(meeting.meeting_id, recording_file_path)
+    except Exception as e:
+        logger.error(f"Error starting live transcription: {str(e)}")
+        logger.error(traceback.format_exc())
+        meeting.status = "failed"
+        db.session.commit()
+        return jsonify({'error': 'Could not start the live transcription'}), 502
+    meeting.heartbeat_at = datetime.now()
+    db.session.commit()
+
+    return jsonify({
+        'meeting_id': meeting.meeting_id,
+        'sample_rate': Config.LIVE_SAMPLE_RATE
+    })
+
+
+# Raw 16 bit mono PCM, numbered by the browser via ?sequence=
+@app.route("/live/<int:meeting_id>/chunk", methods=["POST"])
+def live_meeting_chunk(meeting_id):
+    session = get_live_sessions().get(meeting_id)
+    if session is None:
+        return jsonify({'error': 'No live session for this meeting'}), 404
+
+    sequence = request.args.get("sequence", type=int)
+    if sequence is None:
+        return jsonify({'error': 'sequence is missing'}), 400
+    accepted = session.push(sequence, request.get_data())
+    return jsonify({
+        'accepted': accepted,
+        'transcribing': session.error is None
+    })
+
+
+@app.route("/live/<int:meeting_id>/stop", methods=["POST"])
+def stop_live_meeting(meeting_id):
+    meeting = Meetings.query.get_or_404(meeting_id)
+    session = get_live_sessions().stop(meeting_id)
+    if session is None:
+        return jsonify({'error': 'No live session for this meeting'}), 404
+
+    try:
+        finished = finish_live_meeting(
+            meeting,
+            session.recording_file_path,
+            live_transcript=session.error is None
+        )
+    except Exception as e:
+        logger.error(f"Error finishing live meeting: {str(e)}")
+        logger.error(traceback.format_exc())
+        _mark_meeting_failed(meeting_id)
+        return jsonify({'error': 'Could not finish the meeting'}), 500
+    if not finished:
+        return jsonify({'error': 'Nothing was recorded'}), 400
+
+    return jsonify({
+        'meeting_id': meeting_id,
+        'status': meeting.status,
+        'live_transcript': session.error is None
+    })
+
+
+def _live_recording_file_path(meeting_id):
+    return Path(Config.UPLOAD_FOLDER) / f"{meeting_id}.pcm"
+
+
+def finish_live_meeting(meeting, recording_file_path, live_transcript):
+    """
+    Keeps the recording of a stopped live meeting as its audio file and
+    schedules the protocol. If the live transcription worked
+    (live_transcript), its utterances are the transcript and the pipeline
+    starts after the transcription, otherwise the recording is transcribed
+    like an upload. Live utterances are not matched to the participants:
+    the real-time transcription has no preamble of participant samples.
+
+    Returns:
+        bool: False if no audio was recorded, the meeting failed then
+    """
+    if (
+        not recording_file_path.exists()
+        or os.path.getsize(recording_file_path) == 0
+    ):
+        logger.warning(
+            f"Live meeting {meeting.meeting_id} has no recording, failing it"
+        )
+        recording_file_path.unlink(missing_ok=True)
+        meeting.status = "failed"
+        db.session.commit()
+        return False
+
+    wav_file_path = recording_file_path.with_suffix(".wav")
+    meeting.audio_sha256 = pcm_to_wav(
+        recording_file_path,
+        wav_file_path,
+        Config.LIVE_SAMPLE_RATE
+    )
+    recording_file_path.unlink()
+    meeting.audio_file_path = str(wav_file_path)
+    meeting.audio_codec = "pcm_s16le"
+    meeting.audio_sample_rate = Config.LIVE_SAMPLE_RATE
+    meeting.audio_channels = 1
+    meeting.audio_duration_seconds = (
+        os.path.getsize(wav_file_path) / (2 * Config.LIVE_SAMPLE_RATE)
+    )
+
+    utterances = LiveUtterances.query.filter_by(
+        meeting_id=meeting.meeting_id
+    ).order_by(LiveUtterances.start, LiveUtterances.utterance_id).all()
+    if live_transcript and utterances:
+        MeetingAudioSummarizer(db).store_transcript(meeting, [
+            {
+                "speaker": utterance.speaker,
+                "text": utterance.text,
+                "start": utterance.start,
+                "end": utterance.end,
+            }
+            for utterance in utterances
+        ], preamble=False)
+    schedule_meeting(meeting)
+    db.session.commit()
+    return True
+
+
+# Utterances transcribed so far, after the utterance with id ?after=
+@app.route("/live/<int:meeting_id>/utterances")
+def live_meeting_utterances(meeting_id):
+    after = request.args.get("after", default=0, type=int)
+    utterances = LiveUtterances.query.filter(
+        LiveUtterances.meeting_id == meeting_id,
+        LiveUtterances.utterance_id > after
+    ).order_by(LiveUtterances.utterance_id).all()
+    return jsonify([
+        {
+            'utterance_id': utterance.utterance_id,
+            'speaker': utterance.speaker,
+            'text': utterance.text,
+            'start': utterance.start,
+            'end': utterance.end,
+        }
+        for utterance in utterances
+    ])
+
+
+# Called by AssemblyAI when a transcript submitted with a webhook URL is
+# completed or failed (TRANSCRIPTION_COMPLETION = "webhook")
+@app.route("/assemblyai_webhook", methods=["POST"])
+def assemblyai_webhook():
+    if (
+        Config.ASSEMBLYAI_WEBHOOK_SECRET
+        and request.headers.get(WEBHOOK_AUTH_HEADER)
+        != Config.ASSEMBLYAI_WEBHOOK_SECRET
+    ):
+        return jsonify({'error': 'Invalid webhook secret'}), 401
+
+    payload = request.get_json(silent=True) or {}
+    transcript_id = payload.get("transcript_id")
+    if not transcript_id:
+        return jsonify({'error': 'transcript_id is missing'}), 400
+
+    completed = complete_transcription(transcript_id)
+    return jsonify({'transcript_id': transcript_id, 'completed': completed})
+
+
 # Add a route to check job status
 @app.route("/job_status/<job_id>")
 def job_status(job_id):
@@ -388,3 +953,22 @@ def job_status(job_id):
                 'doc_url': meeting.doc_url if meeting.status == 'completed' else None
             })
         return jsonify({'error': 'Job not found'}), 404
+
+
+# Current Anthropic rate limit budget of this process, for monitoring
+@app.route("/rate_limit_status")
+def rate_limit_status():
+    return jsonify(get_anthropic_rate_limiter().budget())
+
+
+# Hit/miss counters of this process and size of the LLM response cache
+@app.route("/llm_cache_status")
+def llm_cache_status():
+    return jsonify(get_response_cache().stats())
+
+
+# Planned against actual token usage of the LLM requests per stage, for
+# tuning the stage budgets in app/tools/token_budget.py
+@app.route("/token_budget_status")
+def token_budget_status():
+    return jsonify(get_token_budget_planner().usage_by_stage())
@@ -0,0 +1,69 @@
+import logging
+
+from sqlalchemy import inspect, text
+
+from app import db
+from .models import Meetings, Participants, TranscriptionRequests, Transcripts
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+# Columns added to tables that existing deployments already have.
+# db.create_all() only creates missing tables, so these are added by
+# upgrade_schema() at startup. Append new columns of existing tables here;
+# they must be nullable or have a server default.
+ADDED_COLUMNS = [
+    (Transcripts, "raw_text"),
+    (Participants, "audio_sample_sha256"),
+    (Participants, "voice_embedding"),
+    (Participants, "voice_embedding_sha256"),
+    (Meetings, "audio_sha256"),
+    (Meetings, "audio_duration_seconds"),
+    (Meetings, "audio_codec"),
+    (Meetings, "audio_sample_rate"),
+    (Meetings, "audio_channels"),
+    (Meetings, "heartbeat_at"),
+    (TranscriptionRequests, "claimed_at"),
+    (Transcripts, "utterance_text"),
+    (Transcripts, "utterance_columns"),
+    (Transcripts, "preamble"),
+    (Transcripts, "unknown_speakers"),
+]
+
+
+def upgrade_schema(engine) -> None:
+    """
+    Adds the ADDED_COLUMNS that are missing in the database, with their
+    indexes. Idempotent; on PostgreSQL also when several processes start
+    at once, a column another process has just added is skipped.
+    """
+    dialect = engine.dialect
+    existing = {}
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for model, name in ADDED_COLUMNS:
+            table = model.__table__
+            if table.name not in existing:
+                existing[table.name] = {
+                    column["name"]
+                    for column in inspector.get_columns(table.name)
+                }
+            if name in existing[table.name]:
+                continue
+
+            column = table.c[name]
+            if_not_exists = (
+                "IF NOT EXISTS " if dialect.name == "postgresql" else ""
+            )
+            logger.info(f"Adding column {table.name}.{name}")
+            conn.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}"
+                f"{name} {column.type.compile(dialect=dialect)}"
+            ))
+            if column.index:
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table.name}_{name} "
+                    f"ON {table.name} ({name})"
+                ))
+            existing[table.name].add(name)
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+from typing import Coroutine, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class AsyncRunner:
+    """
+    An event loop running in a background thread. Coroutines can be
+    submitted from any thread, e.g. from an APScheduler job, which then
+    returns immediately instead of blocking its thread for the whole job.
+
+    Args:
+        max_concurrency (int): Maximum number of submitted coroutines that
+            run at the same time, the others wait for a free slot
+        executor_workers (int): Threads of the loop's default executor,
+            used for blocking calls such as uploads and database access
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        executor_workers: int
+    ):
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=executor_workers,
+            thread_name_prefix="async-executor"
+        ))
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="async-runner",
+            daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    async def _limited(self, coro: Coroutine):
+        async with self._semaphore:
+            return await coro
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedules the coroutine on the loop, returns a thread-safe future."""
+        return asyncio.run_coroutine_threadsafe(
+            self._limited(coro),
+            self._loop
+        )
+
+    def call(self, coro: Coroutine) -> Future:
+        """
+        Schedules the coroutine on the loop without taking a meeting slot,
+        for short calls such as forwarding live audio.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+
+_async_runner: Optional[AsyncRunner] = None
+_async_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncRunner:
+    """The event loop shared by all async pipelines of this process."""
+    global _async_runner
+    with _async_runner_lock:
+        if _async_runner is None:
+            _async_runner = AsyncRunner(
+                max_concurrency=Config.ASYNC_MAX_CONCURRENT_MEETINGS,
+                executor_workers=Config.ASYNC_EXECUTOR_WORKERS
+            )
+            logger.info("Started async pipeline event loop")
+        return _async_runner
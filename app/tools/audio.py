@@ -0,0 +1,555 @@
+from bisect import bisect_right
+from collections import namedtuple
+import hashlib
+import json
+import logging
+from pathlib import Path
+import shutil
+import subprocess
+import wave
+from typing import BinaryIO, Iterable, Optional, Union
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+# Read and write audio in chunks of this size, so large recordings are
+# never held in memory as a whole
+CHUNK_SIZE = 1024 * 1024
+
+# An audio encoding: ffmpeg encoder, the codec name ffprobe reports for it,
+# sample rate, channel layout, bitrate (None for lossless) and container
+AudioProfile = namedtuple(
+    "AudioProfile",
+    [
+        "name",
+        "encoder",
+        "codec",
+        "sample_rate",
+        "channel_layout",
+        "bitrate",
+        "container",
+        "extension"
+    ]
+)
+
+# Profiles for the audio uploaded for transcription, see
+# Config.TRANSCRIPTION_PROFILE. Speech recognition works on 16 kHz mono
+# audio, so the speech profiles drop everything above that.
+TRANSCRIPTION_PROFILES = {
+    "aac": AudioProfile(
+        "aac", "aac", "aac", 44100, "mono", "128k", "adts", "aac"
+    ),
+    "opus": AudioProfile(
+        "opus", "libopus", "opus", 16000, "mono", "24k", "ogg", "ogg"
+    ),
+    "flac": AudioProfile(
+        "flac", "flac", "flac", 16000, "mono", None, "flac", "flac"
+    ),
+}
+
+# Participant samples are stored in this format when they are uploaded
+SAMPLE_PROFILE = TRANSCRIPTION_PROFILES["aac"]
+
+CHANNELS = {"mono": 1, "stereo": 2}
+
+
+class AudioProcessingError(Exception):
+    pass
+
+
+def save_and_hash(
+    stream: BinaryIO,
+    file_path: Union[str, Path]
+) -> str:
+    """
+    Writes an uploaded file to disk and computes its sha256 in the same
+    pass.
+
+    Args:
+        stream (BinaryIO): The uploaded file, e.g. a werkzeug FileStorage
+        file_path (Union[str, Path]): Where to save the file
+
+    Returns:
+        str: The hex digest of the file content
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "wb") as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            f.write(chunk)
+    return sha256.hexdigest()
+
+
+def file_sha256(file_path: Union[str, Path]) -> str:
+    """The sha256 hex digest of a file on disk."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def probe_audio(file_path: Union[str, Path]) -> dict:
+    """
+    Reads the codec, sample rate, channel count and duration of the first
+    audio stream of a file with ffprobe. Only the container headers are
+    read, not the audio itself.
+
+    Returns:
+        dict: codec, sample_rate, channels, duration (seconds or None)
+    """
+    command = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries",
+        "stream=codec_name,sample_rate,channels:format=duration",
+        "-of", "json",
+        str(file_path),
+    ]
+    output = _run_ffmpeg(command)
+    info = json.loads(output or "{}")
+    streams = info.get("streams") or []
+    if not streams:
+        raise AudioProcessingError(f"No audio stream found in {file_path}")
+    stream = streams[0]
+    duration = info.get("format", {}).get("duration")
+    return {
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream.get("sample_rate") or 0),
+        "channels": int(stream.get("channels") or 0),
+        "duration": float(duration) if duration else None,
+    }
+
+
+def get_transcription_profile(name: str = None) -> AudioProfile:
+    """The profile with the given name (default: Config.TRANSCRIPTION_PROFILE)."""
+    name = name or Config.TRANSCRIPTION_PROFILE
+    if name not in TRANSCRIPTION_PROFILES:
+        raise ValueError(
+            f"Unknown transcription profile '{name}', choose one of "
+            f"{list(TRANSCRIPTION_PROFILES)}"
+        )
+    return TRANSCRIPTION_PROFILES[name]
+
+
+def _format_filter(profile: AudioProfile) -> str:
+    return (
+        f"aformat=sample_rates={profile.sample_rate}"
+        f":channel_layouts={profile.channel_layout}"
+    )
+
+
+def _encoder_args(profile: AudioProfile) -> list[str]:
+    args = ["-c:a", profile.encoder]
+    if profile.bitrate:
+        args += ["-b:a", profile.bitrate]
+    if profile.encoder == "libopus":
+        args += ["-application", "voip"]
+    return args + ["-f", profile.container]
+
+
+def encode_audio(
+    input_file_paths: Iterable[Union[str, Path]],
+    output_file_path: Union[str, Path],
+    profile: AudioProfile,
+    gap_seconds: float = 0.0
+) -> str:
+    """
+    Encodes one or more audio files, one after the other, to a single file
+    in the given profile, in a single ffmpeg pass.
+
+    ffmpeg decodes, resamples and encodes the audio as a stream, so memory
+    use does not depend on the length of the audio.
+
+    Args:
+        input_file_paths (Iterable): Files in any format ffmpeg can read
+        output_file_path (Union[str, Path]): Where to write the result
+        profile (AudioProfile): The output format
+        gap_seconds (float): Silence inserted after each input file
+
+    Returns:
+        str: output_file_path
+    """
+    inputs = []
+    filters = []
+    segments = []
+    for i, path in enumerate(input_file_paths):
+        inputs += ["-i", str(path)]
+        filters.append(f"[{i}:a]{_format_filter(profile)}[a{i}]")
+        segments.append(f"[a{i}]")
+        if gap_seconds > 0:
+            filters.append(
+                f"anullsrc=r={profile.sample_rate}:cl={profile.channel_layout},"
+                f"atrim=duration={gap_seconds}[g{i}]"
+            )
+            segments.append(f"[g{i}]")
+    filters.append(f"{''.join(segments)}concat=n={len(segments)}:v=0:a=1[out]")
+
+    _run_ffmpeg([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        *inputs,
+        "-filter_complex", ";".join(filters),
+        "-map", "[out]",
+        *_encoder_args(profile),
+        str(output_file_path),
+    ])
+    return str(output_file_path)
+
+
+def encode_recording(
+    input_file_path: Union[str, Path],
+    output_file_path: Union[str, Path],
+    profile: AudioProfile
+) -> str:
+    """
+    Brings a recording into the given profile. A recording that already
+    has the codec, sample rate and channel count of the profile is only
+    remuxed, without decoding or encoding the audio.
+
+    Returns:
+        str: output_file_path
+    """
+    info = probe_audio(input_file_path)
+    if (
+        info["codec"] == profile.codec
+        and info["sample_rate"] == profile.sample_rate
+        and info["channels"] == CHANNELS[profile.channel_layout]
+    ):
+        _run_ffmpeg([
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            "-i", str(input_file_path),
+            "-map", "0:a:0",
+            "-c:a", "copy",
+            "-f", profile.container,
+            str(output_file_path),
+        ])
+        return str(output_file_path)
+    return encode_audio([input_file_path], output_file_path, profile)
+
+
+def detect_silences(
+    file_path: Union[str, Path],
+    min_seconds: float,
+    noise_db: float
+) -> list[tuple[float, Optional[float]]]:
+    """
+    Finds the stretches of silence in a recording with ffmpeg's
+    silencedetect filter. The audio is decoded as a stream, nothing is
+    written.
+
+    Args:
+        file_path (Union[str, Path]): The recording
+        min_seconds (float): Minimum length of a silence
+        noise_db (float): Level below which the audio counts as silent
+
+    Returns:
+        list: (start, end) in seconds per silence. end is None for a silence
+            lasting until the end of the recording.
+    """
+    output = _run_ffmpeg([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", str(file_path),
+        "-map", "0:a:0",
+        "-af",
+        f"silencedetect=noise={noise_db}dB:d={min_seconds},"
+        "ametadata=mode=print:file=-",
+        "-f", "null", "-",
+    ])
+
+    silences = []
+    start = None
+    for line in output.splitlines():
+        key, _, value = line.strip().partition("=")
+        if key == "lavfi.silence_start":
+            start = max(0.0, float(value))
+        elif key == "lavfi.silence_end" and start is not None:
+            silences.append((start, float(value)))
+            start = None
+    if start is not None:
+        silences.append((start, None))
+    return silences
+
+
+def speech_segments(
+    file_path: Union[str, Path],
+    min_silence_seconds: float,
+    keep_silence_seconds: float,
+    noise_db: float
+) -> list[tuple[float, float]]:
+    """
+    The parts of a recording to keep when silences are compressed: every
+    silence of at least min_silence_seconds is shortened to
+    keep_silence_seconds, half of it on each side.
+
+    Returns:
+        list: (start, end) in seconds of the parts to keep, in order
+    """
+    duration = probe_audio(file_path)["duration"]
+    padding = keep_silence_seconds / 2
+
+    segments = []
+    position = 0.0
+    for start, end in detect_silences(file_path, min_silence_seconds, noise_db):
+        cut_start = start + padding if start > 0 else 0.0
+        cut_end = end - padding if end is not None else None
+        if cut_end is not None and cut_end <= cut_start:
+            continue
+        if cut_start > position:
+            segments.append((position, cut_start))
+        if cut_end is None:
+            return segments
+        position = cut_end
+
+    if duration is None or duration > position:
+        segments.append((position, duration))
+    return segments
+
+
+def encode_segments(
+    input_file_path: Union[str, Path],
+    output_file_path: Union[str, Path],
+    segments: list[tuple[float, Optional[float]]],
+    profile: AudioProfile
+) -> str:
+    """
+    Like encode_audio(), but only encodes the given parts of the recording,
+    joined without gaps.
+
+    Args:
+        segments (list): (start, end) in seconds, end None for the end of
+            the recording
+    """
+    selection = "+".join(
+        f"between(t,{start:.3f},{end:.3f})" if end is not None
+        else f"gte(t,{start:.3f})"
+        for start, end in segments
+    )
+    _run_ffmpeg([
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-i", str(input_file_path),
+        "-map", "0:a:0",
+        "-af",
+        f"aselect='{selection}',asetpts=N/SR/TB,{_format_filter(profile)}",
+        *_encoder_args(profile),
+        str(output_file_path),
+    ])
+    return str(output_file_path)
+
+
+def duration_ms(
+    file_path: Union[str, Path],
+    profile: AudioProfile
+) -> int:
+    """
+    The exact duration of a file encoded with the given profile. Ogg and
+    FLAC store it in their headers. ADTS has no such header, so there the
+    AAC frames (1024 samples each) are counted, which only reads the frame
+    headers.
+    """
+    if profile.container != "adts":
+        return round(probe_audio(file_path)["duration"] * 1000)
+
+    output = _run_ffmpeg([
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-count_packets",
+        "-show_entries", "stream=nb_read_packets,sample_rate",
+        "-of", "json",
+        str(file_path),
+    ])
+    stream = json.loads(output)["streams"][0]
+    return round(
+        int(stream["nb_read_packets"]) * 1024 * 1000
+        / int(stream["sample_rate"])
+    )
+
+
+class TimeMap:
+    """
+    Maps positions in the uploaded audio back to the original recording,
+    after a preamble was put in front of it and silences were cut out of
+    it. Positions within the preamble map to negative values.
+
+    Args:
+        segments (list): (start, end) in seconds of the parts of the
+            recording contained in the upload, in order. None means the
+            whole recording was uploaded.
+        offset_ms (int): Length of the audio before the recording
+    """
+
+    def __init__(
+        self,
+        segments: Optional[list[tuple[float, Optional[float]]]] = None,
+        offset_ms: int = 0
+    ):
+        self.segments = [tuple(segment) for segment in segments or []]
+        self.offset_ms = offset_ms
+        self._upload_starts = []
+        self._original_starts = []
+        position = 0
+        for start, end in segments or []:
+            self._upload_starts.append(position)
+            self._original_starts.append(round(start * 1000))
+            if end is not None:
+                position += round((end - start) * 1000)
+
+    def to_original(self, upload_ms: int) -> int:
+        ms = upload_ms - self.offset_ms
+        if ms < 0 or not self._upload_starts:
+            return ms
+        i = max(0, bisect_right(self._upload_starts, ms) - 1)
+        return self._original_starts[i] + ms - self._upload_starts[i]
+
+    def to_json(self) -> str:
+        return json.dumps({"segments": self.segments, "offset_ms": self.offset_ms})
+
+    @classmethod
+    def from_json(cls, value: Optional[str]) -> "TimeMap":
+        if not value:
+            return cls()
+        data = json.loads(value)
+        return cls(data["segments"] or None, data["offset_ms"])
+
+
+def concatenate_audio(
+    input_file_paths: list[Union[str, Path]],
+    output_file_path: Union[str, Path],
+    profile: AudioProfile
+) -> str:
+    """
+    Joins files encoded with the same profile without decoding them. ADTS
+    files are appended byte by byte, since every ADTS frame carries its own
+    header. Other containers are joined by ffmpeg's concat demuxer, which
+    copies the encoded packets into a new container.
+
+    Returns:
+        str: output_file_path
+    """
+    if profile.container == "adts":
+        with open(output_file_path, "wb") as output:
+            for path in input_file_paths:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, output, CHUNK_SIZE)
+        return str(output_file_path)
+
+    list_file_path = Path(output_file_path).with_suffix(".txt")
+    with open(list_file_path, "w") as f:
+        for path in input_file_paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        _run_ffmpeg([
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", str(list_file_path),
+            "-c", "copy",
+            "-f", profile.container,
+            str(output_file_path),
+        ])
+    finally:
+        list_file_path.unlink()
+    return str(output_file_path)
+
+
+def pcm_to_wav(
+    pcm_file_path: Union[str, Path],
+    wav_file_path: Union[str, Path],
+    sample_rate: int,
+    sample_width: int = 2
+) -> str:
+    """
+    Wraps raw mono PCM, e.g. audio streamed by the browser, in a WAV
+    container, so that it can be probed and transcribed like an upload.
+
+    Returns:
+        str: The sha256 hex digest of the WAV file
+    """
+    with open(pcm_file_path, "rb") as pcm, wave.open(str(wav_file_path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        while True:
+            chunk = pcm.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            wav.writeframes(chunk)
+    return file_sha256(wav_file_path)
+
+
+def decode_pcm(
+    input_file_path: Union[str, Path],
+    sample_rate: int,
+    segments: Optional[list[tuple[float, Optional[float]]]] = None
+) -> bytes:
+    """
+    Decodes (parts of) a recording to 16 bit mono PCM, e.g. for the voice
+    embeddings in app/tools/speaker_embeddings.py.
+
+    Args:
+        segments (list): (start, end) in seconds of the parts to decode,
+            joined without gaps. Only these parts are decoded. None decodes
+            the whole recording.
+
+    Returns:
+        bytes: Little-endian 16 bit samples
+    """
+    output_format = f"aformat=sample_rates={sample_rate}:channel_layouts=mono"
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    if not segments:
+        command += [
+            "-i", str(input_file_path),
+            "-map", "0:a:0",
+            "-af", output_format,
+        ]
+    else:
+        # One input per part, seeking in the container instead of decoding
+        # the recording up to the part
+        graph = []
+        for i, (start, end) in enumerate(segments):
+            command += ["-ss", f"{start:.3f}"]
+            if end is not None:
+                command += ["-t", f"{end - start:.3f}"]
+            command += ["-i", str(input_file_path)]
+            graph.append(f"[{i}:a:0]{output_format}[a{i}]")
+        graph.append(
+            "".join(f"[a{i}]" for i in range(len(segments)))
+            + f"concat=n={len(segments)}:v=0:a=1[out]"
+        )
+        command += ["-filter_complex", ";".join(graph), "-map", "[out]"]
+    return _run_ffmpeg(command + [
+        "-f", "s16le", "-c:a", "pcm_s16le",
+        "pipe:1",
+    ], binary=True)
+
+
+def _run_ffmpeg(
+    command: list[str],
+    binary: bool = False
+) -> Union[str, bytes]:
+    # Runs ffmpeg or ffprobe and returns what it wrote to stdout
+    logger.debug(f"Running {' '.join(command)}")
+    try:
+        result = subprocess.run(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except FileNotFoundError as e:
+        raise AudioProcessingError(f"{command[0]} is not installed") from e
+    if result.returncode != 0:
+        raise AudioProcessingError(
+            f"{command[0]} failed: "
+            f"{result.stderr.decode('utf-8', errors='replace').strip()}"
+        )
+    if binary:
+        return result.stdout
+    return result.stdout.decode("utf-8", errors="replace")
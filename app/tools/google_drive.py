@@ -1,6 +1,6 @@
 import logging
 import os
-import shutil
+from pathlib import Path
 import traceback
 
 import pypandoc
@@ -10,6 +10,7 @@ from googleapiclient.http import MediaFileUpload
 from google.oauth2 import service_account
 
 from app.models import Participants
+from app.tools.workspace import scratch_workspace
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -21,8 +22,6 @@ handler = logging.StreamHandler()
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-TEMP_DIR = "./tmp"
-
 # This is the id of the Meetingprotokolle folder in my Google Drive (Peter)
 # Can be found by opening the folder in the browser and copying the id from
 # the url:
@@ -40,7 +39,8 @@ def export_to_google_drive(
     filename: str,
     meeting_protocol: str,
     participants: list[Participants],
-    folder_id: str = FOLDER_ID
+    folder_id: str = FOLDER_ID,
+    workspace: Path = None
 ):
     """
     Exports a meeting protocol to Google Drive as a Google Doc.
@@ -52,6 +52,8 @@ def export_to_google_drive(
         participants (list[Participants]): The participants of the meeting
         folder_id (str): The id of the folder to upload to (default: FOLDER_ID)
             The default is the Meetingprotokolle folder id in my Google Drive (Peter).
+        workspace (Path): Directory for the temporary files of the job. If
+            None, a scratch workspace is created for this call.
 
     Returns:
         str: URL of the created Google Doc
@@ -60,11 +62,19 @@ def export_to_google_drive(
         - Google API credentials configured
         - Required packages: google-auth, google-auth-oauthlib, google-api-python-client
     """
-    service = authenticate_with_service_account('google_drive_credentials.json')
+    if workspace is None:
+        with scratch_workspace("export_") as workspace:
+            return export_to_google_drive(
+                filename,
+                meeting_protocol,
+                participants,
+                folder_id,
+                workspace
+            )
 
-    os.makedirs(TEMP_DIR, exist_ok=True)
+    service = authenticate_with_service_account('google_drive_credentials.json')
 
-    tmp_docx_file = os.path.join(TEMP_DIR, f"{filename}.docx")
+    tmp_docx_file = os.path.join(workspace, "protocol.docx")
     
     convert_markdown_to_docx(meeting_protocol, tmp_docx_file, font='Arial')
     
@@ -84,10 +94,6 @@ def export_to_google_drive(
     # Get the document URL
     doc_url = f"https://docs.google.com/document/d/{doc_id}/edit"
 
-    # Clean up temporary files
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-
     return doc_id, doc_url
 
 
@@ -117,8 +123,8 @@ def convert_markdown_to_docx(
     :param font: Font to use in the document (default: Arial)
     """
     
-    # Create a temporary file for the markdown content
-    tmp_md_file = os.path.join(TEMP_DIR, 'temp.md')
+    # Create a temporary file for the markdown content next to the output
+    tmp_md_file = os.path.join(os.path.dirname(output_docx), 'temp.md')
     with open(tmp_md_file, 'w') as f:
         f.write(markdown_content)
 
@@ -0,0 +1,166 @@
+from collections import Counter
+from functools import lru_cache
+import re
+from typing import Optional
+
+import numpy as np
+
+from app.tools.language_samples import LANGUAGE_SAMPLES
+
+# Names as used in the prompts and stored in Meetings.language
+LANGUAGE_NAMES = {
+    "de": "German",
+    "en": "English",
+    "fr": "French",
+    "es": "Spanish",
+    "it": "Italian",
+    "nl": "Dutch",
+    "pt": "Portuguese",
+    "pl": "Polish",
+}
+
+# Other names of the languages, e.g. in answers of the LLM
+LANGUAGE_ALIASES = {
+    "deutsch": "de",
+    "englisch": "en",
+    "französisch": "fr",
+    "français": "fr",
+    "francais": "fr",
+    "spanisch": "es",
+    "español": "es",
+    "espanol": "es",
+    "italienisch": "it",
+    "italiano": "it",
+    "niederländisch": "nl",
+    "nederlands": "nl",
+    "portugiesisch": "pt",
+    "português": "pt",
+    "portugues": "pt",
+    "polnisch": "pl",
+    "polski": "pl",
+}
+
+NGRAM_ORDERS = (1, 2, 3)
+# Most frequent n-grams kept per language and order
+PROFILE_SIZE = 300
+# The confidence weighs the average log probability of the n-grams as if
+# there were EVIDENCE_NGRAMS of them, otherwise every long text would be
+# classified with a confidence of 1. Texts of fewer than FULL_EVIDENCE_NGRAMS
+# n-grams (about 70 letters) count as proportionally less evidence.
+EVIDENCE_NGRAMS = 20
+FULL_EVIDENCE_NGRAMS = 200
+# The posterior only compares the known languages with each other, e.g.
+# Danish text is "Dutch" with a confidence above 0.9. Texts of which less
+# than this share of trigrams is in the profile of the best language are
+# in none of the languages. Our samples cover 0.54 and more in their own
+# language, Danish, Swedish, Norwegian, Czech and Finnish 0.37 and less.
+MIN_TRIGRAM_COVERAGE = 0.45
+
+_NON_LETTERS = re.compile(r"[\W\d_]+")
+# Speaker labels of a rendered transcript, e.g. "Anna:"
+_LABEL_LINE = re.compile(r"^[^\n]{1,80}:$", re.MULTILINE)
+
+
+def _ngrams(text: str) -> Counter:
+    words = _NON_LETTERS.sub(" ", _LABEL_LINE.sub(" ", text).lower()).split()
+    counts = Counter()
+    for word in words:
+        padded = f" {word} "
+        for n in NGRAM_ORDERS:
+            for i in range(len(padded) - n + 1):
+                counts[padded[i:i + n]] += 1
+    del counts[" "]
+    return counts
+
+
+@lru_cache(maxsize=1)
+def _profiles() -> tuple[list[str], dict[str, int], np.ndarray, np.ndarray]:
+    """
+    The language codes, the index of each known n-gram, the matrix of log
+    probabilities of the n-grams (languages x n-grams), with add-one
+    smoothing per n-gram order, and the matrix of whether an n-gram is in
+    the profile of a language.
+    """
+    codes = list(LANGUAGE_SAMPLES)
+    kept = {}
+    for code in codes:
+        counts = _ngrams(LANGUAGE_SAMPLES[code])
+        kept[code] = {}
+        for n in NGRAM_ORDERS:
+            of_order = {g: c for g, c in counts.items() if len(g) == n}
+            top = sorted(of_order.items(), key=lambda item: -item[1])
+            kept[code][n] = (
+                dict(top[:PROFILE_SIZE]),
+                sum(of_order.values())
+            )
+
+    vocabulary = sorted({
+        ngram
+        for code in codes
+        for profile, _ in kept[code].values()
+        for ngram in profile
+    })
+    index = {ngram: i for i, ngram in enumerate(vocabulary)}
+    log_probs = np.empty((len(codes), len(vocabulary)), dtype=np.float32)
+    in_profile = np.zeros((len(codes), len(vocabulary)), dtype=bool)
+    for row, code in enumerate(codes):
+        for i, ngram in enumerate(vocabulary):
+            profile, total = kept[code][len(ngram)]
+            log_probs[row, i] = np.log(
+                (profile.get(ngram, 0) + 1) / (total + PROFILE_SIZE)
+            )
+            in_profile[row, i] = ngram in profile
+    return codes, index, log_probs, in_profile
+
+
+def detect_language(text: str) -> tuple[Optional[str], float]:
+    """
+    Identifies the language of a text by its character n-grams (naive
+    Bayes over the profiles of the LANGUAGE_SAMPLES). Lines ending with a
+    colon, i.e. the speaker labels of a transcript, are ignored.
+
+    Args:
+        text (str): A few hundred characters are enough
+
+    Returns:
+        tuple: The language name (see LANGUAGE_NAMES), None if the text
+            contains no known n-grams or is in none of the languages (see
+            MIN_TRIGRAM_COVERAGE), and the confidence between 0 and 1
+    """
+    codes, index, log_probs, in_profile = _profiles()
+    counts = _ngrams(text)
+    columns = [index[ngram] for ngram in counts if ngram in index]
+    if not columns:
+        return None, 0.0
+    weights = np.array(
+        [counts[ngram] for ngram in counts if ngram in index],
+        dtype=np.float32
+    )
+
+    total = weights.sum()
+    scores = log_probs[:, columns] @ weights
+    evidence = EVIDENCE_NGRAMS * min(1.0, total / FULL_EVIDENCE_NGRAMS)
+    scaled = scores / total * evidence
+    posterior = np.exp(scaled - scaled.max())
+    posterior /= posterior.sum()
+    best = int(np.argmax(posterior))
+
+    trigrams = [ngram for ngram in counts if len(ngram) == 3]
+    covered = sum(
+        counts[ngram] for ngram in trigrams
+        if ngram in index and in_profile[best, index[ngram]]
+    )
+    total_trigrams = sum(counts[ngram] for ngram in trigrams)
+    if covered < MIN_TRIGRAM_COVERAGE * total_trigrams:
+        return None, 0.0
+    return LANGUAGE_NAMES[codes[best]], float(posterior[best])
+
+
+def normalize_language(name: str) -> Optional[str]:
+    """The name from LANGUAGE_NAMES for a language name in any form."""
+    cleaned = name.strip().strip(".").lower()
+    for code, language in LANGUAGE_NAMES.items():
+        if cleaned in (language.lower(), code):
+            return language
+    code = LANGUAGE_ALIASES.get(cleaned)
+    return LANGUAGE_NAMES[code] if code else None
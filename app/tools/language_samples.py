@@ -0,0 +1,152 @@
+# Sample texts the character n-gram profiles of app/tools/language_detection.py
+# are built from, one per language, in the register of our meetings. Keyed
+# by ISO 639-1 code.
+LANGUAGE_SAMPLES = {
+    "de": """
+        Also, ich würde vorschlagen, dass wir zuerst kurz die Punkte vom letzten
+        Mal durchgehen und dann über die Planung für das nächste Quartal sprechen.
+        Ich habe mir das noch einmal angeschaut und ich glaube, wir sind mit dem
+        Projekt eigentlich ganz gut im Zeitplan, aber bei den Kosten müssen wir
+        aufpassen. Das ist ein wichtiger Punkt, den wir heute unbedingt klären
+        sollten. Wer kümmert sich denn darum, dass die Zahlen bis Freitag fertig
+        sind? Ja, das kann ich übernehmen, aber ich brauche dafür noch die
+        Unterlagen von der Buchhaltung. Gut, dann schreiben wir das so ins
+        Protokoll. Gibt es sonst noch Fragen oder Anmerkungen zu diesem Thema?
+        Mir ist noch aufgefallen, dass die Abstimmung zwischen den Teams nicht
+        immer so gut funktioniert. Vielleicht sollten wir einen festen Termin
+        in der Woche einrichten, an dem sich alle kurz austauschen können. Das
+        finde ich eine gute Idee, wir müssen nur schauen, dass es nicht zu viele
+        Meetings werden. Ich bin dafür, dass wir es einfach mal ausprobieren und
+        nach einem Monat schauen, ob es sich bewährt hat. Dann halten wir fest:
+        Wir führen ein wöchentliches Treffen ein und besprechen das Ergebnis im
+        nächsten Monat. Vielen Dank euch allen, dann sehen wir uns nächste Woche.
+    """,
+    "en": """
+        Okay, so I would suggest that we first quickly go through the points from
+        last time and then talk about the planning for the next quarter. I had
+        another look at it and I think we are actually quite well on schedule
+        with the project, but we have to be careful with the costs. That is an
+        important point that we should definitely settle today. Who is going to
+        make sure that the numbers are ready by Friday? Yes, I can take care of
+        that, but I still need the documents from accounting. Good, then we will
+        write it down like that in the minutes. Are there any other questions or
+        comments on this topic? I also noticed that the coordination between the
+        teams does not always work that well. Maybe we should set up a fixed
+        slot every week where everyone can briefly share what they are working
+        on. I think that is a good idea, we just have to make sure that it does
+        not turn into too many meetings. I am in favour of simply trying it out
+        and checking after a month whether it has worked. So let's write down:
+        we introduce a weekly meeting and discuss the results next month. Thank
+        you all very much, see you next week.
+    """,
+    "fr": """
+        Alors, je propose que nous passions d'abord rapidement en revue les
+        points de la dernière fois et que nous parlions ensuite de la
+        planification pour le prochain trimestre. J'ai regardé cela encore une
+        fois et je pense que nous sommes en fait plutôt dans les temps avec le
+        projet, mais nous devons faire attention aux coûts. C'est un point
+        important que nous devrions absolument régler aujourd'hui. Qui s'occupe
+        de faire en sorte que les chiffres soient prêts pour vendredi? Oui, je
+        peux m'en charger, mais j'ai encore besoin des documents de la
+        comptabilité. Bien, alors nous l'écrivons comme ça dans le compte rendu.
+        Est-ce qu'il y a d'autres questions ou remarques sur ce sujet? J'ai aussi
+        remarqué que la coordination entre les équipes ne fonctionne pas
+        toujours très bien. Peut-être que nous devrions mettre en place un
+        rendez-vous fixe chaque semaine où tout le monde peut échanger
+        brièvement. Je trouve que c'est une bonne idée, il faut juste veiller à
+        ce que cela ne fasse pas trop de réunions. Je suis pour que nous
+        essayions simplement et que nous regardions après un mois si cela a
+        fonctionné. Merci beaucoup à tous, à la semaine prochaine.
+    """,
+    "es": """
+        Bueno, yo propondría que primero repasemos rápidamente los puntos de la
+        última vez y después hablemos de la planificación para el próximo
+        trimestre. Lo he vuelto a mirar y creo que en realidad vamos bastante
+        bien de tiempo con el proyecto, pero tenemos que tener cuidado con los
+        costes. Es un punto importante que deberíamos aclarar hoy sin falta.
+        ¿Quién se encarga de que las cifras estén listas para el viernes? Sí,
+        yo me puedo encargar, pero todavía necesito los documentos de
+        contabilidad. Bien, entonces lo escribimos así en el acta. ¿Hay alguna
+        otra pregunta o comentario sobre este tema? También me he dado cuenta de
+        que la coordinación entre los equipos no siempre funciona tan bien. Tal
+        vez deberíamos establecer una cita fija cada semana en la que todos
+        puedan ponerse al día brevemente. Me parece una buena idea, solo tenemos
+        que asegurarnos de que no se conviertan en demasiadas reuniones. Yo
+        estoy a favor de que simplemente lo probemos y veamos después de un mes
+        si ha funcionado. Entonces dejamos constancia: introducimos una reunión
+        semanal y hablamos del resultado el mes que viene. Muchas gracias a
+        todos, nos vemos la semana que viene.
+    """,
+    "it": """
+        Allora, io proporrei di ripassare prima velocemente i punti dell'ultima
+        volta e poi di parlare della pianificazione per il prossimo trimestre.
+        Ci ho dato un'altra occhiata e credo che in realtà siamo abbastanza in
+        linea con i tempi del progetto, ma dobbiamo stare attenti ai costi. È un
+        punto importante che dovremmo assolutamente chiarire oggi. Chi si occupa
+        di fare in modo che i numeri siano pronti per venerdì? Sì, posso
+        occuparmene io, ma ho ancora bisogno dei documenti della contabilità.
+        Bene, allora lo scriviamo così nel verbale. Ci sono altre domande o
+        osservazioni su questo argomento? Ho anche notato che il coordinamento
+        tra i gruppi non funziona sempre così bene. Forse dovremmo stabilire un
+        appuntamento fisso ogni settimana in cui tutti possono aggiornarsi
+        brevemente. Mi sembra una buona idea, dobbiamo solo fare attenzione che
+        non diventino troppe riunioni. Io sono favorevole a provarci e a vedere
+        dopo un mese se ha funzionato. Quindi mettiamo per iscritto: introduciamo
+        una riunione settimanale e discutiamo il risultato il mese prossimo.
+        Grazie mille a tutti, ci vediamo la settimana prossima.
+    """,
+    "nl": """
+        Nou, ik zou voorstellen dat we eerst even snel de punten van de vorige
+        keer doorlopen en daarna over de planning voor het volgende kwartaal
+        praten. Ik heb er nog een keer naar gekeken en ik denk dat we eigenlijk
+        best goed op schema liggen met het project, maar we moeten wel opletten
+        met de kosten. Dat is een belangrijk punt dat we vandaag echt moeten
+        afhandelen. Wie zorgt ervoor dat de cijfers vrijdag klaar zijn? Ja, dat
+        kan ik op me nemen, maar ik heb daarvoor nog de stukken van de
+        boekhouding nodig. Goed, dan schrijven we het zo in het verslag. Zijn er
+        verder nog vragen of opmerkingen over dit onderwerp? Het viel me ook op
+        dat de afstemming tussen de teams niet altijd even goed werkt. Misschien
+        moeten we een vast moment in de week afspreken waarop iedereen kort kan
+        vertellen waar hij mee bezig is. Dat vind ik een goed idee, we moeten
+        alleen zorgen dat het niet te veel vergaderingen worden. Ik ben ervoor
+        dat we het gewoon proberen en na een maand kijken of het werkt. Dan
+        leggen we vast: we voeren een wekelijks overleg in en bespreken de
+        uitkomst volgende maand. Heel erg bedankt allemaal, tot volgende week.
+    """,
+    "pt": """
+        Então, eu sugeriria que primeiro revíssemos rapidamente os pontos da
+        última vez e depois falássemos sobre o planejamento para o próximo
+        trimestre. Eu dei mais uma olhada nisso e acho que na verdade estamos
+        bem dentro do prazo com o projeto, mas precisamos ter cuidado com os
+        custos. Esse é um ponto importante que devemos resolver hoje sem falta.
+        Quem vai cuidar para que os números estejam prontos até sexta-feira?
+        Sim, eu posso assumir isso, mas ainda preciso dos documentos da
+        contabilidade. Muito bem, então escrevemos assim na ata. Há mais alguma
+        pergunta ou comentário sobre esse assunto? Eu também percebi que a
+        coordenação entre as equipes nem sempre funciona tão bem. Talvez
+        devêssemos marcar um horário fixo toda semana em que todos possam
+        trocar informações rapidamente. Acho uma boa ideia, só precisamos
+        garantir que não se tornem reuniões demais. Eu sou a favor de
+        simplesmente experimentarmos e vermos depois de um mês se funcionou.
+        Então registramos: introduzimos uma reunião semanal e discutimos o
+        resultado no mês que vem. Muito obrigado a todos, até a próxima semana.
+    """,
+    "pl": """
+        No dobrze, proponuję, żebyśmy najpierw szybko przeszli przez punkty z
+        ostatniego spotkania, a potem porozmawiali o planowaniu na następny
+        kwartał. Jeszcze raz to przejrzałem i myślę, że właściwie jesteśmy
+        całkiem dobrze z harmonogramem projektu, ale musimy uważać na koszty. To
+        jest ważny punkt, który powinniśmy dzisiaj koniecznie wyjaśnić. Kto się
+        zajmie tym, żeby liczby były gotowe do piątku? Tak, mogę to wziąć na
+        siebie, ale potrzebuję jeszcze dokumentów z księgowości. Dobrze, to tak
+        zapiszemy w protokole. Czy są jeszcze jakieś pytania albo uwagi do tego
+        tematu? Zauważyłem też, że współpraca między zespołami nie zawsze
+        działa tak dobrze. Może powinniśmy ustalić stały termin w każdym
+        tygodniu, w którym wszyscy mogą się krótko wymienić informacjami. Uważam,
+        że to dobry pomysł, musimy tylko uważać, żeby nie było za dużo spotkań.
+        Jestem za tym, żebyśmy po prostu spróbowali i po miesiącu sprawdzili,
+        czy to się sprawdziło. Czyli zapisujemy: wprowadzamy cotygodniowe
+        spotkanie i omawiamy wynik w przyszłym miesiącu. Bardzo wam wszystkim
+        dziękuję, do zobaczenia w przyszłym tygodniu.
+    """,
+}
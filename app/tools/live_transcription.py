@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+
+import websockets
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+# Called with {"speaker", "text", "start", "end"} for every final utterance,
+# start and end in milliseconds since the start of the session
+OnUtterance = Callable[[dict], Awaitable[None]]
+
+# Speaker label of backends without speaker diarization
+DEFAULT_SPEAKER = "A"
+
+# Bytes per sample of the 16 bit mono PCM audio streamed by the browser
+SAMPLE_WIDTH = 2
+
+
+class AssemblyAIRealtimeBackend:
+    """
+    Streams 16 bit mono PCM to the AssemblyAI real-time API over a websocket
+    and reports each final transcript as an utterance. The real-time API
+    does not separate speakers, so all utterances get DEFAULT_SPEAKER and
+    the speakers are told apart by the protocol stages only.
+
+    Args:
+        on_utterance: Coroutine function called with every utterance
+        sample_rate (int): Sample rate of the streamed audio
+        url (str): Websocket URL of the real-time API
+        api_key (str): AssemblyAI API key
+    """
+
+    def __init__(
+        self,
+        on_utterance: OnUtterance,
+        sample_rate: int = Config.LIVE_SAMPLE_RATE,
+        url: str = Config.LIVE_TRANSCRIPTION_URL,
+        api_key: str = Config.ASSEMBLYAI_API_KEY
+    ):
+        self._on_utterance = on_utterance
+        self._sample_rate = sample_rate
+        self._url = url
+        self._api_key = api_key
+        self._websocket = None
+        self._receiver = None
+
+    async def start(self) -> None:
+        self._websocket = await websockets.connect(
+            f"{self._url}?sample_rate={self._sample_rate}",
+            additional_headers={"Authorization": self._api_key}
+        )
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def send(self, chunk: bytes) -> None:
+        if self._receiver.done():
+            # Raises the error that ended the session
+            self._receiver.result()
+            raise RuntimeError("The real-time session has ended")
+        await self._websocket.send(chunk)
+
+    async def finish(self) -> None:
+        """Waits for the transcripts of the audio sent so far and closes."""
+        try:
+            await self._websocket.send(json.dumps({"terminate_session": True}))
+            await asyncio.wait_for(
+                self._receiver,
+                timeout=Config.LIVE_FINISH_TIMEOUT_SECONDS
+            )
+        finally:
+            await self._websocket.close()
+
+    async def _receive(self) -> None:
+        async for message in self._websocket:
+            data = json.loads(message)
+            message_type = data.get("message_type")
+            if "error" in data:
+                raise RuntimeError(
+                    f"Real-time transcription failed: {data['error']}"
+                )
+            if message_type == "FinalTranscript" and data.get("text"):
+                await self._on_utterance({
+                    "speaker": DEFAULT_SPEAKER,
+                    "text": data["text"],
+                    "start": data["audio_start"],
+                    "end": data["audio_end"],
+                })
+            elif message_type == "SessionTerminated":
+                return
+
+
+class MockRealtimeBackend:
+    """
+    Stand-in for a real-time backend for local testing without network
+    access. Emits one utterance per utterance_seconds of received audio,
+    alternating between two speakers.
+
+    Args:
+        on_utterance: Coroutine function called with every utterance
+        sample_rate (int): Sample rate of the streamed audio
+        utterance_seconds (float): Audio length of one utterance
+    """
+
+    def __init__(
+        self,
+        on_utterance: OnUtterance,
+        sample_rate: int = Config.LIVE_SAMPLE_RATE,
+        utterance_seconds: float = Config.LIVE_MOCK_UTTERANCE_SECONDS
+    ):
+        self._on_utterance = on_utterance
+        self._bytes_per_ms = sample_rate * SAMPLE_WIDTH / 1000
+        self._utterance_ms = int(utterance_seconds * 1000)
+        self._received_ms = 0
+        self._emitted_ms = 0
+        self._count = 0
+
+    async def start(self) -> None:
+        logger.info("Started mock real-time transcription")
+
+    async def send(self, chunk: bytes) -> None:
+        self._received_ms += len(chunk) / self._bytes_per_ms
+        while self._received_ms - self._emitted_ms >= self._utterance_ms:
+            await self._emit(self._emitted_ms + self._utterance_ms)
+
+    async def finish(self) -> None:
+        if self._received_ms > self._emitted_ms:
+            await self._emit(self._received_ms)
+
+    async def _emit(self, end_ms: float) -> None:
+        speaker = "AB"[self._count % 2]
+        self._count += 1
+        await self._on_utterance({
+            "speaker": speaker,
+            "text": f"Testbeitrag {self._count} von Sprecher {speaker}.",
+            "start": int(self._emitted_ms),
+            "end": int(end_ms),
+        })
+        self._emitted_ms = end_ms
+
+
+LIVE_BACKENDS = {
+    "assemblyai": AssemblyAIRealtimeBackend,
+    "mock": MockRealtimeBackend,
+}
+
+
+def make_live_backend(
+    on_utterance: OnUtterance,
+    name: str = None
+):
+    """The backend configured by LIVE_TRANSCRIPTION_BACKEND."""
+    name = name or Config.LIVE_TRANSCRIPTION_BACKEND
+    if name not in LIVE_BACKENDS:
+        raise ValueError(
+            f"Unknown live transcription backend {name!r}, expected one of "
+            f"{sorted(LIVE_BACKENDS)}"
+        )
+    return LIVE_BACKENDS[name](on_utterance)
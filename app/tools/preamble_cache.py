@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Optional, Union
+
+from config import Config
+from app.tools.audio import AudioProfile, encode_audio
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+# Silence after each participant sample
+GAP_SECONDS = 1.0
+
+
+class PreambleCache:
+    """
+    Encoded speaker-sample preambles on disk, one file per ordered set of
+    participant samples and audio profile. A preamble contains every sample
+    followed by a short silence, so it can be put in front of a recording
+    encoded with the same profile without encoding the recording again
+    (see concatenate_audio in app/tools/audio.py).
+
+    The file name is derived from the sample hashes and the profile, so a
+    changed sample or profile never reuses a stale preamble. Files are
+    written to a temporary name and renamed, which keeps concurrent workers
+    from reading half-written preambles.
+
+    Args:
+        folder (str): Where the preambles are stored
+        max_files (int): Least recently used preambles beyond this number
+            are removed
+    """
+
+    def __init__(
+        self,
+        folder: Union[str, Path],
+        max_files: int = 200
+    ):
+        self._folder = Path(folder)
+        self._max_files = max_files
+        os.makedirs(self._folder, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        sample_sha256s: list[str],
+        profile: AudioProfile
+    ) -> str:
+        return hashlib.sha256(json.dumps([
+            sample_sha256s,
+            list(profile),
+            GAP_SECONDS,
+        ]).encode("utf-8")).hexdigest()
+
+    def get(
+        self,
+        sample_file_paths: list[str],
+        sample_sha256s: list[str],
+        profile: AudioProfile
+    ) -> Path:
+        """
+        The preamble for the given samples, encoding it if it is not cached
+        yet.
+
+        Args:
+            sample_file_paths (list[str]): The samples, in preamble order
+            sample_sha256s (list[str]): The hash of each sample
+            profile (AudioProfile): The format of the preamble
+
+        Returns:
+            Path: The encoded preamble
+        """
+        path = self._folder / (
+            f"{self.make_key(sample_sha256s, profile)}.{profile.extension}"
+        )
+        if path.exists():
+            # Keep the modification time as last use for the eviction
+            os.utime(path)
+            logger.debug(f"Using cached speaker sample preamble {path.name}")
+            return path
+
+        tmp_path = path.with_name(
+            f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            encode_audio(
+                sample_file_paths,
+                tmp_path,
+                profile,
+                gap_seconds=GAP_SECONDS
+            )
+            os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        logger.info(f"Encoded speaker sample preamble {path.name}")
+
+        self.evict()
+        return path
+
+    def evict(self) -> int:
+        files = sorted(
+            (f for f in self._folder.iterdir() if f.suffix != ".tmp"),
+            key=lambda f: f.stat().st_mtime
+        )
+        removed = 0
+        for f in files[:max(0, len(files) - self._max_files)]:
+            try:
+                f.unlink()
+                removed += 1
+            except FileNotFoundError:
+                # Removed by another process
+                pass
+        return removed
+
+
+_preamble_cache: Optional[PreambleCache] = None
+_preamble_cache_lock = threading.Lock()
+
+
+def get_preamble_cache() -> PreambleCache:
+    """The preamble cache of this process."""
+    global _preamble_cache
+    with _preamble_cache_lock:
+        if _preamble_cache is None:
+            _preamble_cache = PreambleCache(
+                Config.PREAMBLE_CACHE_FOLDER,
+                max_files=Config.PREAMBLE_CACHE_MAX_FILES
+            )
+        return _preamble_cache
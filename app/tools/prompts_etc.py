@@ -1,94 +1,123 @@
+# The stages that work on the transcript (speaker mapping, agenda, protocol)
+# share one system prompt and one context block containing the few-shot
+# examples and the transcript. Together they form a stable prefix that is
+# marked with cache_control, so that only the per-stage instruction after it
+# is processed from scratch when several stages run on the same meeting.
+TRANSCRIPT_SYSTEM_PROMPT = (
+    "You are an AI assistant specialized in analyzing meeting transcripts "
+    "and creating meeting agendas and protocols from them. "
+    "You can identify speakers, extract key information, summarize the content "
+    "and infer the agenda and opinions of the participants. "
+    "Always respond in the same language as the transcript, unless asked otherwise. "
+    "Always respond with exactly what is requested, without additional explanations."
+)
+
+TRANSCRIPT_CONTEXT = """
+            The transcript you find below is the transcript of a meeting. It was automatically 
+            transcribed by a speech to text service. The transcription model probably made some 
+            mistakes. For example, it has problems with correctly transcribing numbers and company 
+            names etc. Also, we saw, that sometimes adds the word 'zweitausendeins' or something 
+            similar to the transcript. 
+            Also we found some parts of the transcript where the speaker labels are not aligned 
+            well with who actually spoke. So please be not confused by this. 
+            Further, the first few lines of the transcript may just be from audio samples of the participants.
+            They may not be from the actual meeting and may not fit into the context. Please ignore them, 
+            if they do not make sense.
+
+            Here are some examples for a good agenda: 
+            {agenda_examples} 
+
+            Here are some examples for a good meeting protocol: 
+            {protocol_examples}
+
+            The transcript is: 
+            {transcript} 
+"""
+
+# Long transcripts are summarized in segments (map) whose notes are then
+# combined into the protocol (reduce), see
+# MeetingAudioSummarizer._create_meeting_protocol
+SEGMENT_CONTEXT = """
+            The text below is part {index} of {count} of the transcript of a meeting{time_range}. 
+            It was automatically transcribed by a speech to text service, so it probably contains 
+            some mistakes, e.g. in numbers and company names. Its beginning may repeat the end 
+            of the previous part.
+
+            The part of the transcript is: 
+            {transcript} 
+"""
+
+NOTES_CONTEXT = """
+            The notes you find below were taken from consecutive parts of the transcript of a 
+            meeting, one section per part. Neighbouring parts overlap a little, so a point may 
+            appear at the end of one section and again at the start of the next. 
+
+            Here are some examples for a good meeting protocol: 
+            {protocol_examples}
+
+            The notes are: 
+            {notes} 
+"""
+
 PROMPTS = {
     "speaker_mapping": {
-        "message": """
-            We currently had a meeting and used a speech to text service to transcribe the meeting
-            (the transcription is attached below).
-            The meeting was held in German and the transcription model probably made some mistakes.
-            For example, it has problems with correctly transcribing numbers and company names etc.
-            Also, we saw, that sometimes adds the word 'zweitausendeins' or something similar to the transcript.
-            So please be not confused by this.
-            The transcription tool adde speaker labels to the transcript (like Speaker A, Speaker B and so on)
-            but did not infer the participants names.
+        "instruction": """
+            The transcription tool added speaker labels to the transcript above (like Speaker A, 
+            Speaker B and so on) but did not infer the participants names.
             Please infer which speaker is which participant. The list of participants is:
             {participants}
             Please respond with a JSON object with the following format:
             {example_json}
 
-            Thanks for your help!
-
-            The transcript is:
-            {transcript}
-
             Please respond with the JSON object only.
-        """,
-        "system": (
-            "You are an AI assistant specialized in analyzing meeting transcripts. "
-            "You can identify speakers, extract key information, and format the results as structured JSON. "
-            "Always respond with only the requested JSON format without additional explanations."
-        )
+        """
     },
     "infer_agenda": {
-        "message": """
-            The transcript you find below is the transcript of a meeting. It was automatically 
-            transcribed by a speech to text service. The transcription model probably made some 
-            mistakes. For example, it has problems with correctly transcribing numbers and company 
-            names etc. Also, we saw, that sometimes adds the word 'zweitausendeins' or something 
-            similar to the transcript. 
-            Also, it sometimes happens that the speaker labels of some parts of the transcript 
-            are not aligned well with who actually spoke. So please be not confused by this. 
-            Please infer an agenda from the transcript, i.e., an agenda which the meeting could 
-            have followed. 
-            Please respond with the agenda only and keep it concise and to the point. 
-            The transcript is: 
-            {transcript} 
-            
+        "instruction": """
+            Please infer an agenda from the transcript above, i.e., an agenda which the meeting 
+            could have followed. 
             The topic of the meeting was: {topic} 
-            
-            Here are some examples for a good agenda: 
-            {agenda_examples} 
-        """,
-        "system": (
-            "You are an AI assistant specialized in analyzing meeting transcripts. "
-            "You can extract key information, summarize the content and infer an agenda "
-            "based on the content of the transcript. "
-            "Always respond with an agenda in bullet points. Make it concise and to the point. "
-            "The agenda should always be in the same language as the transcript. "
-            "Please respond with the agenda only."
-        )
+            Always respond with an agenda in bullet points, like the agenda examples above. 
+            Please respond with the agenda only and keep it concise and to the point. 
+        """
     },
     "create_meeting_protocol": {
-        "message": """
-            The transcript you find below is the transcript of a meeting. It was automatically 
-            transcribed by a speech to text service. The transcription model probably made some 
-            mistakes. For example, it has problems with correctly transcribing numbers and company 
-            names etc. Also, we saw, that sometimes adds the word 'zweitausendeins' or something 
-            similar to the transcript. 
-            Also we found some parts of the transcript where the speaker labels are not aligned 
-            well with who actually spoke. So please be not confused by this. 
-            Further, the first few lines of the transcript may just be from audio samples of the participants.
-            They may not be from the actual meeting and may not fit into the context. Please ignore them, 
-            if they do not make sense.
-            Please create a meeting protocol from the transcript and the agenda. In doing so, 
+        "instruction": """
+            Please create a meeting protocol from the transcript above and the agenda below. In doing so, 
             make sure to include all important points that were discussed and the decisions that were made. 
             Further, try to infer the opinions of the participants and what was important to them 
             such that I can send it to everyone afterwards and they are satisfied with the outcome. 
+            Always respond with a meeting protocol in bullet points, like the protocol examples above. 
+            Make it detailed but still to the point. Keep it strictly to what was said in the meeting. 
             The agenda of the meeting is: 
             {agenda} 
-            The transcript is: 
-            {transcript} 
             The date of the meeting was: {date} 
-            
-            Here are some examples for a good meeting protocol: 
-            {protocol_examples}
-        """,
-        "system": (
-            "You are an AI assistant specialized in creating meeting protocols. "
-            "You can create a meeting protocol from a transcript and an agenda. "
-            "Always respond with a meeting protocol in bullet points. "
-            "Make it detailed but still to the point. Keep it strictly to what was said in the meeting. "
-            "And try to correctly infer the opinions of the participants and what was important to them. "
-            "The meeting protocol should always be in the same language as the transcript. "
-        )
+        """
+    },
+    "summarize_segment": {
+        "instruction": """
+            Please take detailed notes of this part of the meeting. Include all points that were 
+            discussed, the arguments and opinions of the participants (with their names) and all 
+            decisions, tasks and open questions. Assign the points to the agenda items below 
+            where possible. 
+            Respond with the notes in bullet points only. Keep it strictly to what was said. 
+            The agenda of the meeting is: 
+            {agenda} 
+        """
+    },
+    "reduce_segment_notes": {
+        "instruction": """
+            Please create a meeting protocol from the notes above and the agenda below. Merge 
+            points that appear in several sections and order them by the agenda. In doing so, 
+            make sure to include all important points that were discussed and the decisions that were made. 
+            Further, try to infer the opinions of the participants and what was important to them 
+            such that I can send it to everyone afterwards and they are satisfied with the outcome. 
+            Always respond with a meeting protocol in bullet points, like the protocol examples above. 
+            Make it detailed but still to the point. Keep it strictly to what is in the notes. 
+            The agenda of the meeting is: 
+            {agenda} 
+            The date of the meeting was: {date} 
+        """
     },
     "create_filename": {
         "message": """
@@ -0,0 +1,390 @@
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import RateLimitBuckets
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+BUCKETS = ("requests", "input_tokens", "output_tokens")
+BLOCKED_UNTIL = "blocked_until"
+
+# Prefix of the rate limit headers sent with every Anthropic API response,
+# e.g. anthropic-ratelimit-input-tokens-remaining
+HEADER_PREFIX = "anthropic-ratelimit-"
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about 4 characters per token)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class InMemoryBucketStore:
+    """
+    Keeps the bucket state of a single process. The state maps a bucket
+    name to a tuple (level, updated_at), where updated_at is a unix
+    timestamp.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def transact(self, func: Callable[[dict], tuple[dict, object]]):
+        """
+        Calls func with the current state and stores the state it returns,
+        atomically with respect to all other callers.
+        """
+        with self._lock:
+            new_state, result = func(dict(self._state))
+            self._state.update(new_state)
+            return result
+
+
+class DatabaseBucketStore:
+    """
+    Keeps the bucket state in a database table, so that all gunicorn workers,
+    scheduler threads and worker processes share one budget.
+
+    On PostgreSQL the bucket rows are locked with SELECT ... FOR UPDATE for
+    the duration of a transaction. SQLite has no row locks, so there the
+    transaction is serialized with a file lock instead (all processes using
+    the same SQLite file run on the same host).
+
+    Args:
+        engine: SQLAlchemy engine of the database
+        table: Table with the columns name, level and updated_at
+        names (tuple): Names of all buckets stored in the table
+        lock_file (str): File used for locking on SQLite
+    """
+
+    def __init__(
+        self,
+        engine,
+        table,
+        names: tuple,
+        lock_file: str = None
+    ):
+        self._engine = engine
+        self._table = table
+        self._names = tuple(names)
+        self._use_file_lock = engine.dialect.name == "sqlite"
+        self._lock_file = lock_file or os.path.join(
+            Config.RATE_LIMIT_LOCK_FOLDER, "rate_limit_buckets.lock"
+        )
+        self._rows_ensured = False
+
+    def _ensure_rows(self) -> None:
+        # Rows must exist before they can be locked. A NULL level means the
+        # bucket was never used and is full.
+        if self._rows_ensured:
+            return
+        with self._engine.begin() as conn:
+            existing = set(conn.execute(
+                select(self._table.c.name).where(
+                    self._table.c.name.in_(self._names)
+                )
+            ).scalars())
+        for name in self._names:
+            if name in existing:
+                continue
+            try:
+                with self._engine.begin() as conn:
+                    conn.execute(insert(self._table).values(name=name))
+            except IntegrityError:
+                # Another process inserted it in the meantime
+                pass
+        self._rows_ensured = True
+
+    @contextmanager
+    def _file_lock(self):
+        if not self._use_file_lock:
+            yield
+            return
+        with open(self._lock_file, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def transact(self, func: Callable[[dict], tuple[dict, object]]):
+        self._ensure_rows()
+        with self._file_lock(), self._engine.begin() as conn:
+            rows = conn.execute(
+                select(self._table).where(
+                    self._table.c.name.in_(self._names)
+                ).with_for_update()
+            ).all()
+            state = {
+                row.name: (row.level, row.updated_at)
+                for row in rows if row.level is not None
+            }
+            new_state, result = func(state)
+            for name, (level, updated_at) in new_state.items():
+                conn.execute(
+                    update(self._table)
+                    .where(self._table.c.name == name)
+                    .values(level=level, updated_at=updated_at)
+                )
+            return result
+
+
+class TokenBucketRateLimiter:
+    """
+    Token buckets for requests, input tokens and output tokens per period.
+
+    Callers reserve their estimated usage before a request (and wait only if
+    a bucket is exhausted) and report the actual usage plus the rate limit
+    response headers afterwards. The headers are authoritative: they lower
+    the local budget if the API has seen more usage than we have, and they
+    update the capacities if our limits change.
+
+    Args:
+        limits (dict): Capacity per bucket name, see BUCKETS
+        store: Where the bucket state lives (default: InMemoryBucketStore)
+        period (float): Seconds in which an empty bucket refills completely
+    """
+
+    def __init__(
+        self,
+        limits: dict,
+        store=None,
+        period: float = 60.0
+    ):
+        self._limits = dict(limits)
+        self._store = store if store is not None else InMemoryBucketStore()
+        self._period = period
+
+    def _refilled(self, state: dict, name: str, now: float) -> float:
+        capacity = self._limits[name]
+        level, updated_at = state.get(name, (capacity, now))
+        elapsed = max(0.0, now - updated_at)
+        return min(capacity, level + elapsed * capacity / self._period)
+
+    def _amounts(self, input_tokens: int, output_tokens: int) -> dict:
+        # Never ask for more than a full bucket, otherwise we wait forever.
+        # The difference is settled in record().
+        return {
+            "requests": min(1, self._limits["requests"]),
+            "input_tokens": min(input_tokens, self._limits["input_tokens"]),
+            "output_tokens": min(output_tokens, self._limits["output_tokens"]),
+        }
+
+    def reserve(self, input_tokens: int, output_tokens: int) -> float:
+        """
+        Takes the given amounts from the buckets if all of them have enough
+        budget left.
+
+        Returns:
+            float: 0 if the budget was reserved, otherwise the number of
+                seconds to wait before trying again (nothing is reserved)
+        """
+        amounts = self._amounts(input_tokens, output_tokens)
+
+        def take(state):
+            now = time.time()
+            blocked_until = state.get(BLOCKED_UNTIL, (0, 0))[1]
+            if blocked_until > now:
+                return {}, blocked_until - now
+
+            levels = {name: self._refilled(state, name, now) for name in BUCKETS}
+            wait_seconds = max(
+                (amounts[name] - levels[name])
+                * self._period / self._limits[name]
+                for name in BUCKETS
+            )
+            if wait_seconds > 0:
+                return {}, wait_seconds
+
+            return {
+                name: (levels[name] - amounts[name], now) for name in BUCKETS
+            }, 0.0
+
+        return self._store.transact(take)
+
+    def acquire(self, input_tokens: int, output_tokens: int) -> None:
+        """Blocks until the estimated usage fits into the budget."""
+        while True:
+            wait_seconds = self.reserve(input_tokens, output_tokens)
+            if wait_seconds <= 0:
+                return
+            logger.info(
+                f"Anthropic rate limit budget exhausted, waiting "
+                f"{wait_seconds:.1f} seconds"
+            )
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, input_tokens: int, output_tokens: int) -> None:
+        """
+        Like acquire(), but yields to the event loop while waiting. The
+        reservation itself locks the shared state (database row or file), so
+        it runs in the loop's executor.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            wait_seconds = await loop.run_in_executor(
+                None,
+                self.reserve,
+                input_tokens,
+                output_tokens
+            )
+            if wait_seconds <= 0:
+                return
+            logger.info(
+                f"Anthropic rate limit budget exhausted, waiting "
+                f"{wait_seconds:.1f} seconds"
+            )
+            await asyncio.sleep(wait_seconds)
+
+    def record(
+        self,
+        reserved_input_tokens: int,
+        reserved_output_tokens: int,
+        usage=None,
+        headers=None
+    ) -> None:
+        """
+        Settles a reservation with the actual usage of the request and the
+        rate limit headers of its response.
+
+        Args:
+            reserved_input_tokens (int): Input tokens passed to acquire()
+            reserved_output_tokens (int): Output tokens passed to acquire()
+            usage: The usage of the response (None if the request failed)
+            headers: The response headers (None if there was no response)
+        """
+        reserved = self._amounts(reserved_input_tokens, reserved_output_tokens)
+        header_values = self._parse_headers(headers) if headers else {}
+
+        for name, values in header_values.items():
+            if name in BUCKETS and values.get("limit"):
+                self._limits[name] = values["limit"]
+
+        def settle(state):
+            now = time.time()
+            new_state = {}
+            for name in BUCKETS:
+                level = self._refilled(state, name, now)
+                if usage is not None and name != "requests":
+                    actual = self._usage_amount(usage, name)
+                    level += reserved[name] - actual
+                remaining = header_values.get(name, {}).get("remaining")
+                if remaining is not None:
+                    level = min(level, remaining)
+                new_state[name] = (level, now)
+
+            retry_after = header_values.get("retry_after")
+            if retry_after:
+                new_state[BLOCKED_UNTIL] = (0, now + retry_after)
+            return new_state, None
+
+        self._store.transact(settle)
+
+    @staticmethod
+    def _usage_amount(usage, name: str) -> int:
+        # input_tokens only counts the uncached part of the prompt. Writing
+        # to the prompt cache counts towards the input token limit, reading
+        # from it does not.
+        amount = getattr(usage, name) or 0
+        if name == "input_tokens":
+            amount += getattr(usage, "cache_creation_input_tokens", None) or 0
+        return amount
+
+    def _parse_headers(self, headers) -> dict:
+        values = {}
+        for name in BUCKETS:
+            bucket = {}
+            for field in ("limit", "remaining"):
+                raw = headers.get(
+                    f"{HEADER_PREFIX}{name.replace('_', '-')}-{field}"
+                )
+                if raw is not None:
+                    try:
+                        bucket[field] = int(raw)
+                    except ValueError:
+                        pass
+            values[name] = bucket
+
+        retry_after = headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                values["retry_after"] = float(retry_after)
+            except ValueError:
+                pass
+        return values
+
+    def budget(self) -> dict:
+        """Current budget per bucket, e.g. for monitoring."""
+
+        def read(state):
+            now = time.time()
+            budget = {}
+            for name in BUCKETS:
+                available = self._refilled(state, name, now)
+                budget[name] = {
+                    "capacity": self._limits[name],
+                    "available": round(available, 1),
+                    "utilization": round(
+                        1 - available / self._limits[name], 3
+                    ),
+                }
+            blocked_until = state.get(BLOCKED_UNTIL, (0, 0))[1]
+            budget[BLOCKED_UNTIL] = (
+                datetime.fromtimestamp(blocked_until).isoformat()
+                if blocked_until > now else None
+            )
+            return {}, budget
+
+        return self._store.transact(read)
+
+
+def anthropic_limits_from_config() -> dict:
+    return {
+        "requests": Config.ANTHROPIC_REQUESTS_PER_MINUTE,
+        "input_tokens": Config.ANTHROPIC_INPUT_TOKENS_PER_MINUTE,
+        "output_tokens": Config.ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE,
+    }
+
+
+_anthropic_rate_limiter: Optional[TokenBucketRateLimiter] = None
+_anthropic_rate_limiter_lock = threading.Lock()
+
+
+def get_anthropic_rate_limiter() -> TokenBucketRateLimiter:
+    """
+    The rate limiter shared by all Anthropic calls of this process. With
+    RATE_LIMIT_STORE = "database" (default) its budget is also shared with
+    all other processes using the same database. Must be called within an
+    app context the first time.
+    """
+    global _anthropic_rate_limiter
+    with _anthropic_rate_limiter_lock:
+        if _anthropic_rate_limiter is None:
+            if Config.RATE_LIMIT_STORE == "database":
+                store = DatabaseBucketStore(
+                    db.engine,
+                    RateLimitBuckets.__table__,
+                    BUCKETS + (BLOCKED_UNTIL,)
+                )
+            else:
+                store = InMemoryBucketStore()
+            _anthropic_rate_limiter = TokenBucketRateLimiter(
+                anthropic_limits_from_config(),
+                store=store
+            )
+        return _anthropic_rate_limiter
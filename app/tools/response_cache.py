@@ -0,0 +1,219 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import LlmResponseCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM responses, keyed by a hash of the complete
+    request. Entries expire after ttl_seconds. When the cache holds more
+    than max_entries entries or max_bytes bytes, the least recently used
+    entries are evicted.
+
+    Uses its own connections instead of the Flask-SQLAlchemy session, so it
+    can be used from any thread and by concurrent worker processes.
+
+    Args:
+        engine: SQLAlchemy engine of the database
+        table: Table with the columns of LlmResponseCache
+        ttl_seconds (int): Maximum age of an entry
+        max_entries (int): Maximum number of entries
+        max_bytes (int): Maximum total size of the responses
+        evict_every (int): Run the eviction after this many writes
+    """
+
+    def __init__(
+        self,
+        engine,
+        table,
+        ttl_seconds: int,
+        max_entries: int,
+        max_bytes: int,
+        evict_every: int = 100
+    ):
+        self._engine = engine
+        self._table = table
+        self._ttl = timedelta(seconds=ttl_seconds)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._evict_every = evict_every
+
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                request,
+                sort_keys=True,
+                ensure_ascii=False,
+                default=str
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        table = self._table
+        now = datetime.now()
+        with self._engine.begin() as conn:
+            row = conn.execute(
+                select(table.c.response, table.c.created_at)
+                .where(table.c.cache_key == key)
+            ).first()
+            if row is not None and row.created_at < now - self._ttl:
+                conn.execute(delete(table).where(table.c.cache_key == key))
+                row = None
+            if row is not None:
+                conn.execute(
+                    update(table)
+                    .where(table.c.cache_key == key)
+                    .values(
+                        hit_count=table.c.hit_count + 1,
+                        last_accessed_at=now
+                    )
+                )
+
+        with self._lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return row.response if row is not None else None
+
+    def put(
+        self,
+        key: str,
+        response: str,
+        model: str = None
+    ) -> None:
+        now = datetime.now()
+        values = dict(
+            cache_key=key,
+            model=model,
+            response=response,
+            size_bytes=len(response.encode("utf-8")),
+            hit_count=0,
+            created_at=now,
+            last_accessed_at=now
+        )
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(insert(self._table).values(**values))
+        except IntegrityError:
+            # Another worker cached the same request in the meantime
+            with self._engine.begin() as conn:
+                conn.execute(
+                    update(self._table)
+                    .where(self._table.c.cache_key == key)
+                    .values(
+                        response=response,
+                        size_bytes=values["size_bytes"],
+                        created_at=now,
+                        last_accessed_at=now
+                    )
+                )
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % self._evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Removes expired entries and enforces the size limits."""
+        table = self._table
+        removed = 0
+        with self._engine.begin() as conn:
+            removed += conn.execute(
+                delete(table).where(
+                    table.c.created_at < datetime.now() - self._ttl
+                )
+            ).rowcount
+
+            entries, total_bytes = conn.execute(
+                select(func.count(), func.coalesce(func.sum(table.c.size_bytes), 0))
+            ).one()
+            if entries <= self._max_entries and total_bytes <= self._max_bytes:
+                return removed
+
+            # Walk from the least recently used entry until both limits hold
+            to_remove = []
+            for key, size in conn.execute(
+                select(table.c.cache_key, table.c.size_bytes)
+                .order_by(table.c.last_accessed_at)
+            ):
+                if (
+                    entries <= self._max_entries
+                    and total_bytes <= self._max_bytes
+                ):
+                    break
+                to_remove.append(key)
+                entries -= 1
+                total_bytes -= size
+            for start in range(0, len(to_remove), 500):
+                removed += conn.execute(
+                    delete(table).where(
+                        table.c.cache_key.in_(to_remove[start:start + 500])
+                    )
+                ).rowcount
+
+        if removed:
+            logger.info(f"Evicted {removed} LLM cache entries")
+        return removed
+
+    def stats(self) -> dict:
+        table = self._table
+        with self._engine.begin() as conn:
+            entries, total_bytes = conn.execute(
+                select(func.count(), func.coalesce(func.sum(table.c.size_bytes), 0))
+            ).one()
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "entries": entries,
+            "bytes": int(total_bytes),
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "ttl_seconds": int(self._ttl.total_seconds()),
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    The LLM response cache of this process. Must be called within an app
+    context the first time. Hit and miss counters are per process.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                db.engine,
+                LlmResponseCache.__table__,
+                ttl_seconds=Config.LLM_CACHE_TTL_SECONDS,
+                max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+                max_bytes=Config.LLM_CACHE_MAX_BYTES
+            )
+        return _response_cache
@@ -0,0 +1,221 @@
+import logging
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from config import Config
+from app.tools.audio import decode_pcm
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+EMBEDDING_SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+N_FFT = 512
+N_MELS = 40
+N_CEPSTRA = 20
+# Share of the frames with the lowest energy that is ignored as silence
+SILENT_FRAME_QUANTILE = 0.3
+
+
+def _mel_filterbank(
+    sample_rate: int = EMBEDDING_SAMPLE_RATE,
+    n_fft: int = N_FFT,
+    n_mels: int = N_MELS
+) -> np.ndarray:
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    mels = np.linspace(hz_to_mel(0), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mels) / sample_rate).astype(int)
+    filterbank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for i in range(n_mels):
+        left, center, right = bins[i], bins[i + 1], bins[i + 2]
+        if center > left:
+            filterbank[i, left:center] = (
+                np.arange(left, center) - left
+            ) / (center - left)
+        if right > center:
+            filterbank[i, center:right] = (
+                right - np.arange(center, right)
+            ) / (right - center)
+    return filterbank
+
+
+def _dct_matrix(
+    n_cepstra: int = N_CEPSTRA,
+    n_mels: int = N_MELS
+) -> np.ndarray:
+    # Orthonormal DCT-II, the first n_cepstra rows
+    k = np.arange(n_cepstra)[:, None]
+    n = np.arange(n_mels)[None, :]
+    matrix = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels))
+    matrix *= np.sqrt(2 / n_mels)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+_FILTERBANK = _mel_filterbank()
+_DCT = _dct_matrix()
+
+
+def compute_embedding(
+    samples: np.ndarray,
+    sample_rate: int = EMBEDDING_SAMPLE_RATE
+) -> Optional[np.ndarray]:
+    """
+    A compact spectral voice embedding: mean and standard deviation of the
+    cepstral coefficients (without the energy coefficient) over all voiced
+    frames, normalized to unit length.
+
+    Args:
+        samples (np.ndarray): Mono audio as floats in [-1, 1]
+        sample_rate (int): Must be EMBEDDING_SAMPLE_RATE
+
+    Returns:
+        np.ndarray: float32 vector of length 2 * (N_CEPSTRA - 1), None if
+            the audio is shorter than a frame, e.g. a speaker who only said
+            a short word
+    """
+    if sample_rate != EMBEDDING_SAMPLE_RATE:
+        raise ValueError(f"Expected {EMBEDDING_SAMPLE_RATE} Hz audio")
+    frame_length = int(FRAME_SECONDS * sample_rate)
+    hop_length = int(HOP_SECONDS * sample_rate)
+    if len(samples) < frame_length:
+        return None
+
+    n_frames = 1 + (len(samples) - frame_length) // hop_length
+    indices = (
+        np.arange(frame_length)[None, :]
+        + hop_length * np.arange(n_frames)[:, None]
+    )
+    frames = samples[indices] * np.hanning(frame_length).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames, N_FFT)) ** 2
+
+    energy = power.sum(axis=1)
+    voiced = energy > np.quantile(energy, SILENT_FRAME_QUANTILE)
+    if voiced.sum() < 10:
+        voiced = np.ones_like(voiced)
+
+    log_mel = np.log(power[voiced] @ _FILTERBANK.T + 1e-10)
+    cepstra = (log_mel @ _DCT.T)[:, 1:]
+    embedding = np.concatenate([cepstra.mean(axis=0), cepstra.std(axis=0)])
+    return (embedding / np.linalg.norm(embedding)).astype(np.float32)
+
+
+def file_embedding(
+    file_path: Union[str, Path],
+    segments: Optional[list[tuple[float, float]]] = None
+) -> Optional[np.ndarray]:
+    """
+    The voice embedding of a recording, or of the given (start, end) parts
+    of it in seconds. None if there is too little audio.
+    """
+    pcm = decode_pcm(file_path, EMBEDDING_SAMPLE_RATE, segments)
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768
+    return compute_embedding(samples)
+
+
+def embedding_to_bytes(embedding: np.ndarray) -> bytes:
+    return embedding.astype("<f4").tobytes()
+
+
+def embedding_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<f4")
+
+
+def speaker_segments(
+    utterances: Iterable[dict],
+    max_seconds: float
+) -> dict[str, list[tuple[float, float]]]:
+    """
+    The parts of the recording used for each speaker's embedding: the
+    speaker's longest utterances up to max_seconds in total, in recording
+    order. Utterances without timestamps or before the recording (in a
+    prepended preamble) are ignored.
+
+    Args:
+        utterances (Iterable[dict]): speaker, start and end (milliseconds)
+        max_seconds (float): Audio per speaker
+
+    Returns:
+        dict: (start, end) in seconds by speaker label
+    """
+    by_speaker = {}
+    for utterance in utterances:
+        start, end = utterance.get("start"), utterance.get("end")
+        if start is None or end is None or start < 0 or end <= start:
+            continue
+        by_speaker.setdefault(utterance["speaker"], []).append(
+            (start / 1000, end / 1000)
+        )
+
+    segments = {}
+    for speaker, spans in by_speaker.items():
+        chosen, total = [], 0.0
+        for start, end in sorted(spans, key=lambda s: s[0] - s[1]):
+            if total >= max_seconds:
+                break
+            end = min(end, start + max_seconds - total)
+            chosen.append((start, end))
+            total += end - start
+        segments[speaker] = sorted(chosen)
+    return segments
+
+
+def match_speakers(
+    speaker_embeddings: dict[str, np.ndarray],
+    participant_embeddings: dict[str, np.ndarray],
+    min_similarity: float
+) -> dict[str, str]:
+    """
+    Assigns diarized speakers to participants by the cosine similarity of
+    their embeddings, best pairs first, each participant at most once.
+
+    With at least three embeddings, the mean of all of them is subtracted
+    first. This removes what all voices (and the microphone) have in
+    common, which otherwise makes every pair look similar.
+
+    Args:
+        speaker_embeddings (dict): Embedding by speaker label
+        participant_embeddings (dict): Embedding by participant name
+        min_similarity (float): Pairs below this similarity stay unmatched
+
+    Returns:
+        dict: Participant name by speaker label, for matched speakers only
+    """
+    if not speaker_embeddings or not participant_embeddings:
+        return {}
+    speakers = list(speaker_embeddings)
+    names = list(participant_embeddings)
+    speaker_matrix = np.stack([speaker_embeddings[s] for s in speakers])
+    participant_matrix = np.stack([participant_embeddings[n] for n in names])
+
+    if len(speakers) + len(names) >= 3:
+        center = np.vstack([speaker_matrix, participant_matrix]).mean(axis=0)
+        speaker_matrix = speaker_matrix - center
+        participant_matrix = participant_matrix - center
+    speaker_matrix /= np.linalg.norm(speaker_matrix, axis=1, keepdims=True) + 1e-10
+    participant_matrix /= (
+        np.linalg.norm(participant_matrix, axis=1, keepdims=True) + 1e-10
+    )
+    similarity = speaker_matrix @ participant_matrix.T
+
+    matches = {}
+    for flat_index in np.argsort(similarity, axis=None)[::-1]:
+        i, j = np.unravel_index(flat_index, similarity.shape)
+        if similarity[i, j] < min_similarity:
+            break
+        if speakers[i] in matches or names[j] in matches.values():
+            continue
+        matches[speakers[i]] = names[j]
+        logger.debug(
+            f"Speaker {speakers[i]} is {names[j]} "
+            f"(similarity {similarity[i, j]:.2f})"
+        )
+    return matches
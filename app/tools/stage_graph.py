@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+import inspect
+from typing import Any, Callable, Iterable, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class StageGraphError(Exception):
+    pass
+
+
+class Stage:
+    """
+    A single pipeline step with explicitly named inputs and outputs.
+
+    Args:
+        name (str): Unique name of the stage
+        func (Callable): Called with the inputs as keyword arguments. Returns
+            the value of the single output, a tuple with one value per
+            output, or None if the stage has no outputs.
+        inputs (Iterable[str]): Context keys the stage depends on
+        outputs (Iterable[str]): Context keys the stage produces
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        inputs: Iterable[str] = (),
+        outputs: Iterable[str] = ()
+    ):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def outputs_from(self, result: Any) -> dict:
+        if len(self.outputs) == 0:
+            return {}
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        return dict(zip(self.outputs, result))
+
+    def __repr__(self):
+        return f"<Stage {self.name}: {self.inputs} -> {self.outputs}>"
+
+
+class StageGraph:
+    """
+    A declarative graph of stages. A stage becomes runnable as soon as all
+    of its inputs are available in the context, so independent stages run
+    concurrently and the wall-clock time is bounded by the critical path.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self._stages = list(stages)
+        self._producers = {}
+        names = set()
+        for stage in self._stages:
+            if stage.name in names:
+                raise StageGraphError(f"Duplicate stage name: {stage.name}")
+            names.add(stage.name)
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise StageGraphError(
+                        f"Output '{output}' is produced by both "
+                        f"'{self._producers[output].name}' and '{stage.name}'"
+                    )
+                self._producers[output] = stage
+
+    @property
+    def stages(self) -> list[Stage]:
+        return list(self._stages)
+
+    def plan(
+        self,
+        available: Iterable[str],
+        targets: Optional[Iterable[str]] = None
+    ) -> list[Stage]:
+        """
+        The stages needed to produce the targets, given the keys that are
+        already available. Stages whose outputs nobody needs are skipped,
+        e.g. the transcription when a transcript was loaded from a
+        checkpoint.
+
+        Args:
+            available (Iterable[str]): Keys already in the context
+            targets (Iterable[str]): Keys to produce (default: all outputs
+                that no stage consumes)
+        """
+        available = set(available)
+        if targets is None:
+            consumed = {key for stage in self._stages for key in stage.inputs}
+            targets = [key for key in self._producers if key not in consumed]
+
+        needed_stages = set()
+        missing = [key for key in targets if key not in available]
+        while missing:
+            key = missing.pop()
+            stage = self._producers.get(key)
+            if stage is None:
+                raise StageGraphError(f"No stage produces '{key}'")
+            if stage.name in needed_stages:
+                continue
+            needed_stages.add(stage.name)
+            missing.extend(k for k in stage.inputs if k not in available)
+
+        return [stage for stage in self._stages if stage.name in needed_stages]
+
+    def downstream_stages(self, stage_name: str) -> set[str]:
+        """The names of the given stage and of all stages depending on it."""
+        if stage_name not in {stage.name for stage in self._stages}:
+            raise StageGraphError(f"Unknown stage: {stage_name}")
+        outputs = set()
+        affected = {stage_name}
+        changed = True
+        while changed:
+            changed = False
+            for stage in self._stages:
+                if stage.name not in affected and any(
+                    key in outputs for key in stage.inputs
+                ):
+                    affected.add(stage.name)
+                if stage.name in affected and not outputs.issuperset(
+                    stage.outputs
+                ):
+                    outputs.update(stage.outputs)
+                    changed = True
+        return affected
+
+    def downstream_outputs(self, stage_name: str) -> set[str]:
+        """The outputs of the given stage and of all stages depending on it."""
+        affected = self.downstream_stages(stage_name)
+        return {
+            key
+            for stage in self._stages if stage.name in affected
+            for key in stage.outputs
+        }
+
+    def _check_satisfiable(
+        self,
+        available: Iterable[str],
+        stages: list[Stage]
+    ) -> None:
+        available = set(available)
+        remaining = list(stages)
+        while remaining:
+            ready = [
+                stage for stage in remaining
+                if all(key in available for key in stage.inputs)
+            ]
+            if not ready:
+                missing = {
+                    stage.name: [k for k in stage.inputs if k not in available]
+                    for stage in remaining
+                }
+                raise StageGraphError(
+                    f"Stages can never run, missing inputs: {missing}"
+                )
+            for stage in ready:
+                available.update(stage.outputs)
+                remaining.remove(stage)
+
+    def run(
+        self,
+        context: dict,
+        max_workers: int = 4,
+        on_stage_done: Optional[Callable[[str, dict], None]] = None,
+        targets: Optional[Iterable[str]] = None
+    ) -> dict:
+        """
+        Runs all stages on a bounded thread pool.
+
+        Args:
+            context (dict): Initial values, keyed like the stage inputs
+            max_workers (int): Maximum number of stages running at once
+            on_stage_done (Callable): Called in the calling thread with the
+                stage name and its outputs after each stage finished. Use it
+                for work that must not leave the calling thread, e.g.
+                database commits.
+            targets (Iterable[str]): Keys to produce, see plan()
+
+        Returns:
+            dict: The context including all stage outputs
+        """
+        context = dict(context)
+        pending = self.plan(context, targets)
+        self._check_satisfiable(context, pending)
+
+        running = {}
+        pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="stage"
+        )
+        try:
+            while pending or running:
+                for stage in [
+                    s for s in pending
+                    if all(key in context for key in s.inputs)
+                ]:
+                    pending.remove(stage)
+                    kwargs = {key: context[key] for key in stage.inputs}
+                    logger.debug(f"Starting stage {stage.name}")
+                    running[pool.submit(stage.func, **kwargs)] = stage
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        logger.error(f"Stage {stage.name} failed")
+                        raise
+                    outputs = stage.outputs_from(result)
+                    context.update(outputs)
+                    logger.debug(f"Finished stage {stage.name}")
+                    if on_stage_done is not None:
+                        on_stage_done(stage.name, outputs)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        return context
+
+    async def run_async(
+        self,
+        context: dict,
+        max_concurrency: int = 4,
+        on_stage_done: Optional[Callable[[str, dict], None]] = None,
+        targets: Optional[Iterable[str]] = None
+    ) -> dict:
+        """
+        Like run(), but on the running event loop. Coroutine functions are
+        awaited, plain functions run in the loop's default executor.
+        on_stage_done is called on the event loop; if it returns an
+        awaitable, that is awaited before the next stage is started.
+        """
+        context = dict(context)
+        pending = self.plan(context, targets)
+        self._check_satisfiable(context, pending)
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_stage(stage, kwargs):
+            async with semaphore:
+                if inspect.iscoroutinefunction(stage.func):
+                    return await stage.func(**kwargs)
+                return await loop.run_in_executor(
+                    None, partial(stage.func, **kwargs)
+                )
+
+        running = {}
+        try:
+            while pending or running:
+                for stage in [
+                    s for s in pending
+                    if all(key in context for key in s.inputs)
+                ]:
+                    pending.remove(stage)
+                    kwargs = {key: context[key] for key in stage.inputs}
+                    logger.debug(f"Starting stage {stage.name}")
+                    task = asyncio.create_task(run_stage(stage, kwargs))
+                    running[task] = stage
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    stage = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception:
+                        logger.error(f"Stage {stage.name} failed")
+                        raise
+                    outputs = stage.outputs_from(result)
+                    context.update(outputs)
+                    logger.debug(f"Finished stage {stage.name}")
+                    if on_stage_done is not None:
+                        persisted = on_stage_done(stage.name, outputs)
+                        if inspect.isawaitable(persisted):
+                            await persisted
+        finally:
+            for task in running:
+                task.cancel()
+
+        return context
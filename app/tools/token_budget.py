@@ -0,0 +1,267 @@
+from collections import namedtuple
+from datetime import datetime
+import logging
+import math
+import threading
+from typing import Optional
+
+from sqlalchemy import case, func, insert, select
+
+from app import db
+from app.models import LlmUsage
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+# Output budget of a stage: ratio of the input tokens, clamped to
+# [minimum, maximum]
+StageBudget = namedtuple("StageBudget", ["ratio", "minimum", "maximum"])
+
+STAGE_BUDGETS = {
+    # A language name or a filename, independent of the input
+    "infer_language": StageBudget(0, 10, 10),
+    "create_filename": StageBudget(0, 100, 100),
+    "infer_agenda": StageBudget(0.02, 300, 1500),
+    "create_meeting_protocol": StageBudget(0.15, 2000, 8000),
+    "summarize_segment": StageBudget(0.15, 500, 3000),
+    # The protocol is rewritten, so the output is about as long as the input
+    "ensure_language": StageBudget(1.2, 500, 8000),
+    "ensure_markdown": StageBudget(1.2, 500, 8000),
+}
+DEFAULT_BUDGET = StageBudget(0.5, 500, 4000)
+
+# output_limit: the largest max_tokens of the plan, see
+# TokenBudgetPlanner.plan()
+TokenPlan = namedtuple(
+    "TokenPlan",
+    ["stage", "input_tokens", "max_tokens", "output_limit"]
+)
+
+
+class PromptTooLarge(Exception):
+    """The prompt leaves too little of the context window for the output."""
+
+    def __init__(
+        self,
+        stage: str,
+        input_tokens: int,
+        context_tokens: int
+    ):
+        super().__init__(
+            f"The prompt of stage {stage} has about {input_tokens} tokens, "
+            f"the context window only {context_tokens}"
+        )
+        self.stage = stage
+        self.input_tokens = input_tokens
+
+
+class TokenBudgetPlanner:
+    """
+    Chooses max_tokens for each LLM request from its stage and the number of
+    input tokens, and records the planned against the actual usage in the
+    database, so the stage budgets can be tuned (see usage_by_stage()).
+
+    Uses its own connections instead of the Flask-SQLAlchemy session, so it
+    can be used from any thread.
+
+    Args:
+        engine: SQLAlchemy engine of the database
+        table: Table with the columns of LlmUsage
+        context_tokens (int): Context window of the model (input and output)
+        max_output_tokens (int): Upper limit of max_tokens, also when a
+            truncated response is repeated
+        budgets (dict): StageBudget by stage name
+    """
+
+    def __init__(
+        self,
+        engine,
+        table,
+        context_tokens: int,
+        max_output_tokens: int,
+        budgets: dict = STAGE_BUDGETS
+    ):
+        self._engine = engine
+        self._table = table
+        self._context_tokens = context_tokens
+        self._max_output_tokens = max_output_tokens
+        self._budgets = budgets
+
+        self._lock = threading.Lock()
+        self._truncated = 0
+
+    def _budget(self, stage: Optional[str]) -> StageBudget:
+        return self._budgets.get(stage, DEFAULT_BUDGET)
+
+    def _output_limit(
+        self,
+        input_tokens: int,
+        model_max_output_tokens: Optional[int] = None
+    ) -> int:
+        return min(
+            self._max_output_tokens,
+            model_max_output_tokens or self._max_output_tokens,
+            self._context_tokens - input_tokens
+        )
+
+    def fits(
+        self,
+        stage: Optional[str],
+        input_tokens: int,
+        model_max_output_tokens: Optional[int] = None
+    ) -> bool:
+        """Whether a prompt of input_tokens leaves room for the output."""
+        return self._output_limit(
+            input_tokens,
+            model_max_output_tokens
+        ) >= self._budget(stage).minimum
+
+    def plan(
+        self,
+        stage: Optional[str],
+        input_tokens: int,
+        model_max_output_tokens: Optional[int] = None
+    ) -> TokenPlan:
+        """
+        Args:
+            stage (str): Name of the pipeline stage
+            input_tokens (int): Size of the prompt
+            model_max_output_tokens (int): Output limit of the model, if
+                lower than max_output_tokens
+
+        Raises:
+            PromptTooLarge: If the stage's minimum output does not fit
+                into the context window next to the prompt
+        """
+        if not self.fits(stage, input_tokens, model_max_output_tokens):
+            raise PromptTooLarge(stage, input_tokens, self._context_tokens)
+        budget = self._budget(stage)
+        output_limit = self._output_limit(input_tokens, model_max_output_tokens)
+        max_tokens = min(
+            max(math.ceil(budget.ratio * input_tokens), budget.minimum),
+            budget.maximum,
+            output_limit
+        )
+        return TokenPlan(stage, input_tokens, max_tokens, output_limit)
+
+    def grow(self, plan: TokenPlan) -> Optional[TokenPlan]:
+        """
+        A plan with twice the output budget for repeating a truncated
+        request, None if the budget can not grow any more.
+        """
+        max_tokens = min(2 * plan.max_tokens, plan.output_limit)
+        if max_tokens <= plan.max_tokens:
+            return None
+        return plan._replace(max_tokens=max_tokens)
+
+    def record(
+        self,
+        plan: TokenPlan,
+        model: str,
+        usage,
+        stop_reason: Optional[str]
+    ) -> None:
+        """
+        Stores the planned and the actual usage of a response.
+
+        Args:
+            plan (TokenPlan): The plan the request was sent with
+            model (str): The model of the request
+            usage: The usage of the response (anthropic.types.Usage)
+            stop_reason (str): "max_tokens" if the response was truncated
+        """
+        input_tokens = (
+            usage.input_tokens
+            + (getattr(usage, "cache_read_input_tokens", None) or 0)
+            + (getattr(usage, "cache_creation_input_tokens", None) or 0)
+        )
+        if stop_reason == "max_tokens":
+            with self._lock:
+                self._truncated += 1
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(insert(self._table).values(
+                    stage=plan.stage,
+                    model=model,
+                    planned_input_tokens=plan.input_tokens,
+                    input_tokens=input_tokens,
+                    max_tokens=plan.max_tokens,
+                    output_tokens=usage.output_tokens,
+                    stop_reason=stop_reason,
+                    created_at=datetime.now()
+                ))
+        except Exception:
+            # The statistics must never fail a request
+            logger.exception("Could not record the LLM usage")
+
+    def usage_by_stage(self) -> dict:
+        """Averages of the planned and actual usage per stage."""
+        table = self._table
+        with self._engine.begin() as conn:
+            rows = conn.execute(
+                select(
+                    table.c.stage,
+                    func.count(),
+                    func.avg(table.c.planned_input_tokens),
+                    func.avg(table.c.input_tokens),
+                    func.avg(table.c.max_tokens),
+                    func.avg(table.c.output_tokens),
+                    func.max(table.c.output_tokens),
+                    func.sum(case(
+                        (table.c.stop_reason == "max_tokens", 1),
+                        else_=0
+                    ))
+                ).group_by(table.c.stage)
+            ).all()
+        with self._lock:
+            truncated_in_process = self._truncated
+
+        return {
+            "stages": {
+                stage or "unknown": {
+                    "requests": count,
+                    "avg_planned_input_tokens": round(planned_input or 0),
+                    "avg_input_tokens": round(actual_input or 0),
+                    "avg_max_tokens": round(max_tokens or 0),
+                    "avg_output_tokens": round(output or 0),
+                    "max_output_tokens": max_output,
+                    "truncated": int(truncated or 0),
+                    "budget": self._budget(stage)._asdict(),
+                }
+                for (
+                    stage,
+                    count,
+                    planned_input,
+                    actual_input,
+                    max_tokens,
+                    output,
+                    max_output,
+                    truncated
+                ) in rows
+            },
+            "truncated_in_process": truncated_in_process,
+            "context_tokens": self._context_tokens,
+            "max_output_tokens": self._max_output_tokens,
+        }
+
+
+_token_budget_planner: Optional[TokenBudgetPlanner] = None
+_token_budget_planner_lock = threading.Lock()
+
+
+def get_token_budget_planner() -> TokenBudgetPlanner:
+    """
+    The token budget planner of this process. Must be called within an app
+    context the first time.
+    """
+    global _token_budget_planner
+    with _token_budget_planner_lock:
+        if _token_budget_planner is None:
+            _token_budget_planner = TokenBudgetPlanner(
+                db.engine,
+                LlmUsage.__table__,
+                context_tokens=Config.ANTHROPIC_CONTEXT_TOKENS,
+                max_output_tokens=Config.ANTHROPIC_MAX_OUTPUT_TOKENS
+            )
+        return _token_budget_planner
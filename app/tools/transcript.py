@@ -0,0 +1,373 @@
+import copy
+import io
+import re
+from typing import Iterable, Iterator, Optional, TextIO
+
+import numpy as np
+
+# Stored for utterances and words without timestamps
+NO_TIME = np.iinfo(np.int32).min
+
+# One "Speaker X:\n<text>\n" block of a rendered transcript
+SPEAKER_BLOCK = re.compile(
+    r"^Speaker ([^\n:]+):\n(.*?)(?=^Speaker [^\n:]+:\n|\Z)",
+    re.MULTILINE | re.DOTALL
+)
+
+_COLUMNS = (
+    "speaker_labels",
+    "speakers",
+    "starts",
+    "ends",
+    "offsets",
+    "confidences",
+    "word_starts",
+    "word_ends",
+    "word_offsets",
+    "word_confidences",
+)
+
+
+def _time(value: Optional[int]) -> int:
+    return NO_TIME if value is None else int(value)
+
+
+def _optional_time(value) -> Optional[int]:
+    return None if value == NO_TIME else int(value)
+
+
+def _optional_confidence(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+class Transcript:
+    """
+    The utterances of a transcription in columnar form: the utterance texts
+    back to back in one string, and per utterance its speaker (an index
+    into the speaker labels), start and end in milliseconds of the
+    recording, confidence and the offset of its text. Word timings are kept
+    the same way, with word offsets into the same string.
+
+    This is what is stored for a meeting (see Transcripts), so the labelled
+    text can be rendered, speakers remapped or the transcript sliced by time
+    without transcribing again.
+
+    The speaker table holds the name written in front of each speaker's
+    utterances, "Speaker X" until relabel() assigns participant names. The
+    text itself never contains the names, so relabelling only touches the
+    table and can not corrupt names containing another label.
+
+    Args:
+        text (str): The utterance texts without separators
+        speaker_labels (list[str]): Speaker labels, e.g. "A", in order of
+            their first utterance
+        speakers, starts, ends, confidences: One value per utterance
+        offsets: Start of each utterance in text, plus len(text) at the end
+        word_starts, word_ends, word_confidences: One value per word
+        word_offsets: Start of each word in text, plus len(text) at the end
+    """
+
+    def __init__(
+        self,
+        text: str,
+        speaker_labels: list[str],
+        speakers: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        offsets: np.ndarray,
+        confidences: np.ndarray,
+        word_starts: np.ndarray = None,
+        word_ends: np.ndarray = None,
+        word_offsets: np.ndarray = None,
+        word_confidences: np.ndarray = None,
+        speaker_names: list[str] = None
+    ):
+        self.text = text
+        self.speaker_labels = list(speaker_labels)
+        self.speaker_names = list(
+            speaker_names or (f"Speaker {label}" for label in speaker_labels)
+        )
+        self.speakers = np.asarray(speakers, dtype=np.int16)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        self.offsets = np.asarray(offsets, dtype=np.int32)
+        self.confidences = np.asarray(confidences, dtype=np.float32)
+        self.word_starts = np.asarray(
+            word_starts if word_starts is not None else [], dtype=np.int32
+        )
+        self.word_ends = np.asarray(
+            word_ends if word_ends is not None else [], dtype=np.int32
+        )
+        self.word_offsets = np.asarray(
+            word_offsets if word_offsets is not None else [0], dtype=np.int32
+        )
+        self.word_confidences = np.asarray(
+            word_confidences if word_confidences is not None else [],
+            dtype=np.float32
+        )
+
+    @classmethod
+    def from_utterances(cls, utterances: Iterable[dict]) -> "Transcript":
+        """
+        Args:
+            utterances (Iterable[dict]): speaker, text, start and end of each
+                utterance, optionally confidence and words (each with text,
+                start, end and confidence)
+        """
+        texts, speaker_ids = [], {}
+        speakers, starts, ends, offsets, confidences = [], [], [], [0], []
+        word_starts, word_ends, word_offsets, word_confidences = [], [], [], []
+        position = 0
+        for utterance in utterances:
+            text = utterance["text"]
+            speaker = str(utterance["speaker"])
+            speakers.append(speaker_ids.setdefault(speaker, len(speaker_ids)))
+            starts.append(_time(utterance.get("start")))
+            ends.append(_time(utterance.get("end")))
+            confidence = utterance.get("confidence")
+            confidences.append(np.nan if confidence is None else confidence)
+
+            cursor = 0
+            for word in utterance.get("words") or []:
+                found = text.find(word["text"], cursor)
+                if found < 0:
+                    found = cursor
+                word_offsets.append(position + found)
+                cursor = found + len(word["text"])
+                word_starts.append(_time(word.get("start")))
+                word_ends.append(_time(word.get("end")))
+                confidence = word.get("confidence")
+                word_confidences.append(np.nan if confidence is None else confidence)
+
+            texts.append(text)
+            position += len(text)
+            offsets.append(position)
+        word_offsets.append(position)
+
+        return cls(
+            "".join(texts),
+            list(speaker_ids),
+            speakers,
+            starts,
+            ends,
+            offsets,
+            confidences,
+            word_starts,
+            word_ends,
+            word_offsets,
+            word_confidences
+        )
+
+    @classmethod
+    def parse(cls, rendered: str) -> "Transcript":
+        """
+        Recovers speakers and texts from a rendered transcript, e.g. one
+        stored before utterances were kept. Timestamps are lost.
+        """
+        return cls.from_utterances(
+            {"speaker": match.group(1), "text": match.group(2).rstrip("\n")}
+            for match in SPEAKER_BLOCK.finditer(rendered)
+        )
+
+    @classmethod
+    def from_columns(
+        cls,
+        text: str,
+        data: bytes
+    ) -> "Transcript":
+        """Loads a transcript stored with to_columns()."""
+        with np.load(io.BytesIO(data), allow_pickle=False) as columns:
+            values = {name: columns[name] for name in _COLUMNS}
+        values["speaker_labels"] = values["speaker_labels"].tolist()
+        return cls(text, **values)
+
+    def to_columns(self) -> bytes:
+        """The arrays in one compact binary value, see from_columns()."""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            speaker_labels=np.array(self.speaker_labels, dtype=str),
+            speakers=self.speakers,
+            starts=self.starts,
+            ends=self.ends,
+            offsets=self.offsets,
+            confidences=self.confidences,
+            word_starts=self.word_starts,
+            word_ends=self.word_ends,
+            word_offsets=self.word_offsets,
+            word_confidences=self.word_confidences
+        )
+        return buffer.getvalue()
+
+    def __len__(self) -> int:
+        return len(self.speakers)
+
+    def utterance_text(self, index: int) -> str:
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def utterances(self) -> Iterator[dict]:
+        """The utterances as dicts, as accepted by from_utterances()."""
+        for i in range(len(self)):
+            yield {
+                "speaker": self.speaker_labels[self.speakers[i]],
+                "text": self.utterance_text(i),
+                "start": _optional_time(self.starts[i]),
+                "end": _optional_time(self.ends[i]),
+                "confidence": _optional_confidence(self.confidences[i]),
+            }
+
+    def span(self) -> Optional[tuple[int, int]]:
+        """First start and last end in milliseconds, None without timestamps."""
+        starts = self.starts[self.starts != NO_TIME]
+        ends = self.ends[self.ends != NO_TIME]
+        if len(starts) == 0 or len(ends) == 0:
+            return None
+        return int(starts.min()), int(ends.max())
+
+    def between(
+        self,
+        start_ms: int,
+        end_ms: int
+    ) -> "Transcript":
+        """The utterances overlapping the given part of the recording."""
+        timed = (self.starts != NO_TIME) & (self.ends != NO_TIME)
+        selected = np.flatnonzero(
+            timed & (self.starts < end_ms) & (self.ends > start_ms)
+        )
+        return self.select(selected)
+
+    def select(self, indices: np.ndarray) -> "Transcript":
+        """A transcript of the utterances with the given indices, in order."""
+        indices = np.asarray(indices, dtype=np.int64)
+        texts, offsets = [], [0]
+        word_parts = [], [], [], []
+        for i in indices:
+            texts.append(self.utterance_text(i))
+            first, last = np.searchsorted(
+                self.word_offsets[:-1],
+                [self.offsets[i], self.offsets[i + 1]]
+            )
+            shift = offsets[-1] - self.offsets[i]
+            word_parts[0].append(self.word_starts[first:last])
+            word_parts[1].append(self.word_ends[first:last])
+            word_parts[2].append(self.word_offsets[first:last] + shift)
+            word_parts[3].append(self.word_confidences[first:last])
+            offsets.append(offsets[-1] + len(texts[-1]))
+
+        def joined(parts, dtype):
+            return np.concatenate(parts) if parts else np.array([], dtype)
+
+        return Transcript(
+            "".join(texts),
+            self.speaker_labels,
+            self.speakers[indices],
+            self.starts[indices],
+            self.ends[indices],
+            offsets,
+            self.confidences[indices],
+            joined(word_parts[0], np.int32),
+            joined(word_parts[1], np.int32),
+            np.append(joined(word_parts[2], np.int32), offsets[-1]),
+            joined(word_parts[3], np.float32),
+            self.speaker_names
+        )
+
+    def segments(
+        self,
+        max_length: int,
+        overlap_ms: int
+    ) -> list["Transcript"]:
+        """
+        Splits the transcript into consecutive parts whose rendered length
+        is at most max_length characters (a single longer utterance becomes
+        a part of its own). Each part ends at the longest pause in its last
+        quarter, where a new topic is most likely to start, and the next
+        part repeats the utterances of the last overlap_ms before the cut,
+        but at most half of the previous part. Without timestamps the parts
+        are cut at the length limit and do not overlap.
+
+        Args:
+            max_length (int): Maximum rendered length of a part
+            overlap_ms (int): Recording time repeated at the start of the
+                next part
+
+        Returns:
+            list[Transcript]: The parts in recording order
+        """
+        count = len(self)
+        name_lengths = np.array(
+            [len(name) + 3 for name in self.speaker_names], dtype=np.int64
+        )
+        lengths = np.diff(self.offsets) + name_lengths[self.speakers]
+        ends_at = np.concatenate([[0], np.cumsum(lengths)])
+        timed = (self.starts != NO_TIME) & (self.ends != NO_TIME)
+        # pauses[i]: silence between utterance i - 1 and utterance i
+        pauses = np.zeros(count, dtype=np.int64)
+        pauses[1:] = np.where(
+            timed[1:] & timed[:-1],
+            self.starts[1:].astype(np.int64) - self.ends[:-1],
+            0
+        )
+
+        bounds = []
+        first = 0
+        while first < count:
+            last = int(np.searchsorted(
+                ends_at, ends_at[first] + max_length, side="right"
+            )) - 1
+            last = max(last, first + 1)
+            if last < count:
+                window = max(first + 1, last - (last - first) // 4)
+                last = window + int(np.argmax(pauses[window:last + 1]))
+            bounds.append((first, last))
+            if last >= count:
+                break
+
+            next_first = last
+            if timed[last]:
+                cut = int(self.starts[last])
+                limit = last - (last - first) // 2
+                while (
+                    next_first > max(limit, first + 1)
+                    and timed[next_first - 1]
+                    and self.ends[next_first - 1] > cut - overlap_ms
+                ):
+                    next_first -= 1
+            first = next_first
+
+        return [
+            self.select(np.arange(start, end)) for start, end in bounds
+        ]
+
+    def relabel(self, speaker_mapping: dict[str, str]) -> "Transcript":
+        """
+        A transcript with other speaker names, sharing the text and arrays
+        with this one.
+
+        Args:
+            speaker_mapping (dict): New name by current name, e.g.
+                {"Speaker A": "Anna"}. Speakers not in it keep their name.
+        """
+        relabelled = copy.copy(self)
+        relabelled.speaker_names = [
+            speaker_mapping.get(name, name) for name in self.speaker_names
+        ]
+        return relabelled
+
+    def blocks(self) -> Iterator[str]:
+        """The rendered transcript piece by piece, one block per utterance."""
+        names, text = self.speaker_names, self.text
+        for speaker, start, end in zip(
+            self.speakers.tolist(),
+            self.offsets[:-1].tolist(),
+            self.offsets[1:].tolist()
+        ):
+            yield f"{names[speaker]}:\n{text[start:end]}\n"
+
+    def write(self, stream: TextIO) -> None:
+        """Renders the transcript into a file without building the string."""
+        stream.writelines(self.blocks())
+
+    def render(self) -> str:
+        """The labelled text, a "<speaker name>:" block per utterance."""
+        return "".join(self.blocks())
@@ -0,0 +1,125 @@
+from datetime import datetime
+import hashlib
+import json
+import logging
+import threading
+from typing import Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import TranscriptionCache
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class TranscriptCache:
+    """
+    Persistent cache of transcription results. The key combines the hash of
+    the recording with the hashes of the participant samples in the order
+    they are prepended, because the samples are part of the uploaded audio
+    and decide the speaker labels. Uploading the same recording with the
+    same participants again therefore reuses the transcript.
+
+    Uses its own connections instead of the Flask-SQLAlchemy session, so it
+    can be used from any thread and by concurrent worker processes.
+
+    Args:
+        engine: SQLAlchemy engine of the database
+        table: Table with the columns of TranscriptionCache
+    """
+
+    def __init__(self, engine, table):
+        self._engine = engine
+        self._table = table
+
+    @staticmethod
+    def make_key(
+        audio_sha256: str,
+        sample_sha256s: list[Optional[str]],
+        options: dict = None
+    ) -> str:
+        """
+        Args:
+            audio_sha256 (str): Hash of the recording
+            sample_sha256s (list): Hash of each participant's sample, None
+                for participants without a sample
+            options (dict): Audio preparation settings that change the
+                uploaded audio, e.g. silence trimming
+        """
+        parts = [audio_sha256, sample_sha256s]
+        if options:
+            parts.append(options)
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        table = self._table
+        with self._engine.begin() as conn:
+            row = conn.execute(
+                select(table.c.utterances).where(table.c.cache_key == key)
+            ).first()
+            if row is None:
+                return None
+            conn.execute(
+                update(table)
+                .where(table.c.cache_key == key)
+                .values(
+                    hit_count=table.c.hit_count + 1,
+                    last_accessed_at=datetime.now()
+                )
+            )
+        return json.loads(row.utterances)
+
+    def put(
+        self,
+        key: str,
+        audio_sha256: str,
+        utterances: list[dict]
+    ) -> None:
+        now = datetime.now()
+        values = dict(
+            cache_key=key,
+            audio_sha256=audio_sha256,
+            utterances=json.dumps(utterances, ensure_ascii=False),
+            hit_count=0,
+            created_at=now,
+            last_accessed_at=now
+        )
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(insert(self._table).values(**values))
+        except IntegrityError:
+            # Another worker transcribed the same recording in the meantime
+            with self._engine.begin() as conn:
+                conn.execute(
+                    update(self._table)
+                    .where(self._table.c.cache_key == key)
+                    .values(
+                        utterances=values["utterances"],
+                        last_accessed_at=now
+                    )
+                )
+
+
+_transcript_cache: Optional[TranscriptCache] = None
+_transcript_cache_lock = threading.Lock()
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """
+    The transcript cache of this process. Must be called within an app
+    context the first time.
+    """
+    global _transcript_cache
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache(
+                db.engine,
+                TranscriptionCache.__table__
+            )
+        return _transcript_cache
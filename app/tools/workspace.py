@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import shutil
+import tempfile
+from typing import Iterator
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+@contextmanager
+def scratch_workspace(prefix: str = "job_") -> Iterator[Path]:
+    """
+    A private directory for the temporary files of one job, removed with
+    everything in it when the block exits, also on errors. Jobs running at
+    the same time never share files.
+
+    The directories are created in Config.SCRATCH_FOLDER, e.g. /dev/shm to
+    keep intermediate audio on tmpfs, or in the system temp folder if it is
+    not set.
+
+    Args:
+        prefix (str): Prefix of the directory name, e.g. "meeting_12_"
+
+    Yields:
+        Path: The directory
+    """
+    base = Config.SCRATCH_FOLDER
+    if base:
+        os.makedirs(base, exist_ok=True)
+    path = Path(tempfile.mkdtemp(prefix=prefix, dir=base))
+    logger.debug(f"Created scratch workspace {path}")
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+        logger.debug(f"Removed scratch workspace {path}")
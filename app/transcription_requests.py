@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+import logging
+
+from sqlalchemy import or_, update
+
+from app import db
+from .models import TranscriptionRequests
+from config import Config
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+def record_submission(
+    meeting_id: int,
+    transcript_id: str,
+    cache_key: str = None,
+    audio_sha256: str = None,
+    time_map: str = None
+) -> TranscriptionRequests:
+    """Remembers a submitted transcript. The caller commits the session."""
+    request = TranscriptionRequests(
+        meeting_id=meeting_id,
+        transcript_id=transcript_id,
+        status="submitted",
+        cache_key=cache_key,
+        audio_sha256=audio_sha256,
+        time_map=time_map
+    )
+    db.session.add(request)
+    return request
+
+
+def pending_request(meeting_id: int) -> TranscriptionRequests | None:
+    """The submitted transcript of the meeting that is not processed yet."""
+    return TranscriptionRequests.query.filter(
+        TranscriptionRequests.meeting_id == meeting_id,
+        TranscriptionRequests.status.in_(("submitted", "completing"))
+    ).first()
+
+
+def submitted_requests(min_age_seconds: float = 0) -> list[TranscriptionRequests]:
+    """Submitted transcripts, oldest first, e.g. for the poller."""
+    return TranscriptionRequests.query.filter(
+        TranscriptionRequests.status == "submitted",
+        TranscriptionRequests.submitted_at
+        <= datetime.now() - timedelta(seconds=min_age_seconds)
+    ).order_by(
+        TranscriptionRequests.submitted_at
+    ).all()
+
+
+def claim_completion(request_id: int) -> bool:
+    """
+    Marks a submitted transcript as being processed. Pollers in several
+    processes and the webhook may see the same completed transcript, only
+    the one whose conditional UPDATE succeeds processes it.
+    """
+    result = db.session.execute(
+        update(TranscriptionRequests)
+        .where(
+            TranscriptionRequests.request_id == request_id,
+            TranscriptionRequests.status == "submitted"
+        )
+        .values(status="completing", claimed_at=datetime.now())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def release_stale_claims(max_age_seconds: float) -> int:
+    """
+    Returns transcripts claimed more than max_age_seconds ago to
+    "submitted", so that the next poll completes them. A claim only gets
+    this old if the process completing it died.
+    """
+    result = db.session.execute(
+        update(TranscriptionRequests)
+        .where(
+            TranscriptionRequests.status == "completing",
+            or_(
+                TranscriptionRequests.claimed_at.is_(None),
+                TranscriptionRequests.claimed_at
+                < datetime.now() - timedelta(seconds=max_age_seconds)
+            )
+        )
+        .values(status="submitted", claimed_at=None)
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.warning(
+            f"Released {result.rowcount} stale transcript completion(s)"
+        )
+    return result.rowcount
+
+
+def finish_request(
+    request: TranscriptionRequests,
+    succeeded: bool,
+    error: str = None
+) -> None:
+    """The caller commits the session."""
+    request.status = "completed" if succeeded else "error"
+    request.error = error
+    request.completed_at = datetime.now()
@@ -0,0 +1,186 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+from app import app
+from config import Config
+from .job_queue import (
+    JobLease,
+    claim_jobs,
+    fail_exhausted_jobs,
+    finish_job,
+    renew_leases,
+)
+from .routes import (
+    aprocess_meeting_summarization,
+    poll_transcriptions,
+    run_meeting_summarization,
+)
+from .tools.async_runner import get_async_runner
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(Config.LOG_LEVEL)
+
+
+class Worker:
+    """
+    Claims meetings from the job queue and summarizes them, with at most
+    `concurrency` meetings in flight. Run as many worker processes (or
+    containers) as needed, independent of the number of web workers.
+
+    A heartbeat thread keeps the leases of the in-flight jobs alive. If the
+    worker dies, its leases expire and another worker takes the jobs over.
+    A worker that finds one of its leases taken over (e.g. after a long
+    pause) stops that job, see JobLease.
+
+    Args:
+        concurrency (int): Maximum number of meetings processed at once
+        poll_seconds (float): Pause between two looks at the queue
+    """
+
+    def __init__(
+        self,
+        concurrency: int = Config.WORKER_CONCURRENCY,
+        poll_seconds: float = Config.WORKER_POLL_SECONDS
+    ):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._concurrency = concurrency
+        self._poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._pool = None
+        if Config.PIPELINE_MODE != "async":
+            self._pool = ThreadPoolExecutor(
+                max_workers=concurrency,
+                thread_name_prefix="worker"
+            )
+
+    def stop(self, *args) -> None:
+        logger.info(f"Worker {self.worker_id} stopping after in-flight jobs")
+        self._stop.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(
+            f"Worker {self.worker_id} started with concurrency "
+            f"{self._concurrency} ({Config.PIPELINE_MODE} pipeline)"
+        )
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            name="heartbeat",
+            daemon=True
+        )
+        heartbeat.start()
+        if Config.TRANSCRIPTION_COMPLETION != "inline":
+            threading.Thread(
+                target=self._poll_transcriptions,
+                name="transcriptions",
+                daemon=True
+            ).start()
+
+        while not self._stop.is_set():
+            self._reap()
+            free_slots = self._concurrency - len(self._in_flight)
+            if free_slots > 0:
+                try:
+                    with app.app_context():
+                        fail_exhausted_jobs()
+                        # A reclaimed job resumes where the previous attempt
+                        # stopped instead of starting over at from_stage
+                        jobs = [
+                            (
+                                job.job_id,
+                                job.meeting_id,
+                                job.from_stage if job.attempts == 1 else None
+                            )
+                            for job in claim_jobs(self.worker_id, free_slots)
+                        ]
+                except Exception as e:
+                    logger.error(f"Error claiming jobs: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    jobs = []
+                for job_id, meeting_id, from_stage in jobs:
+                    lease = JobLease(job_id, self.worker_id)
+                    future = self._start(meeting_id, from_stage, lease)
+                    with self._in_flight_lock:
+                        self._in_flight[future] = lease
+            self._stop.wait(self._poll_seconds)
+
+        with self._in_flight_lock:
+            draining = list(self._in_flight)
+        for future in draining:
+            future.exception()
+        self._reap()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _heartbeat(self) -> None:
+        # Keeps running while draining after stop(), the in-flight jobs
+        # still need their leases
+        while True:
+            with self._in_flight_lock:
+                leases = {
+                    lease.job_id: lease for lease in self._in_flight.values()
+                }
+            if self._stop.is_set() and not leases:
+                return
+            try:
+                with app.app_context():
+                    lost = renew_leases(self.worker_id, list(leases))
+                for job_id in lost:
+                    logger.warning(
+                        f"Worker {self.worker_id} lost the lease of job "
+                        f"{job_id} to another worker, stopping it"
+                    )
+                    leases[job_id].lose()
+            except Exception as e:
+                logger.error(f"Error renewing leases: {str(e)}")
+            time.sleep(Config.JOB_HEARTBEAT_SECONDS)
+
+    def _poll_transcriptions(self) -> None:
+        # Completes transcripts submitted by any worker, a meeting waiting
+        # for its transcript holds no job and no slot meanwhile
+        while not self._stop.wait(Config.ASSEMBLYAI_POLL_SECONDS):
+            try:
+                poll_transcriptions()
+            except Exception as e:
+                logger.error(f"Error polling transcriptions: {str(e)}")
+
+    def _start(
+        self,
+        meeting_id: int,
+        from_stage: str = None,
+        lease: JobLease = None
+    ) -> Future:
+        if Config.PIPELINE_MODE == "async":
+            return get_async_runner().submit(
+                aprocess_meeting_summarization(meeting_id, from_stage, lease)
+            )
+        return self._pool.submit(
+            run_meeting_summarization,
+            meeting_id,
+            from_stage,
+            lease
+        )
+
+    def _reap(self) -> None:
+        with self._in_flight_lock:
+            done = [
+                (future, self._in_flight.pop(future))
+                for future in list(self._in_flight) if future.done()
+            ]
+        for future, lease in done:
+            succeeded = future.exception() is None and future.result()
+            try:
+                with app.app_context():
+                    finish_job(lease.job_id, self.worker_id, succeeded)
+            except Exception as e:
+                logger.error(f"Error finishing job {lease.job_id}: {str(e)}")
@@ -0,0 +1,125 @@
+"""
+compare the local language detection with the LLM on the stored transcripts via
+> python benchmark_language_detection.py
+
+Detects the language of the latest --limit transcripts locally (see
+app/tools/language_detection.py) and compares it with the answer of the
+LLM as the pipeline asks it (this costs money, cached answers are reused)
+or, with --reference stored, with the language stored for the meeting.
+Reports the agreement overall and above the confidence threshold, the
+share of transcripts that would still go to the LLM and the latency of
+both.
+"""
+
+import argparse
+import time
+
+from app import app, db
+from app.meeting_audio_summarizer import (
+    LANGUAGE_DETECTION_SAMPLE_CHARS,
+    MeetingAudioSummarizer,
+)
+from app.models import Meetings, Transcripts
+from app.tools.language_detection import detect_language, normalize_language
+from config import Config
+
+
+def reference_language(
+    summarizer: MeetingAudioSummarizer,
+    transcript: Transcripts,
+    reference: str
+) -> tuple[str | None, float]:
+    """The reference language of the transcript and the seconds it took."""
+    if reference == "stored":
+        meeting = db.session.get(Meetings, transcript.meeting_id)
+        language = meeting.language if meeting else None
+        return (normalize_language(language) if language else None), 0.0
+    start = time.perf_counter()
+    answer = summarizer._call_claude_agent(
+        **summarizer._infer_language_request(transcript.text)
+    )
+    seconds = time.perf_counter() - start
+    return normalize_language(answer) or answer.strip(), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument(
+        "--reference",
+        choices=("llm", "stored"),
+        default="llm"
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=Config.LANGUAGE_DETECTION_MIN_CONFIDENCE
+    )
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with app.app_context():
+        summarizer = MeetingAudioSummarizer(db)
+        transcripts = Transcripts.query.filter(
+            Transcripts.text.isnot(None)
+        ).order_by(Transcripts.transcript_id.desc()).limit(args.limit).all()
+
+        results = []
+        for transcript in transcripts:
+            sample = transcript.text[-LANGUAGE_DETECTION_SAMPLE_CHARS:]
+            start = time.perf_counter()
+            language, confidence = detect_language(sample)
+            local_seconds = time.perf_counter() - start
+
+            expected, reference_seconds = reference_language(
+                summarizer,
+                transcript,
+                args.reference
+            )
+            if expected is None:
+                continue
+            results.append((
+                language == expected,
+                confidence >= args.min_confidence,
+                local_seconds,
+                reference_seconds
+            ))
+            if args.verbose:
+                print(
+                    f"{transcript.transcript_id:>6} {expected:<12} "
+                    f"{language or '-':<12} {confidence:>5.2f}"
+                )
+
+    if not results:
+        print("No transcripts with a reference language")
+        return
+
+    count = len(results)
+    confident = [r for r in results if r[1]]
+    print(f"{count} transcripts, reference: {args.reference}")
+    print(
+        f"agreement:                 "
+        f"{sum(r[0] for r in results) / count:.1%}"
+    )
+    print(
+        f"confidence >= {args.min_confidence:.2f}:       "
+        f"{len(confident) / count:.1%} of the transcripts"
+    )
+    if confident:
+        print(
+            f"agreement when confident:  "
+            f"{sum(r[0] for r in confident) / len(confident):.1%}"
+        )
+    print(
+        f"local detection:           "
+        f"{sum(r[2] for r in results) / count * 1e6:.0f} µs on average"
+    )
+    if args.reference == "llm":
+        print(
+            f"LLM:                       "
+            f"{sum(r[3] for r in results) / count:.2f} s on average"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+compare the model routing profiles on latency and token cost via
+> python benchmark_model_routing.py <meeting_id>
+
+Runs the LLM stages of the pipeline (language, agenda, protocol, filename,
+language check and markdown) on the stored transcript of the meeting once
+per profile in MODEL_ROUTING_PROFILES, without the LLM response cache, and
+reports the seconds, tokens and cost of every stage. This costs money.
+Nothing is persisted except the usage records of the token budget planner,
+which are also what the token numbers are read from, so do not run it
+while other processes call the LLM.
+
+With --output, the protocols are written to <output>/<profile>.md for
+comparing their quality. Run it before changing MODEL_ROUTING: "routed"
+should only be used once its protocols, filenames and markdown hold up
+against "large" on representative meetings.
+"""
+
+import argparse
+from datetime import datetime
+import json
+import os
+import time
+
+from sqlalchemy import select
+
+from app import app, db
+from app.meeting_audio_summarizer import MeetingAudioSummarizer
+from app.models import LlmUsage, Meetings, Transcripts
+from config import Config
+
+# USD per million input and output tokens. Prompt cache reads and writes are
+# counted as regular input tokens.
+PRICES = {
+    "claude-3-7-sonnet-20250219": (3.0, 15.0),
+    "claude-3-5-haiku-20241022": (0.8, 4.0),
+}
+
+
+def run_stages(
+    summarizer: MeetingAudioSummarizer,
+    meeting: Meetings,
+    transcript: Transcripts
+) -> tuple[dict, str]:
+    utterances = summarizer._stored_utterances(transcript)
+    if transcript.speaker_mapping:
+        utterances = utterances.relabel(json.loads(transcript.speaker_mapping))
+    text = transcript.text
+    date = meeting.date
+
+    seconds = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds[stage] = time.perf_counter() - start
+        return result
+
+    language = timed("infer_language", summarizer._infer_language, text)
+    agenda = timed(
+        "infer_agenda", summarizer._infer_agenda, text, meeting.topic
+    )
+    protocol = timed(
+        "create_meeting_protocol",
+        summarizer._create_meeting_protocol,
+        text,
+        utterances,
+        agenda,
+        date,
+        []
+    )
+    timed("create_filename", summarizer._create_filename, protocol, date)
+    translated = timed(
+        "ensure_language", summarizer._ensure_language, protocol, language
+    )
+    markdown = timed(
+        "ensure_markdown", summarizer._ensure_markdown, translated
+    )
+    return seconds, markdown
+
+
+def usage_since(started_at: datetime) -> dict:
+    """Model, input and output tokens per stage since started_at."""
+    usage = {}
+    with db.engine.begin() as conn:
+        rows = conn.execute(
+            select(
+                LlmUsage.stage,
+                LlmUsage.model,
+                LlmUsage.input_tokens,
+                LlmUsage.output_tokens
+            )
+            .where(LlmUsage.created_at >= started_at)
+            .order_by(LlmUsage.usage_id)
+        ).all()
+    for stage, model, input_tokens, output_tokens in rows:
+        entry = usage.setdefault(
+            stage, {"models": set(), "input": 0, "output": 0, "cost": 0.0}
+        )
+        entry["models"].add(model)
+        entry["input"] += input_tokens
+        entry["output"] += output_tokens
+        input_price, output_price = PRICES.get(model, (0.0, 0.0))
+        entry["cost"] += (
+            input_tokens * input_price + output_tokens * output_price
+        ) / 1e6
+    return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("meeting_id", type=int)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(Config.MODEL_ROUTING_PROFILES),
+        choices=list(Config.MODEL_ROUTING_PROFILES)
+    )
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    Config.LLM_CACHE_ENABLED = False
+
+    with app.app_context():
+        meeting = db.session.get(Meetings, args.meeting_id)
+        transcript = Transcripts.query.filter_by(
+            meeting_id=args.meeting_id
+        ).order_by(Transcripts.transcript_id.desc()).first()
+        if meeting is None or transcript is None or not transcript.text:
+            parser.error(f"Meeting {args.meeting_id} has no transcript")
+        print(
+            f"Meeting {meeting.meeting_id}: {meeting.topic}, "
+            f"{len(transcript.text)} characters of transcript"
+        )
+
+        totals = {}
+        for profile in args.profiles:
+            summarizer = MeetingAudioSummarizer(db, model_routing=profile)
+            started_at = datetime.now()
+            seconds, protocol = run_stages(summarizer, meeting, transcript)
+            usage = usage_since(started_at)
+
+            print(f"\n{profile}")
+            print(
+                f"{'stage':<24} {'model':<28} {'s':>7} "
+                f"{'in':>8} {'out':>7} {'USD':>8}"
+            )
+            for stage, stage_seconds in seconds.items():
+                # The protocol stage includes the segment notes, if any
+                entries = [usage.get(stage)]
+                if stage == "create_meeting_protocol":
+                    entries.append(usage.get("summarize_segment"))
+                entries = [entry for entry in entries if entry]
+                models = sorted(set().union(*(e["models"] for e in entries)))
+                print(
+                    f"{stage:<24} {', '.join(models):<28} "
+                    f"{stage_seconds:>7.1f} "
+                    f"{sum(e['input'] for e in entries):>8} "
+                    f"{sum(e['output'] for e in entries):>7} "
+                    f"{sum(e['cost'] for e in entries):>8.4f}"
+                )
+            totals[profile] = (
+                sum(seconds.values()),
+                sum(entry["cost"] for entry in usage.values())
+            )
+
+            if args.output:
+                os.makedirs(args.output, exist_ok=True)
+                with open(os.path.join(args.output, f"{profile}.md"), "w") as f:
+                    f.write(protocol)
+
+        print(f"\n{'profile':<10} {'total s':>9} {'USD':>8}")
+        for profile, (total_seconds, cost) in totals.items():
+            print(f"{profile:<10} {total_seconds:>9.1f} {cost:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+compare the transcription profiles on payload size and latency via
+> python benchmark_transcription_profiles.py path/to/recording.m4a
+
+Encodes the recording with every profile in TRANSCRIPTION_PROFILES and
+reports encoding time and upload size. With --transcribe, every encoded
+file is also transcribed by AssemblyAI (this costs money), and the
+end-to-end latency (upload and transcription), the length of the
+transcript and its word error rate against the transcript of the
+--reference profile are reported as well. A profile should only become
+the default TRANSCRIPTION_PROFILE if its word error rate against the
+current default is no higher than that of a second transcription of the
+same file (run the reference twice, e.g. --profiles aac aac).
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import assemblyai as aai
+import numpy as np
+
+from app.tools.audio import (
+    TRANSCRIPTION_PROFILES,
+    encode_recording,
+    get_transcription_profile,
+    probe_audio,
+)
+from config import Config
+
+
+def benchmark_profile(
+    input_file_path: str,
+    profile_name: str,
+    folder: str,
+    transcribe: bool
+) -> dict:
+    profile = get_transcription_profile(profile_name)
+    output_file_path = os.path.join(folder, f"upload.{profile.extension}")
+
+    start = time.perf_counter()
+    encode_recording(input_file_path, output_file_path, profile)
+    result = {
+        "profile": profile_name,
+        "encode_seconds": time.perf_counter() - start,
+        "bytes": os.path.getsize(output_file_path),
+    }
+
+    if transcribe:
+        start = time.perf_counter()
+        transcript = aai.Transcriber().transcribe(
+            output_file_path,
+            config=aai.TranscriptionConfig(
+                language_code="de",
+                speaker_labels=True,
+                speech_model="best",
+            )
+        )
+        result["transcribe_seconds"] = time.perf_counter() - start
+        if transcript.status == aai.TranscriptStatus.error:
+            result["words"] = f"error: {transcript.error}"
+        else:
+            result["text"] = transcript.text or ""
+            result["words"] = len(result["text"].split())
+
+    return result
+
+
+def words(text: str) -> list[str]:
+    return re.sub(r"[^\w\s]", "", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level edit distance divided by the length of the reference."""
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return float(len(hyp) > 0)
+    vocabulary = {word: i for i, word in enumerate(set(ref) | set(hyp))}
+    hyp_ids = np.array([vocabulary[word] for word in hyp])
+    steps = np.arange(len(hyp) + 1)
+    previous = steps.copy()
+    for i, word in enumerate(ref, start=1):
+        substituted = previous[:-1] + (hyp_ids != vocabulary[word])
+        row = np.concatenate(([i], np.minimum(previous[1:] + 1, substituted)))
+        # Insertions: row[j] = min over k <= j of row[k] + (j - k)
+        previous = np.minimum.accumulate(row - steps) + steps
+    return previous[-1] / len(ref)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("recording")
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(TRANSCRIPTION_PROFILES),
+        choices=list(TRANSCRIPTION_PROFILES)
+    )
+    parser.add_argument("--transcribe", action="store_true")
+    parser.add_argument(
+        "--reference",
+        default="aac",
+        choices=list(TRANSCRIPTION_PROFILES)
+    )
+    args = parser.parse_args()
+    if args.transcribe and args.reference not in args.profiles:
+        args.profiles.insert(0, args.reference)
+
+    aai.settings.api_key = Config.ASSEMBLYAI_API_KEY
+
+    info = probe_audio(args.recording)
+    source_bytes = os.path.getsize(args.recording)
+    print(
+        f"{args.recording}: {info['codec']}, {info['sample_rate']} Hz, "
+        f"{info['channels']} channel(s), {info['duration']:.0f} s, "
+        f"{source_bytes / 1e6:.1f} MB"
+    )
+
+    header = f"{'profile':<8} {'MB':>8} {'ratio':>7} {'encode s':>9}"
+    if args.transcribe:
+        header += f" {'e2e s':>9} {'words':>7} {'WER':>7}"
+    print(header)
+
+    with tempfile.TemporaryDirectory() as folder:
+        results = [
+            benchmark_profile(
+                args.recording,
+                profile_name,
+                folder,
+                args.transcribe
+            )
+            for profile_name in args.profiles
+        ]
+        # The first transcript of the reference profile
+        reference_text = next((
+            result.get("text") for result in results
+            if result["profile"] == args.reference
+        ), None)
+        for result in results:
+            line = (
+                f"{result['profile']:<8} "
+                f"{result['bytes'] / 1e6:>8.2f} "
+                f"{source_bytes / result['bytes']:>7.1f} "
+                f"{result['encode_seconds']:>9.1f}"
+            )
+            if args.transcribe:
+                e2e = result["encode_seconds"] + result["transcribe_seconds"]
+                line += f" {e2e:>9.1f} {result['words']:>7}"
+                if reference_text is not None and "text" in result:
+                    wer = word_error_rate(reference_text, result["text"])
+                    line += f" {wer:>7.1%}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
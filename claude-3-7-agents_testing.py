@@ -7,7 +7,12 @@ import anthropic
 from dotenv import load_dotenv
 
 from tools.google_drive import export_to_google_drive
-from tools.prompts_etc import PROMPTS, AGENDA_EXAMPLES
+from tools.prompts_etc import (
+    PROMPTS,
+    AGENDA_EXAMPLES,
+    TRANSCRIPT_CONTEXT,
+    TRANSCRIPT_SYSTEM_PROMPT,
+)
 
 
 load_dotenv()
@@ -105,16 +110,18 @@ def get_speaker_mapping(
         }
     }
 
-    prompt = PROMPTS["speaker_mapping"]["message"].format(
-        participants=participants,
-        transcript=transcript,
-        example_json=json.dumps(example_json)
+    prompt = transcript_prompt(
+        transcript,
+        PROMPTS["speaker_mapping"]["instruction"].format(
+            participants=participants,
+            example_json=json.dumps(example_json)
+        )
     )
 
     message = call_claude_agent(
         client,
         prompt,
-        PROMPTS["speaker_mapping"]["system"],
+        TRANSCRIPT_SYSTEM_PROMPT,
         1000,
         cache_key=f"speaker_mapping_{meeting_id}"
     )
@@ -122,6 +129,23 @@ def get_speaker_mapping(
     return json.loads(message)
 
 
+def transcript_prompt(
+    transcript: str,
+    instruction: str
+) -> str:
+    protocol_example_1 = open("few_shot_examples/protocol_2.txt", "r").read()
+    protocol_example_2 = open("few_shot_examples/protocol_3.txt", "r").read()
+
+    protocol_examples = f"{protocol_example_1} {protocol_example_2}"
+
+    context = TRANSCRIPT_CONTEXT.format(
+        agenda_examples=AGENDA_EXAMPLES,
+        protocol_examples=protocol_examples,
+        transcript=transcript
+    )
+    return f"{context}\n{instruction}"
+
+
 def load_from_cache_if_exists(
     key: str
 ) -> dict | None:
@@ -188,16 +212,15 @@ def infer_agenda(
     topic: str,
     meeting_id: int
 ) -> str:
-    prompt = PROMPTS["infer_agenda"]["message"].format(
-        transcript=transcript,
-        topic=topic,
-        agenda_examples=AGENDA_EXAMPLES
+    prompt = transcript_prompt(
+        transcript,
+        PROMPTS["infer_agenda"]["instruction"].format(topic=topic)
     )
 
     return call_claude_agent(
         client,
         prompt,
-        PROMPTS["infer_agenda"]["system"],
+        TRANSCRIPT_SYSTEM_PROMPT,
         1000,
         cache_key=f"agenda_{meeting_id}"
     )
@@ -210,22 +233,18 @@ def create_meeting_protocol(
     date: str,
     meeting_id: int
 ) -> str:
-    protocol_example_1 = open("few_shot_examples/protocol_2.txt", "r").read()
-    protocol_example_2 = open("few_shot_examples/protocol_3.txt", "r").read()
-
-    protocol_examples = f"{protocol_example_1} {protocol_example_2}"
-
-    prompt = PROMPTS["create_meeting_protocol"]["message"].format(
-        transcript=transcript,
-        agenda=agenda,
-        date=date,
-        protocol_examples=protocol_examples
+    prompt = transcript_prompt(
+        transcript,
+        PROMPTS["create_meeting_protocol"]["instruction"].format(
+            agenda=agenda,
+            date=date
+        )
     )
 
     return call_claude_agent(
         client,
         prompt,
-        PROMPTS["create_meeting_protocol"]["system"],
+        TRANSCRIPT_SYSTEM_PROMPT,
         5000,
         cache_key=f"meeting_protocol_{meeting_id}"
     )
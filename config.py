@@ -34,7 +34,260 @@ class Config(object):
     ASSEMBLYAI_API_KEY = os.environ.get("ASSEMBLYAI_API_KEY")
     ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 
-    ANTROPIC_COOL_DOWN_SECONDS = os.environ.get("ANTROPIC_COOL_DOWN_SECONDS") or 120
+    # Rate limits of our Anthropic organisation. They are only the starting
+    # point, the limiter follows the rate limit headers of the API responses.
+    ANTHROPIC_REQUESTS_PER_MINUTE = int(
+        os.environ.get("ANTHROPIC_REQUESTS_PER_MINUTE") or 50
+    )
+    ANTHROPIC_INPUT_TOKENS_PER_MINUTE = int(
+        os.environ.get("ANTHROPIC_INPUT_TOKENS_PER_MINUTE") or 20000
+    )
+    ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE = int(
+        os.environ.get("ANTHROPIC_OUTPUT_TOKENS_PER_MINUTE") or 8000
+    )
+    # "database" shares the rate limit budget between all processes using
+    # the database, "memory" keeps a separate budget per process
+    RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE") or "database"
+    RATE_LIMIT_LOCK_FOLDER = os.environ.get("RATE_LIMIT_LOCK_FOLDER") or "/tmp"
+    ANTHROPIC_MAX_RATE_LIMIT_RETRIES = int(
+        os.environ.get("ANTHROPIC_MAX_RATE_LIMIT_RETRIES") or 3
+    )
+
+    # Model and temperature of the LLM requests per pipeline stage. The
+    # profile MODEL_ROUTING is used, "default" applies to stages not listed
+    # in it. "large" sends everything to the large model, "routed" only the
+    # transcript and protocol stages; the mechanical stages go to the fast
+    # model. The agenda stays on the large model, it shares the cached
+    # transcript prefix with the protocol (the prompt cache is per model).
+    # max_output_tokens lowers ANTHROPIC_MAX_OUTPUT_TOKENS for a model.
+    # "routed" is opt-in: compare the profiles on your meetings with
+    # benchmark_model_routing.py before switching.
+    ANTHROPIC_LARGE_MODEL = (
+        os.environ.get("ANTHROPIC_LARGE_MODEL") or "claude-3-7-sonnet-20250219"
+    )
+    ANTHROPIC_FAST_MODEL = (
+        os.environ.get("ANTHROPIC_FAST_MODEL") or "claude-3-5-haiku-20241022"
+    )
+    MODEL_ROUTING_PROFILES = {
+        "large": {
+            "default": {"model": ANTHROPIC_LARGE_MODEL, "temperature": 1},
+        },
+        "routed": {
+            "default": {"model": ANTHROPIC_LARGE_MODEL, "temperature": 1},
+            "infer_language": {
+                "model": ANTHROPIC_FAST_MODEL,
+                "temperature": 0,
+                "max_output_tokens": 8192
+            },
+            "create_filename": {
+                "model": ANTHROPIC_FAST_MODEL,
+                "temperature": 0.5,
+                "max_output_tokens": 8192
+            },
+            "ensure_language": {
+                "model": ANTHROPIC_FAST_MODEL,
+                "temperature": 0,
+                "max_output_tokens": 8192
+            },
+            "ensure_markdown": {
+                "model": ANTHROPIC_FAST_MODEL,
+                "temperature": 0,
+                "max_output_tokens": 8192
+            },
+        },
+    }
+    MODEL_ROUTING = os.environ.get("MODEL_ROUTING") or "large"
+
+    # Token budget of the LLM requests, see app/tools/token_budget.py.
+    # "estimate" counts the prompt tokens locally, "api" asks the token
+    # counting endpoint of Anthropic before each request.
+    TOKEN_COUNTING = os.environ.get("TOKEN_COUNTING") or "estimate"
+    ANTHROPIC_CONTEXT_TOKENS = int(
+        os.environ.get("ANTHROPIC_CONTEXT_TOKENS") or 200000
+    )
+    # Upper limit of max_tokens, also when a truncated response is repeated
+    # with a larger budget
+    ANTHROPIC_MAX_OUTPUT_TOKENS = int(
+        os.environ.get("ANTHROPIC_MAX_OUTPUT_TOKENS") or 16000
+    )
+
+    # Maximum number of independent pipeline stages of one meeting that run
+    # at the same time
+    PIPELINE_MAX_WORKERS = int(os.environ.get("PIPELINE_MAX_WORKERS") or 4)
+
+    # "threaded" runs each meeting in its own scheduler thread, "async" runs
+    # all meetings of a process on one event loop
+    PIPELINE_MODE = os.environ.get("PIPELINE_MODE") or "threaded"
+    ASYNC_MAX_CONCURRENT_MEETINGS = int(
+        os.environ.get("ASYNC_MAX_CONCURRENT_MEETINGS") or 24
+    )
+    ASYNC_EXECUTOR_WORKERS = int(os.environ.get("ASYNC_EXECUTOR_WORKERS") or 32)
+    # "scheduler" processes meetings with APScheduler inside the web
+    # processes, "queue" leaves them to separate worker processes (worker.py)
+    JOB_BACKEND = os.environ.get("JOB_BACKEND") or "scheduler"
+    WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY") or 4)
+    WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS") or 2)
+    # A job whose worker did not send a heartbeat for JOB_LEASE_SECONDS is
+    # taken over by another worker, at most JOB_MAX_ATTEMPTS times. With the
+    # scheduler, such a "processing" meeting can be retried.
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS") or 60)
+    JOB_HEARTBEAT_SECONDS = int(os.environ.get("JOB_HEARTBEAT_SECONDS") or 15)
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS") or 3)
+    # Estimated processing seconds per second of audio, used to order the
+    # job queue
+    JOB_COST_PER_AUDIO_SECOND = float(
+        os.environ.get("JOB_COST_PER_AUDIO_SECOND") or 0.25
+    )
+
+    ASSEMBLYAI_POLL_SECONDS = float(
+        os.environ.get("ASSEMBLYAI_POLL_SECONDS") or 5
+    )
+    # Set to e.g. http://localhost:8100 to use mock_assemblyai_server.py
+    ASSEMBLYAI_BASE_URL = os.environ.get("ASSEMBLYAI_BASE_URL") or None
+    # How the end of a transcription is detected:
+    # "inline": the job waits for the transcript
+    # "poll": the job ends after submitting the audio, a poller checks all
+    #   submitted transcripts every ASSEMBLYAI_POLL_SECONDS and schedules
+    #   the meeting again when its transcript is ready. The poller runs in
+    #   the scheduler of the web processes (JOB_BACKEND = "scheduler") or
+    #   in worker.py (JOB_BACKEND = "queue"), so with the queue at least
+    #   one worker must run.
+    # "webhook": like "poll", but AssemblyAI calls ASSEMBLYAI_WEBHOOK_URL
+    #   (the /assemblyai_webhook route); the poller only checks transcripts
+    #   older than ASSEMBLYAI_WEBHOOK_FALLBACK_SECONDS in case a call is lost
+    TRANSCRIPTION_COMPLETION = (
+        os.environ.get("TRANSCRIPTION_COMPLETION") or "inline"
+    )
+    ASSEMBLYAI_WEBHOOK_URL = os.environ.get("ASSEMBLYAI_WEBHOOK_URL")
+    ASSEMBLYAI_WEBHOOK_SECRET = os.environ.get("ASSEMBLYAI_WEBHOOK_SECRET")
+    ASSEMBLYAI_WEBHOOK_FALLBACK_SECONDS = int(
+        os.environ.get("ASSEMBLYAI_WEBHOOK_FALLBACK_SECONDS") or 900
+    )
+    # A transcript whose completion did not finish within this time (the
+    # process died) is completed again by the poller
+    TRANSCRIPTION_CLAIM_TIMEOUT_SECONDS = int(
+        os.environ.get("TRANSCRIPTION_CLAIM_TIMEOUT_SECONDS") or 600
+    )
+
+    # Meetings recorded in the browser (/live) are transcribed while they
+    # run. "assemblyai" streams the audio to the AssemblyAI real-time API,
+    # "mock" emits placeholder utterances for local testing.
+    LIVE_TRANSCRIPTION_BACKEND = (
+        os.environ.get("LIVE_TRANSCRIPTION_BACKEND") or "assemblyai"
+    )
+    LIVE_TRANSCRIPTION_URL = (
+        os.environ.get("LIVE_TRANSCRIPTION_URL")
+        or "wss://api.assemblyai.com/v2/realtime/ws"
+    )
+    # Sample rate of the 16 bit mono PCM streamed by the browser
+    LIVE_SAMPLE_RATE = int(os.environ.get("LIVE_SAMPLE_RATE") or 16000)
+    # Maximum wait for the last transcripts when a live meeting is stopped
+    LIVE_FINISH_TIMEOUT_SECONDS = float(
+        os.environ.get("LIVE_FINISH_TIMEOUT_SECONDS") or 30
+    )
+    LIVE_MOCK_UTTERANCE_SECONDS = float(
+        os.environ.get("LIVE_MOCK_UTTERANCE_SECONDS") or 5
+    )
+
+    # Cache of LLM responses, keyed by the complete request
+    LLM_CACHE_ENABLED = (
+        os.environ.get("LLM_CACHE_ENABLED") or "true"
+    ).lower() == "true"
+    LLM_CACHE_TTL_SECONDS = int(
+        os.environ.get("LLM_CACHE_TTL_SECONDS") or 30 * 24 * 3600
+    )
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES") or 5000)
+    LLM_CACHE_MAX_BYTES = int(
+        os.environ.get("LLM_CACHE_MAX_BYTES") or 200 * 1024 * 1024
+    )
+
+    # Reuse the transcript of a recording that was uploaded before with the
+    # same participant samples instead of transcribing it again
+    TRANSCRIPT_CACHE_ENABLED = (
+        os.environ.get("TRANSCRIPT_CACHE_ENABLED") or "true"
+    ).lower() == "true"
+
+    # Encoding of the audio uploaded for transcription, see
+    # TRANSCRIPTION_PROFILES in app/tools/audio.py: "aac" (44.1 kHz mono
+    # AAC, as uploaded before the profiles), "opus" (16 kHz mono Opus, a
+    # fraction of the size) or "flac" (16 kHz mono FLAC). Check the word
+    # error rate with benchmark_transcription_profiles.py --transcribe
+    # before switching.
+    TRANSCRIPTION_PROFILE = os.environ.get("TRANSCRIPTION_PROFILE") or "aac"
+
+    # Compress silences of at least SILENCE_TRIM_MIN_SECONDS to
+    # SILENCE_TRIM_KEEP_SECONDS before uploading a recording for
+    # transcription. Audio below SILENCE_TRIM_NOISE_DB counts as silence.
+    SILENCE_TRIM_ENABLED = (
+        os.environ.get("SILENCE_TRIM_ENABLED") or "false"
+    ).lower() == "true"
+    SILENCE_TRIM_MIN_SECONDS = float(
+        os.environ.get("SILENCE_TRIM_MIN_SECONDS") or 3.0
+    )
+    SILENCE_TRIM_KEEP_SECONDS = float(
+        os.environ.get("SILENCE_TRIM_KEEP_SECONDS") or 1.0
+    )
+    SILENCE_TRIM_NOISE_DB = float(
+        os.environ.get("SILENCE_TRIM_NOISE_DB") or -35.0
+    )
+
+    # How diarized speakers are matched to participants:
+    # "preamble": the participant samples are put in front of the recording
+    #   and Speaker A, B, ... are the participants in that order
+    # "embedding": voice embeddings of the samples are compared with those
+    #   of the speakers in the recording, see app/tools/speaker_embeddings.py
+    SPEAKER_IDENTIFICATION = (
+        os.environ.get("SPEAKER_IDENTIFICATION") or "preamble"
+    )
+    # Speakers whose best cosine similarity to a participant is lower stay
+    # unknown
+    SPEAKER_MATCH_MIN_SIMILARITY = float(
+        os.environ.get("SPEAKER_MATCH_MIN_SIMILARITY") or 0.5
+    )
+    # Audio per speaker used for the speaker's embedding
+    SPEAKER_EMBEDDING_MAX_SECONDS = float(
+        os.environ.get("SPEAKER_EMBEDDING_MAX_SECONDS") or 60
+    )
+
+    # Transcripts of more than HIERARCHICAL_SUMMARY_MIN_TOKENS (estimated)
+    # are summarized in segments of about SUMMARY_SEGMENT_TOKENS, which
+    # overlap by SUMMARY_SEGMENT_OVERLAP_SECONDS. At most
+    # SUMMARY_MAX_PARALLEL_SEGMENTS segments of a meeting are summarized at
+    # the same time, their notes are then combined into the protocol.
+    HIERARCHICAL_SUMMARY_MIN_TOKENS = int(
+        os.environ.get("HIERARCHICAL_SUMMARY_MIN_TOKENS") or 40000
+    )
+    SUMMARY_SEGMENT_TOKENS = int(
+        os.environ.get("SUMMARY_SEGMENT_TOKENS") or 12000
+    )
+    SUMMARY_SEGMENT_OVERLAP_SECONDS = float(
+        os.environ.get("SUMMARY_SEGMENT_OVERLAP_SECONDS") or 60
+    )
+    SUMMARY_MAX_PARALLEL_SEGMENTS = int(
+        os.environ.get("SUMMARY_MAX_PARALLEL_SEGMENTS") or 4
+    )
+
+    # "local" identifies the language of the transcript by its character
+    # n-grams (app/tools/language_detection.py) and asks the LLM only if the
+    # confidence is below LANGUAGE_DETECTION_MIN_CONFIDENCE, "llm" always
+    # asks the LLM
+    LANGUAGE_DETECTION = os.environ.get("LANGUAGE_DETECTION") or "local"
+    LANGUAGE_DETECTION_MIN_CONFIDENCE = float(
+        os.environ.get("LANGUAGE_DETECTION_MIN_CONFIDENCE") or 0.9
+    )
+
+    # Encoded participant sample preambles, one per participant set
+    PREAMBLE_CACHE_FOLDER = os.environ.get("PREAMBLE_CACHE_FOLDER") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "preamble_cache"
+    )
+    PREAMBLE_CACHE_MAX_FILES = int(
+        os.environ.get("PREAMBLE_CACHE_MAX_FILES") or 200
+    )
+
+    # Parent folder of the per-job scratch directories for intermediate
+    # audio and export files, e.g. /dev/shm to keep them on tmpfs. Uses the
+    # system temp folder if not set.
+    SCRATCH_FOLDER = os.environ.get("SCRATCH_FOLDER") or None
 
     DEFAULT_PROMPT = (
         "Es handelt sich bei dem Gespräch um ein Arbeits-Meeting. "
@@ -0,0 +1,189 @@
+"""
+run a local stand-in for the AssemblyAI transcript API via
+> python mock_assemblyai_server.py [--port 8100] [--delay 5]
+
+and point the app at it with ASSEMBLYAI_BASE_URL=http://localhost:8100.
+Uploads are accepted and discarded, every transcript is completed `delay`
+seconds after its submission with a few generic utterances of two
+speakers. If the transcript was submitted with a webhook URL, the webhook
+is called on completion like AssemblyAI does, so the poll, webhook and
+inline modes of TRANSCRIPTION_COMPLETION can be tried offline.
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import urllib.request
+import uuid
+
+
+SENTENCES = [
+    ("A", "Guten Morgen, lasst uns mit dem ersten Punkt anfangen."),
+    ("B", "Gerne, ich habe die Zahlen aus dem letzten Quartal dabei."),
+    ("A", "Sehr gut, dann fassen wir die Ergebnisse kurz zusammen."),
+    ("B", "Die Kosten sind gesunken und der Umsatz ist gestiegen."),
+    ("A", "Dann halten wir das fest und machen beim nächsten Punkt weiter."),
+]
+
+
+def make_utterances() -> tuple[list[dict], list[dict]]:
+    utterances, all_words = [], []
+    start = 0
+    for speaker, sentence in SENTENCES:
+        words = []
+        for text in sentence.split():
+            words.append({
+                "text": text,
+                "start": start,
+                "end": start + 400,
+                "confidence": 0.95,
+                "speaker": speaker,
+            })
+            start += 450
+        utterances.append({
+            "speaker": speaker,
+            "text": sentence,
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "confidence": 0.95,
+            "words": words,
+        })
+        all_words.extend(words)
+        start += 1000
+    return utterances, all_words
+
+
+class MockAssemblyAI:
+    def __init__(self, delay_seconds: float):
+        self.delay_seconds = delay_seconds
+        self.transcripts = {}
+        self.lock = threading.Lock()
+
+    def submit(self, request: dict) -> dict:
+        transcript = {
+            "id": str(uuid.uuid4()),
+            "status": "queued",
+            "audio_url": request.get("audio_url"),
+            "language_code": request.get("language_code"),
+            "speaker_labels": request.get("speaker_labels"),
+            "speech_model": request.get("speech_model"),
+            "webhook_url": request.get("webhook_url"),
+            "language_model": "assemblyai_default",
+            "acoustic_model": "assemblyai_default",
+        }
+        with self.lock:
+            self.transcripts[transcript["id"]] = transcript
+        threading.Timer(
+            self.delay_seconds,
+            self.complete,
+            args=[transcript["id"], request]
+        ).start()
+        return transcript
+
+    def get(self, transcript_id: str) -> dict | None:
+        with self.lock:
+            transcript = self.transcripts.get(transcript_id)
+            return dict(transcript) if transcript else None
+
+    def complete(self, transcript_id: str, request: dict) -> None:
+        utterances, words = make_utterances()
+        with self.lock:
+            transcript = self.transcripts[transcript_id]
+            transcript.update(
+                status="completed",
+                text=" ".join(u["text"] for u in utterances),
+                utterances=utterances,
+                words=words,
+                audio_duration=words[-1]["end"] // 1000,
+                confidence=0.95,
+            )
+        if request.get("webhook_url"):
+            self.call_webhook(transcript_id, request)
+
+    def call_webhook(self, transcript_id: str, request: dict) -> None:
+        headers = {"Content-Type": "application/json"}
+        if request.get("webhook_auth_header_name"):
+            headers[request["webhook_auth_header_name"]] = (
+                request.get("webhook_auth_header_value") or ""
+            )
+        webhook_request = urllib.request.Request(
+            request["webhook_url"],
+            data=json.dumps({
+                "transcript_id": transcript_id,
+                "status": "completed",
+            }).encode("utf-8"),
+            headers=headers,
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(webhook_request, timeout=10) as response:
+                print(f"webhook {transcript_id}: {response.status}")
+        except Exception as e:
+            print(f"webhook {transcript_id} failed: {e}")
+
+
+def make_handler(api: MockAssemblyAI, base_url: str):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_POST(self):
+            if self.path == "/v2/upload":
+                size = len(self._body())
+                self._send(200, {
+                    "upload_url": f"{base_url}/uploads/{uuid.uuid4()}?bytes={size}"
+                })
+            elif self.path == "/v2/transcript":
+                self._send(200, api.submit(json.loads(self._body() or b"{}")))
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_GET(self):
+            prefix = "/v2/transcript/"
+            if self.path.startswith(prefix):
+                transcript = api.get(self.path[len(prefix):])
+                if transcript is None:
+                    self._send(404, {"error": "Transcript not found"})
+                else:
+                    self._send(200, transcript)
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=5,
+        help="Seconds until a submitted transcript is completed"
+    )
+    args = parser.parse_args()
+
+    api = MockAssemblyAI(args.delay)
+    base_url = f"http://localhost:{args.port}"
+    server = ThreadingHTTPServer(
+        ("0.0.0.0", args.port),
+        make_handler(api, base_url)
+    )
+    print(f"Mock AssemblyAI listening on {base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
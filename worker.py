@@ -0,0 +1,13 @@
+"""
+run the meeting processing worker via
+> python worker.py
+
+Set JOB_BACKEND=queue for the web processes and the workers, so that the
+web processes only enqueue meetings and the workers process them.
+WORKER_CONCURRENCY sets the number of meetings one worker processes at once.
+"""
+
+from app.worker import Worker
+
+if __name__ == "__main__":
+    Worker().run()